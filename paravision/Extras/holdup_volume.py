@@ -8,6 +8,7 @@ from paravision.utils import create_threshold
 from paravision.project import projector
 from paravision.integrate import integrate
 from paravision.screenshot import screenshot
+from paravision.resample import resample_with_dataset
 
 from paravision import ConfigHandler
 import argparse
@@ -43,8 +44,7 @@ def holdup_volume(object, **args):
     if args.get('resample_flow'):
         # NOTE: Resampling is only required when the flowfield information is taken from the FLOW mesh instead of the MASS mesh mapping of the flowfield.
         print("Resampling the flowfield...")
-        flow = ResampleWithDataset(registrationName='resampled_flow', SourceDataArrays=flow, DestinationMesh=object)
-        flow.CellLocator = 'Static Cell Locator'
+        flow = resample_with_dataset(flow, object, args.get('operator_cache'))
 
     if _project[0] != 'none':
         raise NotImplementedError('Projection not implemented yet')
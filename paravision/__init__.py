@@ -5,9 +5,15 @@ __author__ = 'Jayghosh Rao'
 __credits__ = 'FZJ/IBG-1/ModSim'
 
 # Imports
+from importlib.util import find_spec
+
 from .configHandler import ConfigHandler
 
-from . import utils
 from . import log
-from . import project
 from . import defaults
+
+## NOTE: Modules that need ParaView are only imported when it is available, so
+## that the ParaView-free parts (e.g. paravision.vtkxml) work in plain python.
+if find_spec('paraview') is not None:
+    from . import utils
+    from . import project
@@ -8,6 +8,7 @@ from rich import print, print_json
 
 from paravision.utils import parse_cmdline_args, read_files, view_handler
 from paravision.project import projector
+from paravision.timesteps import TimeSteps
 
 from paravision.defaults import DEFAULT_CONFIG
 
@@ -26,7 +27,6 @@ def animate(reader, **kwargs):
     timekeeper = GetTimeKeeper()
     animationScene.UpdateAnimationUsingDataTimeSteps()
     timeArray = reader.TimestepValues
-    nts = len(timeArray) or 1
 
     ## TODO: Animate using constant scalarbar range
     ## TODO: Fix animation for one timestep
@@ -69,8 +69,7 @@ def animate(reader, **kwargs):
 
         ## Find the min/max range of data over all timesteps
         pd_ranges_t = []
-        for timestep in range(nts):
-            projection.UpdatePipeline(timeArray[timestep])
+        for timestep in TimeSteps(projection, timeArray, config.get('prefetch', 0)):
             pd = projection.PointData
             pd_ranges_t.append(pd.GetArray(scalar).GetRange())
 
@@ -1,5 +1,6 @@
-from paravision.utils import parse_cmdline_args, read_files, appendToBin
+from paravision.utils import parse_cmdline_args, read_files, arr_to_bin, required_point_arrays
 from paravision.integrate import integrate
+from paravision.checkpoint import checkpoint_store
 
 from paraview.simple import *
 
@@ -44,14 +45,27 @@ def bead_loading(reader, args):
     nbeads = int(connectivity.PointData.GetArray("RegionId").GetRange()[1])
     print("Number of Objects:", nbeads)
 
-    appendToBin([nts, nbeads, ncv],'bead_loading.inf', '=i')
+    checkpoint = checkpoint_store(args, 'bead_loading', nts, scalars=list(scalars), nbeads=nbeads)
+
+    ## NOTE: The outputs are written in truncate mode, each in one go, so that
+    ## a timestep that is redone on resume rewrites them instead of appending.
+    arr_to_bin([nts, nbeads, ncv],'bead_loading.inf', '=i')
     dataArr = np.zeros((nts, nbeads, ncv))
     # coordArr = np.zeros((nbeads,4))
 
 
     for timestep in range(nts):
+        if checkpoint and checkpoint.skip(timestep):
+            continue
+
+        if checkpoint and checkpoint.done(timestep):
+            print(f"Loading checkpointed timestep: {timestep}")
+            dataArr[timestep,:,:] = checkpoint.load(timestep)
+            continue
+
         timeKeeper.Time = timestep
         # print("Processing timestep: ", timestep, end="\r")
+        xyzr = []
 
         for index in range(nbeads):
 
@@ -74,7 +88,7 @@ def bead_loading(reader, args):
                 r = (xmax - xmin + ymax - ymin + zmax - zmin)/6
                 # print("xyzr:",x, y, z, r)
                 # coordArr[index,:] = np.array([x, y, z, r])
-                appendToBin([x,y,z,r],'bead_loading.xyzr', '=d')
+                xyzr.extend([x,y,z,r])
 
             integrated = IntegrateVariables(Input=threshold)
             intdata = servermanager.Fetch(integrated)
@@ -93,11 +107,17 @@ def bead_loading(reader, args):
             Delete(thresholdDisplay)
             Delete(threshold)
 
+        if timestep == 0:
+            arr_to_bin(xyzr, 'bead_loading.xyzr', '=d')
+
         # TODO: this only works with one scalar currently, which is okay for now
         # appendToBin(dataArr[timestep,:,:], 'ts_' + str(timestep) + '.dat', "=d")
-        appendToBin(dataArr[timestep,:,:], str( timestep ) + '.dat', "=d")
+        arr_to_bin(dataArr[timestep,:,:], str( timestep ) + '.dat', "=d")
+
+        if checkpoint:
+            checkpoint.save(timestep, dataArr[timestep,:,:])
 
 if __name__=="__main__":
     args = parse_cmdline_args()
-    reader = read_files(args['FILES'], filetype=args['filetype'])
+    reader = read_files(args['FILES'], filetype=args['filetype'], point_arrays=required_point_arrays(args['scalars']))
     bead_loading(reader, args)
@@ -10,13 +10,12 @@ import csv
 from addict import Dict
 from rich import print, print_json
 from rich.pretty import pprint
-from math import asin,sqrt,pi
-from mpmath import ellipk, ellipe, ellipf, nstr
-from multiprocessing import Pool
-from functools import partial
+from math import sqrt,pi
 
 from paraview.simple import *
-from paravision.utils import script_main_new, default_parser, create_threshold, get_bounds
+from paravision.utils import script_main_new, default_parser, get_bounds
+from paravision.packed_bed import PackedBed, RadialIndex, volShellRegion, histo, region_bounds, fit_spheres
+from vtkmodules.numpy_interface import dataset_adapter as dsa
 
 import numpy as np
 import json
@@ -43,291 +42,6 @@ class Bounds:
         self.zc = (z0 + z1) / 2
 
 
-class Bead:
-    """Class for individual beads"""
-
-    def __init__(self, x, y, z, r):
-        self.x = x
-        self.y = y
-        self.z = z
-        self.r = r
-
-    def pos(self):
-        return np.sqrt(self.x**2 + self.y**2)
-
-    def volume(self):
-        return 4/3 * np.pi * self.r**3
-
-    def distance(self, other):
-        return sqrt((self.x-other.x)**2 + (self.y-other.y)**2 + (self.z-other.z)**2)
-
-    def serialize(self):
-        return (self.x, self.y, self.z, self.r)
-
-class PackedBed:
-    """Class for packed bed of beads. Can apply transformations on beads"""
-
-    def __init__(self):
-        self.beads = []
-
-    def add(self, bead):
-        self.beads.append(bead)
-
-    def size(self):
-        return len(self.beads)
-
-    def radii(self):
-        return list(map(lambda b: b.r, self.beads))
-
-    def volume(self):
-        vol = 0
-        for bead in self.beads:
-            vol = vol + bead.volume()
-        return vol
-
-    def serialize(self):
-        return np.array(list(map(lambda b: b.serialize(), self.beads)))
-
-    def write(self, filename):
-        np.savetxt(filename, self.serialize(), delimiter=',')
-
-    def updateBounds(self):
-        """
-        Calculate bounding points for the packed bed.
-        """
-
-        xpr = []
-        xmr = []
-        ypr = []
-        ymr = []
-        zpr = []
-        zmr = []
-        z = []
-
-        for bead in self.beads:
-            xpr.append(bead.x + bead.r)
-            xmr.append(bead.x - bead.r)
-            ypr.append(bead.y + bead.r)
-            ymr.append(bead.y - bead.r)
-            zpr.append(bead.z + bead.r)
-            zmr.append(bead.z - bead.r)
-            z.append(bead.z)
-
-        radList = [ bead.r for bead in self.beads ]
-        self.rmax = max(radList)
-        self.rmin = min(radList)
-        self.ravg = sum(radList)/len(radList)
-
-        self.xmax = max(xpr)
-        self.ymax = max(ypr)
-        self.ymin = min(ymr)
-        self.xmin = min(xmr)
-        self.zmax = max(zpr)
-        self.zmin = min(zmr)
-
-        self.dx = self.xmax - self.xmin
-        self.dy = self.ymax - self.ymin
-        self.dz = self.zmax - self.zmin
-
-        self.R = max((self.xmax-self.xmin)/2, (self.ymax-self.ymin)/2) ## Similar to Genmesh
-        self.h = self.zmax - self.zmin
-        self.CylinderVolume = pi * self.R**2 * self.h
-
-    def moveBedtoCenter(self):
-        """
-        Translate bed center to origin of coordinate system.
-        """
-        self.updateBounds()
-        offsetx = -(self.xmax + self.xmin)/2
-        offsety = -(self.ymax + self.ymin)/2
-        for bead in self.beads:
-            bead.x = bead.x + offsetx
-            bead.y = bead.y + offsety
-        self.updateBounds()
-
-    def get_bounds(self): 
-        self.updateBounds()
-        return {
-                'xmin': self.xmin,
-                'xmax': self.xmax,
-                'ymin': self.ymin,
-                'ymax': self.ymax,
-                'zmin': self.zmin,
-                'zmax': self.zmax,
-                'rmin': self.rmin,
-                'rmax': self.rmax,
-                'xdelta': self.xmax - self.xmin,
-                'ydelta': self.ymax - self.ymin,
-                'zdelta': self.zmax - self.zmin,
-                'ravg': self.ravg,
-                'R': self.R,
-                'h': self.h,
-                'volume': self.volume(),
-                }
-
-def volShellRegion(beads, rShells, i):
-    """
-    Find the intersection volumes between rShells[i] & rShells[i+1]
-
-    @input: beads, shell_radii, index of shell
-    @output:
-        - total volume of all particles within the i'th shell
-        - list of all radii based on intersected volumes.
-
-    """
-    volShell=0
-    radsShell=[]
-    for bead in beads:
-        volBead = volBeadSlice(bead, rShells[i], rShells[i+1])
-        volShell = volShell + volBead
-        radBead = pow(volBead/(4.0/3.0*pi), 1.0/3.0)
-        if radBead != 0:
-            radsShell.append(radBead)
-    return volShell, radsShell
-
-# def radsShellRegion(beads, rShells, i):
-#     """
-#     In order to calculate histogram for beads in individual shells.
-#     > 1. Calculate Volumes of each bead in given shell,
-#     > 2. Extrapolate "radius" from each volume, even sliced ones.
-#     > 3. Return list of radii to be used by histo()
-#     """
-#     radsShell=[]
-#     for bead in beads:
-#         volBead = volBeadSlice(bead, rShells[i], rShells[i+1])
-#         radBead = pow(volBead/(4.0/3.0*pi), 1.0/3.0)
-#         radsShell.append(radBead)
-#     return radsShell
-
-def bridgeVolumes(beads, bridgeTol, relativeBridgeRadius, bridgeOffsetRatio):
-    """
-    Find the total volume of the bridges between beads
-    """
-    addedBridgeVol = 0
-    removedBridgeVol = 0
-    count = 0
-    beadsCopy = beads.copy()
-    for bead1 in beads:
-        beadsCopy.remove(bead1)
-        for bead2 in beadsCopy:
-            beadDistance = bead1.distance(bead2)
-            if beadDistance < bead1.r + bead2.r + bridgeTol:
-                count = count + 1
-                bridgeRadius = relativeBridgeRadius * min(bead1.r, bead2.r)
-                intVol1 = volBridgeSlice(bead1, bridgeRadius, bridgeOffsetRatio)
-                intVol2 = volBridgeSlice(bead2, bridgeRadius, bridgeOffsetRatio)
-                addedBridgeVol = addedBridgeVol + pi * bridgeRadius**2 * (beadDistance - bridgeOffsetRatio * bead1.r - bridgeOffsetRatio * bead2.r) - intVol1 - intVol2
-                removedBridgeVol = removedBridgeVol + intVol1 + intVol2
-                ## NOTE: Some beads will be intersecting due to single precision. That's not handled here.
-    print("Number of Bridges:", count)
-    return addedBridgeVol, removedBridgeVol
-
-def volBridgeSlice(bead, bridgeRadius, offsetRatio):
-    """
-    Volume of intersection between bridge and bead
-    """
-    rho = bridgeRadius/bead.r
-    # eta = bead.pos()/bead.r ##FIXME, eta == 0
-    eta = 0
-    vol = CylSphIntVolume(rho, eta) * bead.r**3
-    ## There's no need to find the accurate internal union volume since it will be deleted to find only the extra volume added by bridges in the first place.
-    vol = vol/2 - pi * bridgeRadius**2 * offsetRatio * bead.r
-    return vol
-
-def volBeadSlice(bead, rInnerShell, rOuterShell):
-    """
-    Find intersection volume of an individual bead between two shells (cylinders)
-    """
-    rhoOuter = rOuterShell/bead.r
-    etaOuter = bead.pos()/bead.r
-    volOuter = CylSphIntVolume(rhoOuter, etaOuter) * bead.r**3
-    rhoInner = rInnerShell/bead.r
-    etaInner = bead.pos()/bead.r
-    volInner = CylSphIntVolume(rhoInner, etaInner) * bead.r**3
-    volIntBead = volOuter - volInner
-    return volIntBead
-
-
-def histo(radii, **kwargs):
-    """Create histogram for a particular bead size distribution.
-        Also output volume fractions & mean radii to be used in CADET Polydisperse"""
-
-    bins = kwargs.get('bins', 1)
-
-    V=[4*np.pi*x*x*x/3 for x in radii]
-
-    ## Dump into bins by weight of each bead's volume
-    ## h (height of histogram bar) is then a representation of
-    ## the volume of beads present at a certain radius (partype).
-    ## if density==true weights are normalized
-    h,e = np.histogram(radii, bins=bins, density=True, weights=V)
-
-    ## Find the volume fraction at each point
-    frac=[x/sum(h) for x in h]
-    # print(sum(frac))
-
-    ## Find means of each bin from the edges (e)
-    w=2
-    avg=np.convolve(e, np.ones(w), 'valid') / w
-
-    return frac, list(avg)
-
-def CylSphIntVolume(rho, eta):
-    """ Analytical Formulae to calculate intersection between cylinder and sphere.
-        See http://dx.doi.org/10.1016/s1385-7258(61)50049-2 for more info.
-    """
-    if rho == 0.0:
-        return 0
-    elif (eta - rho) <= -1:
-        return 4/3 * pi
-    elif (eta - rho) >= 1:
-        return 0
-
-    ## NOTE: Ideally eta & rho are floats & never equal. But test cases are not handled yet. Similarly rho+eta == 1
-    if eta == rho:
-        print("Rho & Eta are Equal")
-
-    if eta == 0 and 0 <= rho <= 1:
-        V = 4/3 * pi - 4/3 * pi * (1 - rho**2)**(3/2)
-        return V
-    elif (rho + eta > 1):
-        nu = asin(eta - rho)
-        m = (1-(eta - rho)**2)/(4*rho*eta)
-
-        K = ellipk(m)
-        E = ellipe(m)
-
-        F = ellipf(nu ,1-m)
-        Ep = ellipe(nu, 1-m)
-
-        L0 = 2/pi * (E * F + K * Ep - K * F )
-
-        # V = (2/3 * pi * ( 1 - L0(nu, m) ) )\
-        V = (2/3 * pi * ( 1 - L0 ) )\
-        - (8/9 * sqrt(rho * eta) * (6 * rho**2 + 2 * rho * eta - 3) * (1 - m) * K)\
-        + (8/9 * sqrt(rho * eta) * (7 * rho**2 + eta**2 - 4) * E)
-
-        return V
-
-    elif (rho + eta < 1):
-        nu = asin((eta - rho)/(eta + rho))
-        m = 4*rho*eta / (1 - (eta-rho)**2)
-        K = ellipk(m)
-        E = ellipe(m)
-        F = ellipf(nu ,1-m)
-        Ep = ellipe(nu, 1-m)
-        L0 = 2/pi * (E * F + K * Ep - K * F )
-
-        V = (2/3 * pi * ( 1 - L0 ))\
-        - (4 * sqrt(1 - (eta-rho)**2) / (9*(eta+rho)) ) * (2*rho - 4*eta + (eta+rho)*(eta-rho)**2) * (1-m) * K\
-        + (4/9 * sqrt(1 - (eta-rho)**2) * (7*rho**2 + eta**2 - 4) * E)
-
-        return V
-
-    else:
-        print("ERROR")
-        return 0
-
 def plotter(x, y, title, filename):
     with plt.style.context(['science']):
         fig, ax = plt.subplots()
@@ -345,31 +59,29 @@ def driver(obj, **args):
 
     surfaces = ExtractSurface(obj)
     connectivity = Connectivity(surfaces)
-    conn_data = servermanager.Fetch(connectivity)
-    nParticles = int(conn_data.GetCellData().GetArray('RegionId').GetRange()[1] + 1)
+    conn_data = dsa.WrapDataObject(servermanager.Fetch(connectivity))
+    nParticles = int(np.max(conn_data.CellData['RegionId']) + 1)
 
     print(f"Found {nParticles} objects!")
 
-    xyzr = []
-    fullBed = PackedBed()
-
-    for i in range(nParticles):
-        threshold = create_threshold(connectivity, 'RegionId', 'between', i, i)
-        ## These bounds are going to be not-so-accurate since we're dealing with meshed geometries
-        b = Bounds(*get_bounds(threshold))
-        print(f"Processing object {(i+1)}/{nParticles}")
-
-        ## Assert that we have a cube => assert we have an underlying sphere
-        # Don't dump other container surfaces
-        atol = 0.0
-        rtol = 1e-1
-        if (np.isclose(b.dy, b.dx, atol=atol, rtol=rtol) and np.isclose(b.dz, b.dx, atol=atol, rtol=rtol)):
-            d = np.max([b.dx, b.dy, b.dz])
-            fullBed.add(Bead(b.xc, b.yc, b.zc, d/2))
-            # xyzr.append((b.xc, b.yc, b.zc, b.dx/2 ))
-        else:
-            print(f"FOUND NON-SPHERICAL OBJECT WITH BOUNDS: {vars(b)}")
-        Delete(threshold)
+    ## NOTE: The Connectivity output is fetched once and reduced per RegionId,
+    ## instead of running a Threshold for every object.
+    ## Bounding boxes are not-so-accurate for meshed geometries, so beads are
+    ## fitted to the surface points instead.
+    points = conn_data.Points
+    regionIds = conn_data.PointData['RegionId']
+    bounds, centroids = region_bounds(points, regionIds, nParticles)
+    spheres, residuals = fit_spheres(points, regionIds, nParticles)
+
+    ## Assert that the points lie on a sphere
+    # Don't dump other container surfaces
+    with np.errstate(invalid='ignore'):
+        spherical = residuals < args.sphere_tol
+
+    fullBed = PackedBed(spheres[spherical])
+
+    for i in np.flatnonzero(~spherical):
+        print(f"FOUND NON-SPHERICAL OBJECT WITH BOUNDS: {vars(Bounds(*bounds[i]))}, CENTROID: {centroids[i]}, RESIDUAL: {residuals[i]}")
 
     print(f"Processed {fullBed.size()}/{nParticles} spherical particles.")
 
@@ -434,17 +146,12 @@ def driver(obj, **args):
 
     total_beads_volume_per_shell = [0] * nRegions
 
-    ## Multiprocessing code.
-    ##      Create a partial function of volShellRegion(beads, rShells, i) --> parfunc(i)
-    ##      map each 'i' to each process
-    pool = Pool()
-    parfunc = partial(volShellRegion, fullBed.beads, rShells)
-    # volRegions = pool.map(parfunc, range(nRegions))
-    total_beads_volume_per_shell, radii_beads_per_shell = zip(*pool.map(parfunc, range(nRegions)))
-    pool.close()
-    pool.join()
+    ## NOTE: volShellRegion is vectorized over the beads, so the shells no
+    ## longer need a process pool.
+    index = RadialIndex(fullBed.serialize())
+    total_beads_volume_per_shell, radii_beads_per_shell = zip(*[ volShellRegion(fullBed, rShells, i, index) for i in range(nRegions) ])
 
-    # print(volShellRegion(fullBed.beads, rShells, 0))
+    # print(volShellRegion(fullBed, rShells, 0))
 
     total_beads_volume_per_shell = np.array(total_beads_volume_per_shell).astype(np.float64)
     radii_beads_per_shell = [ np.array(item).astype(np.float64) for item in radii_beads_per_shell ]
@@ -495,6 +202,7 @@ def parser(argslist):
     ap.add_argument("--npartype", type=int, default=1, help="NPARTYPE, number of bins to sort particles by size")
     ap.add_argument("-st"  , "--shelltype", choices = ['EQUIDISTANT', 'EQUIVOLUME'], default='EQUIDISTANT', help="Shell discretization type")
     ap.add_argument("-R"  , "--column-radius", type=float, help="Column radius")
+    ap.add_argument("--sphere-tol", type=float, default=1e-2, help="Largest RMS distance of an object's surface points to its fitted sphere, relative to the radius, to count as a bead")
     args = Dict(vars(ap.parse_args(argslist)))
     print_json(data=args)
     return args
@@ -0,0 +1,112 @@
+"""
+Resumable per-timestep checkpoints for time-loop plugins.
+
+Every completed timestep is written to its own .npy file in a checkpoint
+directory as soon as it's done. Writes go to a temporary file that is then
+renamed, so a job killed mid-write (e.g. at the wall-clock limit) never leaves
+a truncated result behind. On restart, plugins skip the timesteps that are
+already in the store and load their results instead of recomputing them.
+
+The settings that affect the results (scalars, zones etc) are stored next to
+the checkpoints and checked on resume, so a store can't silently be reused
+with a different configuration.
+
+The store is also how timestep-parallel runs are put together: each worker
+is given a partition (rank, nparts), computes only its own timesteps into the
+shared store and writes no output. A final, unpartitioned run then finds all
+timesteps in the store and writes the merged results in time order.
+"""
+
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+
+class CheckpointStore:
+    """ Per-timestep results of one plugin run, stored as <directory>/<name>_<timestep>.npy """
+
+    def __init__(self, directory, name, nts, meta=None, partition=None):
+        self.directory = Path(directory)
+        self.name = name
+        self.nts = nts
+        self.rank, self.nparts = partition or (0, 1)
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._check_meta(dict(meta or {}, nts=nts))
+
+    def _check_meta(self, meta):
+        meta = json.loads(json.dumps(meta, default=str))
+        metafile = self.directory / f"{self.name}.json"
+
+        if metafile.exists():
+            stored = json.loads(metafile.read_text())
+            if stored != meta:
+                raise ValueError(f"Checkpoint {metafile} was written with different settings: {stored}. Use another --checkpoint-dir or remove it to restart.")
+        else:
+            self._atomic_write(metafile, lambda f: f.write(json.dumps(meta, indent=2).encode()))
+
+    def _atomic_write(self, path, writer):
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        with open(tmp, 'wb') as f:
+            writer(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+    @property
+    def worker(self):
+        """ True if this process computes only a partition of the timesteps """
+        return self.nparts > 1
+
+    def skip(self, timestep):
+        """ True if the timestep belongs to another worker's partition """
+        return timestep % self.nparts != self.rank
+
+    def path(self, timestep):
+        return self.directory / f"{self.name}_{timestep:06d}.npy"
+
+    def done(self, timestep):
+        return self.path(timestep).exists()
+
+    def save(self, timestep, values):
+        self._atomic_write(self.path(timestep), lambda f: np.save(f, np.asarray(values)))
+
+    def load(self, timestep):
+        return np.load(self.path(timestep))
+
+    def missing(self):
+        return [ timestep for timestep in range(self.nts) if not self.done(timestep) ]
+
+    def first_missing(self):
+        """ First timestep without results, or nts if the run is complete """
+        return next(iter(self.missing()), self.nts)
+
+    def load_all(self):
+        """ Results of all timesteps as one array of shape (nts, ...). The store must be complete. """
+        missing = self.missing()
+        if missing:
+            raise RuntimeError(f"Checkpoint {self.name} is missing timesteps: {missing}")
+        return np.array([ self.load(timestep) for timestep in range(self.nts) ])
+
+def checkpoint_store(args, name, nts, **meta):
+    """ CheckpointStore for the plugin if --checkpoint-dir is given, else None
+
+    The output prefix is part of the name, so several runs may share a directory.
+    """
+    directory = args.get('checkpoint_dir')
+    partition = args.get('time_partition')
+    if not directory:
+        if partition:
+            raise ValueError("--time-partition requires --checkpoint-dir to collect the results of all workers.")
+        return None
+
+    if args.get('output_prefix'):
+        name = f"{name}_{args.get('output_prefix')}"
+
+    store = CheckpointStore(directory, name, nts, meta, partition)
+    if store.worker:
+        print(f"Checkpointing to {store.directory}. Worker {store.rank}/{store.nparts}, computing every {store.nparts}th timestep.")
+    else:
+        print(f"Checkpointing to {store.directory}. Resuming at timestep {store.first_missing()}/{nts}.")
+    return store
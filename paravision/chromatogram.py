@@ -1,11 +1,21 @@
-from paravision.utils import csvWriter, read_files
-from paravision.integrate import integrate
+from paravision.utils import csvWriter, read_files, required_point_arrays
+from paravision.utils import fetch_mesh, fetch_point_arrays
+from paravision.operators import cached_operator, volume_operator
+from paravision.shells import shell_radii, shell_operator, detector_operator
 from paravision.project import projector
+from paravision.checkpoint import CheckpointStore, checkpoint_store
+from paravision.timesteps import TimeSteps
+from paravision.resample import resample_with_dataset
+from paravision.vtkxml import GeometryCache, read_vtk_xml
+from paravision.moments import MomentAccumulator
 
-from paraview.simple import *
 from paravision import ConfigHandler
 
 import argparse
+import csv
+import time
+import numpy as np
+from pathlib import Path
 from addict import Dict
 from rich import print, print_json
 
@@ -15,7 +25,7 @@ def chromatogram(reader, args):
     """
         Calculate chromatogram from given 2D concentration field and flowfield
         Resampling is necessary when using flowfield that wasn't generated from the exact same mesh.
-        Resampling is extremely slow.
+        The resampling map is computed once per pair of meshes. Use --operator-cache to keep it between runs.
     """
 
     # for key in args:
@@ -27,27 +37,32 @@ def chromatogram(reader, args):
     if not args.flow:
         raise RuntimeError("Please provide --flow <flowfield_file> args.")
     else:
-        flow = read_files([args['flow']], filetype=args['filetype'])
+        ## NOTE: Only the axial velocity is used from the flowfield
+        flow = read_files([args['flow']], filetype=args['filetype'], point_arrays=['scalar_2'])
 
     if args.resample_flow: 
         # NOTE: Resampling is only required when the flowfield information is taken from the FLOW mesh instead of the MASS mesh mapping of the flowfield.
         print("Resampling the flowfield...")
-        flow = ResampleWithDataset(registrationName='resampled_flow', SourceDataArrays=flow, DestinationMesh=reader)
-        flow.CellLocator = 'Static Cell Locator'
-
-    integrated_flowrate = integrate(flow, ['scalar_2'], normalize=None, timeArray=[])
-    print("Flowrate:", integrated_flowrate)
+        flow = resample_with_dataset(flow, reader, args.get('operator_cache'))
 
     if args['type'] == 'full':
         # NOTE: Assumes input is 2D output of extractRNG applied on the outlet
-        # conc * velocity_z
-        cu = PythonCalculator(Input=[reader, flow])
-        cu.Expression = "inputs[0].PointData['scalar_0'] * inputs[1].PointData['scalar_2']"
+        weights = outlet_weights(fetch_mesh(reader), fetch_point_arrays(flow, ['scalar_2'])[:, 0], args.get('operator_cache'))
+        print("Flowrate:", weights.sum())
+
+        checkpoint = checkpoint_store(args, 'chromatogram_full', len(timeArray) or 1, flow=args.flow, resample_flow=args.resample_flow, scalars=list(args.scalars))
+        moments = MomentAccumulator(len(args.scalars))
+        chromatogram = outlet_chromatogram(reader, weights, args.scalars, timeArray, checkpoint, args.get('prefetch', 0), moments)
+
+        if checkpoint and checkpoint.worker:
+            ## NOTE: Outputs are written by the merge run once all workers are done
+            return
 
-        chromatogram = integrate(cu, ['result'], normalize=None, timeArray=reader.TimestepValues)
-        chromatogram = [ x[0]/integrated_flowrate[0][0] for x in chromatogram ]
+        ## One column per scalar: time, c_0, c_1...
+        with open('chromatogram.csv', 'w') as f:
+            csv.writer(f).writerows( [time, *values] for time, values in zip(timeArray, chromatogram.tolist()) )
 
-        csvWriter('chromatogram.csv', reader.TimestepValues, chromatogram)
+        moments.write('chromatogram_moments.csv', args.scalars, args.column_length or None)
 
     elif args.type == 'shells': 
 
@@ -62,128 +77,355 @@ def chromatogram(reader, args):
 
         get_shell_chromatograms(mass_slice, flow_slice, args, timeArray=timeArray)
 
-        
+    elif args.type == 'detectors':
+
+        get_detector_chromatograms(reader, flow, args, timeArray=timeArray)
+
+def outlet_weights(mesh, velocity, cache_dir=None):
+    """ Flux weights w_i * u_i of the outlet points
+
+    w_i are the area quadrature weights of the outlet mesh and u_i the axial
+    velocity (scalar_2) of the flowfield, which must be on the same points.
+    Summing c_i times the weights is IntegrateVariables of c*u over the outlet.
+    """
+    operator = cached_operator(mesh, 'volume', volume_operator, cache_dir)
+
+    if len(velocity) != operator.npoints:
+        raise ValueError(f"Flowfield has {len(velocity)} points, the outlet mesh {operator.npoints}. Use --resample-flow.")
+
+    return operator.dense()[0] * velocity
+
+def outlet_chromatogram(mass, weights, scalars, timeArray, checkpoint=None, prefetch=0, moments=None):
+    """ Flux averaged outlet concentration of every scalar, as an (nts, nscalars) array
+
+    Every timestep is weighted as soon as it's read and saved to the
+    checkpoint store, if given. moments (MomentAccumulator) is updated in
+    time order along the way. Workers of a time partition return None.
+    """
+    timesteps = TimeSteps(mass, timeArray, prefetch, checkpoint, point_arrays=list(scalars))
+    nts = len(timesteps)
+    flowrate = weights.sum()
+
+    chromatogram = []
+    for timestep in range(nts):
+        if checkpoint and checkpoint.skip(timestep):
+            continue
+
+        if checkpoint and checkpoint.done(timestep):
+            print(f"Loading checkpointed timestep: {timestep}")
+            chromatogram.append(checkpoint.load(timestep))
+        else:
+            timesteps.update(timestep)
+            print(f"Reading timestep: {timestep}")
+            chromatogram.append(weights @ timesteps.point_data() / flowrate)
+
+            if checkpoint:
+                checkpoint.save(timestep, chromatogram[-1])
+
+        if moments is not None:
+            moments.add(time_value(timeArray, timestep), chromatogram[-1])
+
+    timesteps.close()
+
+    if checkpoint and checkpoint.worker:
+        return None
+
+    return np.array(chromatogram).reshape(nts, len(scalars))
+
+def watch_chromatogram(args):
+    """ Follow a running simulation, extending chromatogram.csv as outlet files appear
+
+    Files matching --watch-pattern in the --watch directory are processed once
+    each, in timestep order, with the numpy VTK reader. The flux weights are
+    kept in memory, so old timesteps are never read again. Stop with Ctrl+C
+    or --watch-timeout.
+
+    Every processed file is saved to a checkpoint store (--checkpoint-dir,
+    default checkpoints_watch) before its row is appended to chromatogram.csv.
+    A restarted watch rewrites the CSV from the store and continues with the
+    first file that isn't in it.
+    """
+    directory = Path(args.watch)
+    geometry = GeometryCache()
+    sizes = {}
+    weights = None
+    moments = None
+    scalars = args.scalars or None
+
+    name = f"chromatogram_watch_{args.output_prefix}" if args.get('output_prefix') else 'chromatogram_watch'
+    checkpoint = CheckpointStore(args.get('checkpoint_dir') or 'checkpoints_watch', name, 0,
+                                 dict(flow=args.flow, resample_flow=args.resample_flow, scalars=scalars, watch=str(directory.resolve()), pattern=args.watch_pattern))
+
+    ## NOTE: Rows are [time, c_0, c_1...], one per processed file, in timestep order
+    rows = []
+    while checkpoint.done(len(rows)):
+        rows.append(checkpoint.load(len(rows)))
+    processed = set(timestep_order(directory.glob(args.watch_pattern))[:len(rows)])
+
+    with open('chromatogram.csv', 'w') as f:
+        csv.writer(f).writerows( row.tolist() for row in rows )
+    if rows:
+        moments = MomentAccumulator(len(rows[0]) - 1)
+        for row in rows:
+            moments.add(row[0], row[1:])
+        print(f"Resumed {len(rows)} timesteps from {checkpoint.directory}")
+
+    print(f"Watching for {directory / args.watch_pattern}. Stop with Ctrl+C.")
+
+    last_new = time.time()
+    try:
+        while True:
+            for filename in ready_files(directory, args.watch_pattern, processed, sizes):
+                try:
+                    mesh = read_vtk_xml(filename, scalars, geometry=geometry)
+                except Exception as error:
+                    ## NOTE: Most likely still being written. Retried at the next poll,
+                    ## and so are the later files, to keep the times in order.
+                    print(f"[yellow]Could not read {filename} yet: {error}[/yellow]")
+                    break
+
+                if weights is None:
+                    scalars = scalars or list(mesh.point_data.keys())
+                    weights = outlet_weights(mesh, watch_velocity(args, filename), args.get('operator_cache'))
+                    moments = moments or MomentAccumulator(len(scalars))
+                    print("Flowrate:", weights.sum())
+
+                values = weights @ np.column_stack([ mesh.point_data[name] for name in scalars ]) / weights.sum()
+                timeValue = mesh.field_data.TimeValue[0] if 'TimeValue' in mesh.field_data else len(processed)
+
+                checkpoint.save(len(processed), [timeValue, *values.tolist()])
+                with open('chromatogram.csv', 'a') as f:
+                    csv.writer(f).writerow([timeValue, *values.tolist()])
+
+                moments.add(timeValue, values)
+                moments.write('chromatogram_moments.csv', scalars, args.column_length or None)
+
+                processed.add(filename)
+                last_new = time.time()
+                print(f"{filename.name}: t = {timeValue}, {dict(zip(scalars, values.tolist()))}")
+
+            if args.watch_timeout and time.time() - last_new > args.watch_timeout:
+                print(f"No new files for {args.watch_timeout}s. Stopped watching.")
+                break
+
+            time.sleep(args.poll_interval)
+    except KeyboardInterrupt:
+        print("Stopped watching.")
+
+    print(f"Processed {len(processed)} files into chromatogram.csv")
+
+def timestep_order(files):
+    """ Files sorted by the timestep number at the end of their names, or by name """
+    try:
+        return sorted(files, key=lambda x: int(x.stem.split('_')[-1]))
+    except ValueError:
+        return sorted(files)
+
+def ready_files(directory, pattern, processed, sizes):
+    """ New files matching pattern, in timestep order, whose size didn't change since the last poll """
+    ready = []
+    for filename in directory.glob(pattern):
+        if filename in processed:
+            continue
+        size = filename.stat().st_size
+        if size and sizes.get(filename) == size:
+            ready.append(filename)
+        sizes[filename] = size
+
+    return timestep_order(ready)
+
+def watch_velocity(args, filename):
+    """ Axial velocity of the flowfield on the points of the outlet file """
+    if args.resample_flow:
+        flow = read_files([args.flow], filetype=Path(args.flow).suffix[1:], point_arrays=['scalar_2'])
+        mass = read_files([str(filename)], filetype=filename.suffix[1:])
+        return fetch_point_arrays(resample_with_dataset(flow, mass, args.get('operator_cache')), ['scalar_2'])[:, 0]
+
+    return read_vtk_xml(args.flow, ['scalar_2']).point_data['scalar_2']
+
 def get_shell_chromatograms(mass, flow, args, timeArray): 
         nRegions = args.nrad
         shellType = args.shelltype
 
-        timeKeeper = GetTimeKeeper()
         # timeArray = mass.TimestepValues
         nts = len(timeArray) or 1
 
-        # conc * velocity_z
-        cu = PythonCalculator(Input=[mass, flow])
-        cu.Expression = "inputs[0].PointData['scalar_0'] * inputs[1].PointData['scalar_2']"
-        
-        view = GetActiveViewOrCreate('RenderView')
-        ## Calc bounding box. Requires show
-        display = Show(cu, view)
-        # SetActiveSource(cu)
-        (xmin,xmax,ymin,ymax,zmin,zmax) = GetActiveSource().GetDataInformation().GetBounds()
-        Hide(cu, view)
-
-        nShells = nRegions + 1 #Including r = 0
-        rShells = []
+        ## NOTE: The outlet points are assigned to shells (with exact area
+        ## fractions of the cells cut by shell boundaries) once. Flowrates and
+        ## the c*u fluxes of all shells are then one sparse product each.
+        ## The surface (outlet or slice) and its scalar_0 are gathered on the
+        ## client, also in parallel runs. That's acceptable here, unlike for
+        ## the 3D fields of radial_shell_integrate and grm2d: a 2D surface has
+        ## a small fraction of the points of the mesh, and the Fetch of
+        ## IntegrateVariables results per shell it replaces synchronized all
+        ## ranks nrad times per timestep.
+        mesh = fetch_mesh(mass)
+        (xmin, ymin, _), (xmax, ymax, _) = mesh.points.min(axis=0), mesh.points.max(axis=0)
 
         R = (xmax - xmin + ymax - ymin)/4
         print("R:", R)
 
-        if shellType == 'EQUIVOLUME':
-            for n in range(nShells):
-                rShells.append(R * sqrt(n/nRegions))
-        elif shellType == 'EQUIDISTANT':
-            for n in range(nShells):
-                rShells.append(R * (n/nRegions))
-
+        rShells = shell_radii(R, nRegions, shellType)
         print("rShells:", rShells)
 
-        radAvg = []
-        integrated_over_time = [ [] for region in range(nRegions) ]
-
-        flowrates = []
-
-        print("Calculating Flowrates")
-        # NOTE: Flowrate: u * dA
-        for radIn, radOut in zip(rShells[:-1], rShells[1:]):
-
-            rIndex = rShells.index(radIn)
-
-            radAvg.append( (radIn + radOut) / 2 )
+        operator = cached_operator(mesh, f"shells_{rShells}",
+                                   lambda m: shell_operator(m.points, m.connectivity, m.offsets, m.types, rShells),
+                                   args.get('operator_cache'))
 
-            clipOuter = Clip(Input=flow)
-            clipOuter.ClipType = 'Cylinder'
-            clipOuter.ClipType.Axis = [0.0, 0.0, 1.0]
-            clipOuter.ClipType.Radius = radOut
-            Hide3DWidgets(proxy=clipOuter.ClipType)
+        velocity = fetch_point_arrays(flow, ['scalar_2'])[:, 0]
+        if len(velocity) != operator.npoints:
+            raise ValueError(f"Flowfield has {len(velocity)} points, the outlet mesh {operator.npoints}. Use --resample-flow.")
 
-            clipInner = Clip(Input=clipOuter)
-            clipInner.ClipType = 'Cylinder'
-            clipInner.ClipType.Axis = [0.0, 0.0, 1.0]
-            clipInner.ClipType.Radius = radIn
-            clipInner.Invert = 0
+        radAvg = [ (radIn + radOut) / 2 for radIn, radOut in zip(rShells[:-1], rShells[1:]) ]
 
-            ## Since we handle time outside the integrate function, the
-            ## only entry in the outer list is the list of integrated scalars
-            ## at the given time
-            integratedData = integrate(clipInner, ['scalar_2'], normalize=None, timeArray=[])
-            flowrates.append(integratedData[0][0])
-
-            Delete(clipInner)
-            Delete(clipOuter)
+        # NOTE: Flowrate: u * dA
+        flowrates = operator.apply(velocity)
 
         print(f"{flowrates = }")
         print('flowrates sum:', sum(flowrates))
 
+        checkpoint = checkpoint_store(args, f'chromatogram_{args.type}', nts, flow=args.flow, resample_flow=args.resample_flow, rShells=rShells, project=args.project)
+
+        timesteps = TimeSteps(mass, timeArray, args.get('prefetch', 0), checkpoint, point_arrays=['scalar_0'])
+        moments = MomentAccumulator(nRegions)
+
+        integrated_over_time = []
         for timestep in range(nts):
 
-            timeKeeper.Time = timestep
-            cu.UpdatePipeline(timeArray[timestep])
+            if checkpoint and checkpoint.skip(timestep):
+                continue
 
-            print("its:", timestep)
+            if checkpoint and checkpoint.done(timestep):
+                print("Loading checkpointed timestep:", timestep)
+                integrated_over_time.append(checkpoint.load(timestep))
+                moments.add(time_value(timeArray, timestep), integrated_over_time[-1])
+                continue
 
-            for radIn, radOut in zip(rShells[:-1], rShells[1:]):
-                rIndex = rShells.index(radIn)
+            timesteps.update(timestep)
 
-                radAvg.append( (radIn + radOut) / 2 )
+            print("its:", timestep)
 
-                clipOuter = Clip(Input=cu)
-                clipOuter.ClipType = 'Cylinder'
-                clipOuter.ClipType.Axis = [0.0, 0.0, 1.0]
-                clipOuter.ClipType.Radius = radOut
-                Hide3DWidgets(proxy=clipOuter.ClipType)
+            # conc * velocity_z
+            concentration = timesteps.point_data()[:, 0]
+            integrated_over_time.append(operator.apply(concentration * velocity) / flowrates)
+            moments.add(time_value(timeArray, timestep), integrated_over_time[-1])
 
-                clipInner = Clip(Input=clipOuter)
-                clipInner.ClipType = 'Cylinder'
-                clipInner.ClipType.Axis = [0.0, 0.0, 1.0]
-                clipInner.ClipType.Radius = radIn
-                clipInner.Invert = 0
+            if checkpoint:
+                checkpoint.save(timestep, integrated_over_time[-1])
 
-                ## Since we handle time outside the integrate function, the
-                ## only entry in the outer list is the list of integrated scalars
-                ## at the given time
-                integratedData = integrate(clipInner, ['result'], normalize=None)
-                integrated_over_time[rIndex].extend( [ x[0]/flowrates[rIndex] for x in integratedData ] )
+        timesteps.close()
 
-                Delete(clipInner)
-                Delete(clipOuter)
+        if checkpoint and checkpoint.worker:
+            return
 
+        integrated_over_time = np.array(integrated_over_time)
         print(integrated_over_time)
 
         for region in range(nRegions):
-            csvWriter("chromatogram_{op}_shell_{i}.csv".format(op=args.output_prefix, i=region), timeArray, integrated_over_time[region])
+            csvWriter("chromatogram_{op}_shell_{i}.csv".format(op=args.output_prefix, i=region), timeArray, integrated_over_time[:, region])
 
         csvWriter(f'flowrates_{nRegions}_{args.output_prefix}.csv', radAvg, flowrates)
+        moments.write(f'chromatogram_{args.output_prefix}_shell_moments.csv', length=args.column_length or None)
+
+def get_detector_chromatograms(mass, flow, args, timeArray):
+    """ Chromatograms of virtual detectors at the --detectors z positions
+
+    Every detector gives the chromatogram of the full cross-section and of
+    each shell, same as --type shells_at_slice for its position. The slice
+    and shell weights of all detectors, times the velocity, are one operator
+    built once, so each timestep is read once for all detectors.
+    """
+    if not args.detectors:
+        raise RuntimeError("Please provide --detectors <z positions> args.")
+
+    nts = len(timeArray) or 1
+    zPositions = args.detectors
+
+    mesh = fetch_mesh(mass)
+    (xmin, ymin, zmin), (xmax, ymax, _) = mesh.points.min(axis=0), mesh.points.max(axis=0)
+
+    R = (xmax - xmin + ymax - ymin)/4
+    rShells = shell_radii(R, args.nrad, args.shelltype)
+    print("rShells:", rShells)
+
+    velocity = fetch_point_arrays(flow, ['scalar_2'])[:, 0]
+    if len(velocity) != len(mesh.points):
+        raise ValueError(f"Flowfield has {len(velocity)} points, the mass mesh {len(mesh.points)}. Use --resample-flow.")
+
+    operator = detector_operator(mesh.points, mesh.connectivity, mesh.offsets, mesh.types, zPositions, rShells, velocity=velocity)
+
+    ## Zones: detector * (nrad + 1) + (0: full cross-section, 1 + shell)
+    flowrates = operator.measures()
+    print(f"{flowrates = }")
+
+    checkpoint = checkpoint_store(args, 'chromatogram_detectors', nts, flow=args.flow, resample_flow=args.resample_flow, rShells=rShells, detectors=list(zPositions))
+
+    timesteps = TimeSteps(mass, timeArray, args.get('prefetch', 0), checkpoint, point_arrays=['scalar_0'])
+    moments = MomentAccumulator(len(flowrates))
+
+    integrated_over_time = []
+    for timestep in range(nts):
+
+        if checkpoint and checkpoint.skip(timestep):
+            continue
+
+        if checkpoint and checkpoint.done(timestep):
+            print("Loading checkpointed timestep:", timestep)
+            integrated_over_time.append(checkpoint.load(timestep))
+            moments.add(time_value(timeArray, timestep), integrated_over_time[-1])
+            continue
+
+        timesteps.update(timestep)
+
+        print("its:", timestep)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            integrated_over_time.append(operator.apply(timesteps.point_data()[:, 0]) / flowrates)
+        moments.add(time_value(timeArray, timestep), integrated_over_time[-1])
+
+        if checkpoint:
+            checkpoint.save(timestep, integrated_over_time[-1])
+
+    timesteps.close()
+
+    if checkpoint and checkpoint.worker:
+        return
+
+    integrated_over_time = np.array(integrated_over_time).reshape(nts, len(zPositions), len(rShells))
+    flowrates = flowrates.reshape(len(zPositions), len(rShells))
+
+    ## One file per detector. Columns: time, full cross-section, shells
+    for detector in range(len(zPositions)):
+        with open(f'chromatogram_{args.output_prefix}_detector_{detector}.csv', 'w') as f:
+            csv.writer(f).writerows( [time, *values] for time, values in zip(timeArray, integrated_over_time[:, detector].tolist()) )
+
+    with open(f'detector_flowrates_{args.output_prefix}.csv', 'w') as f:
+        csv.writer(f).writerows( [z, *values] for z, values in zip(zPositions, flowrates.tolist()) )
+
+    ## NOTE: The HETP of a detector is for the length from the inlet (lowest z of the mesh) to it
+    labels = [ f"{z}_{zone}" for z in zPositions for zone in ['full', *[ f"shell_{i}" for i in range(len(rShells) - 1) ]] ]
+    moments.write(f'detector_moments_{args.output_prefix}.csv', labels, np.repeat(np.array(zPositions) - zmin, len(rShells)))
+
+def time_value(timeArray, timestep):
+    return timeArray[timestep] if len(timeArray) else timestep
 
 def chromatogram_parser(args, local_args_list):
 
     ap = argparse.ArgumentParser()
 
-    ap.add_argument("--type", choices=['full', 'shells', 'shells_at_slice'], help="Chromatogram for full area or shells")
+    ap.add_argument("--type", choices=['full', 'shells', 'shells_at_slice', 'detectors'], help="Chromatogram for full area or shells, or at --detectors positions in a 3D field")
+    ap.add_argument("--detectors", nargs='+', type=float, metavar='Z', help="Axial positions of virtual detectors for --type detectors")
+    ap.add_argument("--column-length", type=float, help="Column length for the HETP in the moments output. Detectors use their distance from the inlet.")
     ap.add_argument("--flow", help="Flowfield pvtu/vtu file for use in chromatograms. May need --resample-flow.")
     ap.add_argument("--resample-flow", action=argparse.BooleanOptionalAction, default=None, help="Flag to resample flowfield data using concentration mesh")
     ap.add_argument("-nr", "--nrad", type=int, help="Radial discretization size for shell chromatograms. Also see --shelltype")
     ap.add_argument("-st", "--shelltype", choices = ['EQUIDISTANT', 'EQUIVOLUME'], help="Radial shell discretization type. See --nrad")
 
+    ap.add_argument("--watch", nargs='?', const='.', metavar='DIR', help="Watch DIR (default: current) for new outlet files of a running simulation and append them to chromatogram.csv")
+    ap.add_argument("--watch-pattern", default='rngout_*.pvtu', help="Outlet files to watch for. See --watch")
+    ap.add_argument("--poll-interval", type=float, default=5.0, help="Seconds between checks for new files. See --watch")
+    ap.add_argument("--watch-timeout", type=float, help="Stop watching after this many seconds without new files. See --watch")
+
     ap.add_argument("FILES", nargs='*', help="files..")
 
     print(local_args_list)
@@ -195,6 +437,9 @@ def chromatogram_parser(args, local_args_list):
 
     args.update([ (k,v) for k,v in local_args.items() if v is not None])
 
+    if args.watch and args.type not in [None, 'full']:
+        ap.error(f"--watch only supports --type full, not --type {args.type}")
+
     return args
 
 if __name__=="__main__":
@@ -205,7 +450,13 @@ if __name__=="__main__":
     print("[bold yellow]Final set of args:[/bold yellow]")
     print_json(data=args)
 
-    reader = read_files(args['FILES'], filetype=args['filetype'])
-    chromatogram(reader, args)
+    if args.watch:
+        watch_chromatogram(args)
+    else:
+        ## NOTE: Shell chromatograms use only the concentration scalar_0 from the
+        ## outlet files. The full chromatogram is computed for all --scalars.
+        point_arrays = required_point_arrays(args.scalars) if args.type == 'full' else ['scalar_0']
+        reader = read_files(args['FILES'], filetype=args['filetype'], point_arrays=point_arrays)
+        chromatogram(reader, args)
 
 
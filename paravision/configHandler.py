@@ -120,11 +120,16 @@ class ConfigHandler:
         ap.add_argument("-g", "--geometry", nargs=2, type=int, help="Animation geometry size")
 
         ap.add_argument("-o", "--output-prefix", help="prefix for output filenames")
-        ap.add_argument("-f", "--filetype", choices=['xdmf', 'vtu', 'vtk', 'pvtu', 'pvd'], help="filetype: xdmf | vtu | vtk | pvtu")
+        ap.add_argument("-f", "--filetype", choices=['xdmf', 'vtu', 'vtk', 'pvtu', 'pvd', 'h5'], help="filetype: xdmf | vtu | vtk | pvtu | pvd | h5 (series file, see convert_series)")
 
         ap.add_argument("--standalone", action=argparse.BooleanOptionalAction, default=None, help="Read files as separate standalone objects, not part of time series.")
         ap.add_argument("--append-datasets", action=argparse.BooleanOptionalAction, default=None, help="Use AppendDatasets on standalone files before processing.")
 
+        ap.add_argument("--operator-cache", help="Directory to store precomputed integration operators for reuse across runs.")
+        ap.add_argument("--checkpoint-dir", help="Directory to store per-timestep results. Reruns resume at the first missing timestep.")
+        ap.add_argument("--time-partition", nargs=2, type=int, metavar=("RANK", "NPARTS"), help="Compute only every NPARTS-th timestep, starting at RANK, into --checkpoint-dir. Used by pvrun --ntime-parallel.")
+        ap.add_argument("--prefetch", type=int, help="Number of timesteps to read ahead in the background (serial runs only). 0 disables prefetching.")
+
 
         ## NOTE:  Specific to radial types: grm2d and radial_shell_integrate etc
         # ap.add_argument("-st"  , "--shelltype", choices = ['EQUIDISTANT', 'EQUIVOLUME'], help="Shell discretization type. See --nrad")
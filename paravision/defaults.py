@@ -21,6 +21,10 @@ DEFAULT_CONFIG = Dict({
             'filetype'              : 'pvtu',
             'standalone'            : False,
             'append_datasets'       : False,
+            'operator_cache'        : None,
+            'checkpoint_dir'        : None,
+            'time_partition'        : None,
+            'prefetch'              : 0,
             'FILES'                 : [],
 
             'type'                  : None,
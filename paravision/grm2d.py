@@ -1,7 +1,12 @@
 from paraview.simple import *
 
 from paravision.utils import csvWriter, parse_cmdline_args, read_files, arr_to_bin_unpacked, arr_to_bin
+from paravision.utils import fetch_mesh, required_point_arrays, number_of_processes
 from paravision.integrate import integrate
+from paravision.shells import zone_operator
+from paravision.operators import cached_operator
+from paravision.checkpoint import checkpoint_store
+from paravision.timesteps import TimeSteps
 
 import numpy as np
 
@@ -45,8 +50,21 @@ def GRM2D(object, args):
     print(radEdges)
     print(nColEdgeFractions)
 
+    ## NOTE: The binned engine gathers the mesh and the point data of every
+    ## timestep on the client, which doesn't scale under MPI. Parallel runs
+    ## default to the clip engine, which integrates on the ranks.
+    engine = args.get('engine') or ('binned' if number_of_processes() == 1 else 'clip')
+
+    if engine == 'binned':
+        ## NOTE: All nCol x nRad zones are integrated by a single sparse
+        ## operator built once from the mesh, instead of nested clips per zone.
+        mesh = fetch_mesh(object)
+        operator = cached_operator(mesh, f"grm2d_{list(colEdges)}_{list(radEdges)}",
+                                   lambda m: zone_operator(m.points, m.connectivity, m.offsets, m.types, colEdges, radEdges),
+                                   args.get('operator_cache'))
+        zone_volumes = operator.measures()
+
     ## TODO: Make these function arguments
-    timeKeeper = GetTimeKeeper()
     timeArray = object.TimestepValues
     nts = len(timeArray) or 1
 
@@ -61,90 +79,114 @@ def GRM2D(object, args):
     ## Hack to remove previous file
     arr_to_bin([], grm2d_output_filename, 'd')
 
+    ## NOTE: With a checkpoint store, the timesteps are persisted there as they
+    ## complete and grm2d_appended.bin is written in one go at the end.
+    checkpoint = checkpoint_store(args, 'grm2d', nts, scalars=list(args['scalars']), colEdges=list(colEdges), radEdges=list(radEdges))
+    timesteps = TimeSteps(object, timeArray, args.get('prefetch', 0), checkpoint, point_arrays=list(args['scalars']) if engine == 'binned' else None)
+
     for timestep in range(nts):
 
-        timeKeeper.Time = timestep
-        # object.UpdatePipeline(reader.TimestepValues[timestep])
-        object.UpdatePipeline(timeArray[timestep])
-        # object.UpdatePipeline()
+        if checkpoint and checkpoint.skip(timestep):
+            continue
+
+        if checkpoint and checkpoint.done(timestep):
+            print("--> TS: {} (checkpointed)".format(timestep))
+            grm2d_output.extend(checkpoint.load(timestep).tolist())
+            continue
+
+        timesteps.update(timestep)
 
         grm2d_timestep_output = []
 
         print("--> TS: {}".format(timestep))
 
-        # for leftEdge, rightEdge in zip(colEdges[:-1], colEdges[1:]):
-        for leftEdge, rightEdge in zip(nColEdgeFractions[:-1], nColEdgeFractions[1:]):
-            print("  |--> Col: {}/{}".format(np.where(nColEdgeFractions == rightEdge)[0][0],nCol))
-            SetActiveSource(object)
-            print('[{}, {}]'.format(leftEdge, rightEdge))
-
-            # clipLeftArgs = { 'project' : ['clip', 'Plane', leftEdge , '-z'] }
-            # clipRightArgs = { 'project' : ['clip', 'Plane', rightEdge, '+z'] }
-            # clipLeft = project(object, clipLeftArgs)
-            # clipRight = project(clipLeft, clipRightArgs)
-            ## screenshot(clipRight, args, suffix=str(leftEdge) + '_')
-
-            clipBox = Clip(Input=object)
-            clipBox.ClipType = 'Box'
-            clipBox.Exact = 1
-            clipBox.ClipType.UseReferenceBounds = 1
-            clipBox.ClipType.Bounds = [0.0, 1.0, 0.0, 1.0, leftEdge, rightEdge]
-            # clipBox.UpdatePipeline()
-
-            # Hide(object, view)
-            # screenshot(clipBox, args, suffix=str(leftEdge) + '_')
-
-            radAvg = []
-
-            for radIn, radOut in zip(radEdges[:-1], radEdges[1:]):
-                radAvg.append( (radIn + radOut) / 2 )
-                # print('--> [{}, {}]: {}'.format(radIn, radOut, (radIn+radOut)/2))
-
-                print('    |--> Rad: {}/{}'.format(np.where(radEdges == radOut)[0][0], nRad))
-
-                # clipOuter = Clip(Input=clipRight)
-                clipOuter = Clip(Input=clipBox)
-                clipOuter.ClipType = 'Cylinder'
-                clipOuter.ClipType.Axis = [0.0, 0.0, 1.0]
-                clipOuter.ClipType.Radius = radOut
-                Hide3DWidgets(proxy=clipOuter.ClipType)
-
-                # renderView1 = GetActiveViewOrCreate('RenderView')
-                # projectionDisplay = Show(clipOuter, renderView1)
-                # projectionDisplay.Representation = 'Surface'
-                # # projectionDisplay.Representation = 'Surface With Edges'
-                # renderView1.OrientationAxesVisibility = int(args['show_axis'])
-                # projectionDisplay.RescaleTransferFunctionToDataRange()
-
-                clipInner = Clip(Input=clipOuter)
-                clipInner.ClipType = 'Cylinder'
-                clipInner.ClipType.Axis = [0.0, 0.0, 1.0]
-                clipInner.ClipType.Radius = radIn
-                clipInner.Invert = 0
-
-                # renderView1 = GetActiveViewOrCreate('RenderView')
-                # projectionDisplay = Show(clipInner, renderView1)
-                # projectionDisplay.Representation = 'Surface'
-                # # projectionDisplay.Representation = 'Surface With Edges'
-                # renderView1.OrientationAxesVisibility = int(args['show_axis'])
-                # projectionDisplay.RescaleTransferFunctionToDataRange()
-
-                # screenshot(clipInner, args, suffix=str(radIn) + "_")
-
-                integrated_scalars = integrate(clipInner, args['scalars'], normalize='Volume')
-                # print('---->', integrated_scalars[0])
-                grm2d_timestep_output.extend(integrated_scalars[0])
-
-                Delete(clipInner)
-                Delete(clipOuter)
-
-            # Delete(clipLeft)
-            # Delete(clipRight)
-            Delete(clipBox)
+        if engine == 'binned':
+            grm2d_timestep_output = integrate_zones(operator, zone_volumes, timesteps.point_data())
+        else:
+            # for leftEdge, rightEdge in zip(colEdges[:-1], colEdges[1:]):
+            for leftEdge, rightEdge in zip(nColEdgeFractions[:-1], nColEdgeFractions[1:]):
+                print("  |--> Col: {}/{}".format(np.where(nColEdgeFractions == rightEdge)[0][0],nCol))
+                SetActiveSource(object)
+                print('[{}, {}]'.format(leftEdge, rightEdge))
+
+                # clipLeftArgs = { 'project' : ['clip', 'Plane', leftEdge , '-z'] }
+                # clipRightArgs = { 'project' : ['clip', 'Plane', rightEdge, '+z'] }
+                # clipLeft = project(object, clipLeftArgs)
+                # clipRight = project(clipLeft, clipRightArgs)
+                ## screenshot(clipRight, args, suffix=str(leftEdge) + '_')
+
+                clipBox = Clip(Input=object)
+                clipBox.ClipType = 'Box'
+                clipBox.Exact = 1
+                clipBox.ClipType.UseReferenceBounds = 1
+                clipBox.ClipType.Bounds = [0.0, 1.0, 0.0, 1.0, leftEdge, rightEdge]
+                # clipBox.UpdatePipeline()
+
+                # Hide(object, view)
+                # screenshot(clipBox, args, suffix=str(leftEdge) + '_')
+
+                radAvg = []
+
+                for radIn, radOut in zip(radEdges[:-1], radEdges[1:]):
+                    radAvg.append( (radIn + radOut) / 2 )
+                    # print('--> [{}, {}]: {}'.format(radIn, radOut, (radIn+radOut)/2))
+
+                    print('    |--> Rad: {}/{}'.format(np.where(radEdges == radOut)[0][0], nRad))
+
+                    # clipOuter = Clip(Input=clipRight)
+                    clipOuter = Clip(Input=clipBox)
+                    clipOuter.ClipType = 'Cylinder'
+                    clipOuter.ClipType.Axis = [0.0, 0.0, 1.0]
+                    clipOuter.ClipType.Radius = radOut
+                    Hide3DWidgets(proxy=clipOuter.ClipType)
+
+                    # renderView1 = GetActiveViewOrCreate('RenderView')
+                    # projectionDisplay = Show(clipOuter, renderView1)
+                    # projectionDisplay.Representation = 'Surface'
+                    # # projectionDisplay.Representation = 'Surface With Edges'
+                    # renderView1.OrientationAxesVisibility = int(args['show_axis'])
+                    # projectionDisplay.RescaleTransferFunctionToDataRange()
+
+                    clipInner = Clip(Input=clipOuter)
+                    clipInner.ClipType = 'Cylinder'
+                    clipInner.ClipType.Axis = [0.0, 0.0, 1.0]
+                    clipInner.ClipType.Radius = radIn
+                    clipInner.Invert = 0
+
+                    # renderView1 = GetActiveViewOrCreate('RenderView')
+                    # projectionDisplay = Show(clipInner, renderView1)
+                    # projectionDisplay.Representation = 'Surface'
+                    # # projectionDisplay.Representation = 'Surface With Edges'
+                    # renderView1.OrientationAxesVisibility = int(args['show_axis'])
+                    # projectionDisplay.RescaleTransferFunctionToDataRange()
+
+                    # screenshot(clipInner, args, suffix=str(radIn) + "_")
+
+                    integrated_scalars = integrate(clipInner, args['scalars'], normalize='Volume')
+                    # print('---->', integrated_scalars[0])
+                    grm2d_timestep_output.extend(integrated_scalars[0])
+
+                    Delete(clipInner)
+                    Delete(clipOuter)
+
+                # Delete(clipLeft)
+                # Delete(clipRight)
+                Delete(clipBox)
 
         grm2d_output.extend(grm2d_timestep_output)
         # print(grm2d_timestep_output)
-        arr_to_bin_unpacked(grm2d_timestep_output, 'grm2d_appended.bin', 'd', mode='a')
+        if checkpoint:
+            checkpoint.save(timestep, grm2d_timestep_output)
+        else:
+            arr_to_bin_unpacked(grm2d_timestep_output, 'grm2d_appended.bin', 'd', mode='a')
+
+    timesteps.close()
+
+    if checkpoint:
+        if checkpoint.worker:
+            ## NOTE: Outputs are written by the merge run once all workers are done
+            return
+        arr_to_bin_unpacked(grm2d_output, 'grm2d_appended.bin', 'd', mode='w')
 
     # print(grm2d_output)
     ## NOTE: Uncomment one of the below to save from RAM to disk
@@ -152,7 +194,17 @@ def GRM2D(object, args):
     # arr_to_bin_unpacked(grm2d_output, grm2d_output_filename, 'd')
     print("DONE!")
 
+def integrate_zones(operator, zone_volumes, point_values):
+    """ Volume averages of scalars in every (column, shell) zone, ordered as (nCol x nRad x nScalar)
+
+    point_values: (npoints, nscalars) values of the scalars at the mesh points
+    """
+    integrated = operator.apply(point_values)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        averaged = np.where(zone_volumes[:, None] > 0, integrated / zone_volumes[:, None], 0.0)
+    return averaged.ravel().tolist()
+
 if __name__=="__main__":
     args = parse_cmdline_args()
-    reader = read_files(args['FILES'], filetype=args['filetype'])
+    reader = read_files(args['FILES'], filetype=args['filetype'], point_arrays=required_point_arrays(args['scalars']))
     GRM2D(reader, args)
@@ -2,12 +2,24 @@ from paraview.simple import *
 from vtkmodules.numpy_interface import dataset_adapter as dsa
 import vtk.util.numpy_support as ns #type:ignore
 
-def integrate(object, vars, normalize=None, timeArray=[]):
+from paravision.utils import fetch_mesh
+from paravision.operators import cached_operator, volume_operator
+from paravision.timesteps import TimeSteps
+
+def integrate(object, vars, normalize=None, timeArray=[], engine='pipeline', cache_dir=None, checkpoint=None, prefetch=0):
     ## normalize= "Volume" or "Area" or None
+    ## engine= "pipeline": IntegrateVariables at every timestep
+    ##         "operator": precomputed quadrature weights, applied to all vars at once
+    ## checkpoint= CheckpointStore. Timesteps already in it are loaded, not recomputed.
+    ##             With a time partition, only the worker's own timesteps are returned
+    ## prefetch= number of timesteps to read ahead in the background (see TimeSteps)
     choices = ['Volume', 'Area']
 
-    timeKeeper = GetTimeKeeper()
-    nts = len(timeArray) or 1
+    if engine == 'operator':
+        return integrate_with_operator(object, vars, normalize=normalize, timeArray=timeArray, cache_dir=cache_dir, checkpoint=checkpoint, prefetch=prefetch)
+
+    timesteps = TimeSteps(object, timeArray, prefetch, checkpoint)
+    nts = len(timesteps)
 
     print(f"Integrating over time array: {timeArray}")
 
@@ -17,11 +29,15 @@ def integrate(object, vars, normalize=None, timeArray=[]):
 
     integrated_over_time = []
     for timestep in range(nts):
-        try:
-            timeKeeper.Time = timestep
-            object.UpdatePipeline(timeArray[timestep])
-        except IndexError:
-            pass
+        if checkpoint and checkpoint.skip(timestep):
+            continue
+
+        if checkpoint and checkpoint.done(timestep):
+            print(f"Loading checkpointed timestep: {timestep}")
+            integrated_over_time.append(checkpoint.load(timestep).tolist())
+            continue
+
+        timesteps.update(timestep)
 
         print(f"Integrating timestep: {timestep}")
 
@@ -50,7 +66,60 @@ def integrate(object, vars, normalize=None, timeArray=[]):
             integrated_scalars.append(value[0]/volume)  ## Average of c, instead of integ(c.dV)
 
         integrated_over_time.append(integrated_scalars)
+        if checkpoint:
+            checkpoint.save(timestep, integrated_scalars)
 
         Delete(integrated)
 
+    timesteps.close()
+    return integrated_over_time
+
+def integrate_with_operator(object, vars, normalize=None, timeArray=[], operator=None, cache_dir=None, checkpoint=None, prefetch=0):
+    """ Same as integrate(), but with the quadrature weights assembled once
+
+    The mesh is fetched once to build (or load) the operator. Every timestep
+    is then one fetch of the point data and one sparse product for all vars.
+    A zone operator (e.g. shells) may be passed in; the result is then a list
+    over time of (nzones x nvars) lists.
+    """
+    choices = ['Volume', 'Area']
+
+    timesteps = TimeSteps(object, timeArray, prefetch, checkpoint, point_arrays=vars)
+    nts = len(timesteps)
+
+    print(f"Integrating over time array: {timeArray}")
+
+    single_zone = operator is None
+    if operator is None:
+        mesh = fetch_mesh(object)
+        operator = cached_operator(mesh, 'volume', volume_operator, cache_dir)
+
+    volume = 1
+    if normalize in choices:
+        if normalize == operator.measure_name:
+            volume = operator.measures()[:, None]
+        else:
+            print("".join(["Cannot normalize by ", normalize, ". No such CellData!"]))
+
+    integrated_over_time = []
+    for timestep in range(nts):
+        if checkpoint and checkpoint.skip(timestep):
+            continue
+
+        if checkpoint and checkpoint.done(timestep):
+            print(f"Loading checkpointed timestep: {timestep}")
+            integrated_over_time.append(checkpoint.load(timestep).tolist())
+            continue
+
+        timesteps.update(timestep)
+
+        print(f"Integrating timestep: {timestep}")
+
+        values = operator.apply(timesteps.point_data()) / volume  ## Average of c, instead of integ(c.dV)
+
+        integrated_over_time.append(values[0].tolist() if single_zone else values.tolist())
+        if checkpoint:
+            checkpoint.save(timestep, integrated_over_time[-1])
+
+    timesteps.close()
     return integrated_over_time
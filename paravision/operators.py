@@ -0,0 +1,148 @@
+"""
+Precomputed sparse integration operators.
+
+The mesh geometry doesn't change between the timesteps of a series, so the
+quadrature weights of IntegrateVariables can be assembled once per mesh and
+zone layout into a sparse (nzones x npoints) matrix W. Integrating all scalars
+over all zones at a timestep is then a single sparse product W @ point_data.
+
+Operators are kept in memory for the run and, if a cache directory is given,
+stored on disk keyed by the mesh fingerprint and the zone layout.
+"""
+
+import hashlib
+from pathlib import Path
+
+import numpy as np
+
+from paravision.shells import simplices, simplex_measures, VTK_VOXEL, VTK_PIXEL
+
+class IntegrationOperator:
+    """ Sparse (nzones x npoints) quadrature weight matrix in CSR-like layout
+
+    Rows are zones, columns are mesh points. dim is 3 if the weights integrate
+    over volume and 2 if over area.
+    """
+
+    def __init__(self, rows, cols, vals, nzones, npoints, dim=3):
+        rows = np.asarray(rows, dtype=np.int64)
+        cols = np.asarray(cols, dtype=np.int64)
+        vals = np.asarray(vals, dtype=np.float64)
+
+        ## Sum duplicate (zone, point) entries and sort by zone
+        keys = rows * npoints + cols
+        keys, inverse = np.unique(keys, return_inverse=True)
+        self.vals = np.bincount(inverse.ravel(), weights=vals, minlength=len(keys))
+        self.rows = keys // npoints
+        self.cols = keys % npoints
+
+        self.nzones = nzones
+        self.npoints = npoints
+        self.dim = dim
+
+        self.row_starts = np.searchsorted(self.rows, np.arange(nzones))
+        self.nonempty = np.flatnonzero(np.bincount(self.rows, minlength=nzones))
+
+    @property
+    def measure_name(self):
+        """ Name of the CellData array IntegrateVariables would give for the measure """
+        return 'Volume' if self.dim == 3 else 'Area'
+
+    def apply(self, values):
+        """ Integrate point data over each zone
+
+        values: (npoints,) or (npoints, nscalars)
+        Returns (nzones,) or (nzones, nscalars)
+        """
+        values = np.asarray(values, dtype=np.float64)
+        if values.shape[0] != self.npoints:
+            raise ValueError(f"Operator expects {self.npoints} points, got {values.shape[0]}.")
+
+        products = values[self.cols] * (self.vals if values.ndim == 1 else self.vals[:, None])
+
+        result = np.zeros((self.nzones,) + values.shape[1:])
+        if len(self.nonempty):
+            result[self.nonempty] = np.add.reduceat(products, self.row_starts[self.nonempty], axis=0)
+        return result
+
+    def measures(self):
+        """ Volume (or area) of each zone, the integral of 1 """
+        return np.bincount(self.rows, weights=self.vals, minlength=self.nzones)
+
+    def dense(self):
+        """ Weights as a dense (nzones, npoints) array """
+        weights = np.zeros((self.nzones, self.npoints))
+        weights[self.rows, self.cols] = self.vals
+        return weights
+
+    def save(self, filename):
+        np.savez(filename, rows=self.rows, cols=self.cols, vals=self.vals,
+                 shape=np.array([self.nzones, self.npoints, self.dim]))
+
+    @classmethod
+    def load(cls, filename):
+        data = np.load(filename)
+        nzones, npoints, dim = data['shape']
+        return cls(data['rows'], data['cols'], data['vals'], int(nzones), int(npoints), int(dim))
+
+def mesh_fingerprint(mesh):
+    """ Hash of the mesh geometry (points, connectivity, offsets, types) """
+    sha = hashlib.sha1()
+    for key in ['points', 'connectivity', 'offsets', 'types']:
+        sha.update(np.ascontiguousarray(mesh[key]).tobytes())
+    return sha.hexdigest()
+
+def volume_operator(mesh):
+    """ Single zone operator: the full domain, as IntegrateVariables on the whole object """
+    simplex_ids, parents, dim = simplices(mesh.connectivity, mesh.offsets, mesh.types)
+    measures = simplex_measures(mesh.points, simplex_ids)
+    k = simplex_ids.shape[1]
+
+    ## NOTE: IntegrateVariables integrates voxels and pixels exactly, as their
+    ## measure times the mean of their point values, instead of splitting them.
+    exact = np.isin(mesh.types[parents], [VTK_VOXEL, VTK_PIXEL])
+    cell_ids, inverse = np.unique(parents[exact], return_inverse=True)
+    cell_measures = np.bincount(inverse.ravel(), weights=measures[exact], minlength=len(cell_ids))
+    counts = mesh.offsets[cell_ids + 1] - mesh.offsets[cell_ids]
+    cell_points = mesh.connectivity[np.repeat(mesh.offsets[cell_ids] - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())]
+
+    return IntegrationOperator(
+            np.zeros((~exact).sum() * k + counts.sum(), dtype=np.int64),
+            np.concatenate([simplex_ids[~exact].ravel(), cell_points]),
+            np.concatenate([np.repeat(measures[~exact] / k, k), np.repeat(cell_measures / counts, counts)]),
+            1,
+            len(mesh.points),
+            dim)
+
+## In-memory store of operators for the run, keyed by (fingerprint, layout)
+_OPERATORS = {}
+
+def cached_operator(mesh, layout, builder, cache_dir=None):
+    """ Get the operator for the given mesh and zone layout, building it only once
+
+    layout: string describing the zone layout (e.g. "shells_EQUIDISTANT_5_...")
+    builder: function(mesh) -> IntegrationOperator
+    cache_dir: if given, operators are also stored/loaded as npz files there
+    """
+    key = (mesh_fingerprint(mesh), layout)
+
+    if key in _OPERATORS:
+        return _OPERATORS[key]
+
+    filename = None
+    if cache_dir:
+        layout_hash = hashlib.sha1(layout.encode()).hexdigest()[:12]
+        filename = Path(cache_dir) / f"operator_{key[0][:16]}_{layout_hash}.npz"
+
+    if filename and filename.exists():
+        print(f"Loading integration operator from {filename}")
+        operator = IntegrationOperator.load(filename)
+    else:
+        operator = builder(mesh)
+        if filename:
+            filename.parent.mkdir(parents=True, exist_ok=True)
+            print(f"Saving integration operator to {filename}")
+            operator.save(filename)
+
+    _OPERATORS[key] = operator
+    return operator
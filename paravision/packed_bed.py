@@ -0,0 +1,620 @@
+"""
+Packed bed geometry in numpy, without ParaView.
+
+Beads are (x, y, z, r) rows of an array. This module has the bed container,
+the cylinder-sphere intersection volumes used for radial porosities, bead
+bridges, and the per-region reductions of a Connectivity output used to find
+the beads in a mesh. bed_info.py is the pvbatch script built on it.
+"""
+
+from math import asin,sqrt,pi
+from mpmath import ellipk, ellipe, ellipf
+
+import numpy as np
+
+## NOTE: scipy is optional. Without it, the elliptic integrals for
+## CylSphIntVolumeArray are evaluated with Carlson's symmetric forms in numpy.
+try:
+    from scipy import special
+except ImportError:
+    special = None
+
+class Bead:
+    """Class for individual beads
+
+    A view of one (x, y, z, r) row. Beads of a PackedBed write through to the bed's array.
+    """
+
+    __slots__ = ('xyzr',)
+
+    def __init__(self, x, y, z, r):
+        self.xyzr = np.array([x, y, z, r], dtype=np.float64)
+
+    @classmethod
+    def view(cls, row):
+        bead = cls.__new__(cls)
+        bead.xyzr = row
+        return bead
+
+    x = property(lambda self: self.xyzr[0], lambda self, value: self.xyzr.__setitem__(0, value))
+    y = property(lambda self: self.xyzr[1], lambda self, value: self.xyzr.__setitem__(1, value))
+    z = property(lambda self: self.xyzr[2], lambda self, value: self.xyzr.__setitem__(2, value))
+    r = property(lambda self: self.xyzr[3], lambda self, value: self.xyzr.__setitem__(3, value))
+
+    def pos(self):
+        return np.sqrt(self.x**2 + self.y**2)
+
+    def volume(self):
+        return 4/3 * np.pi * self.r**3
+
+    def distance(self, other):
+        return sqrt((self.x-other.x)**2 + (self.y-other.y)**2 + (self.z-other.z)**2)
+
+    def serialize(self):
+        return tuple(self.xyzr.tolist())
+
+class PackedBed:
+    """Class for packed bed of beads. Can apply transformations on beads
+
+    The beads are stored as rows (x, y, z, r) of one contiguous (N, 4) float64 array.
+    """
+
+    def __init__(self, xyzr=None):
+        xyzr = np.zeros((0, 4)) if xyzr is None else xyzr
+        self._data = np.array(xyzr, dtype=np.float64).reshape(-1, 4)
+        self._size = len(self._data)
+
+    @classmethod
+    def read(cls, filename):
+        """ Read a bed written by write() """
+        if str(filename).endswith('.npy'):
+            return cls(np.load(filename))
+        return cls(np.loadtxt(filename, delimiter=',', ndmin=2))
+
+    @property
+    def xyzr(self):
+        return self._data[:self._size]
+
+    @property
+    def beads(self):
+        return [ Bead.view(row) for row in self.xyzr ]
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        return iter(self.beads)
+
+    def add(self, bead):
+        self.extend(np.asarray(bead.serialize(), dtype=np.float64))
+
+    def extend(self, xyzr):
+        """ Add the rows of an (N, 4) array """
+        xyzr = np.asarray(xyzr, dtype=np.float64).reshape(-1, 4)
+        size = self._size + len(xyzr)
+        if size > len(self._data):
+            ## NOTE: Grow geometrically, so adding beads one at a time stays linear
+            data = np.empty((max(size, 2 * len(self._data)), 4))
+            data[:self._size] = self.xyzr
+            self._data = data
+        self._data[self._size:size] = xyzr
+        self._size = size
+
+    def size(self):
+        return self._size
+
+    def radii(self):
+        return self.xyzr[:, 3]
+
+    def volume(self):
+        return float(4/3 * np.pi * np.sum(self.xyzr[:, 3]**3))
+
+    def serialize(self):
+        """ The (N, 4) array of beads. This is a view, not a copy """
+        return self.xyzr
+
+    def write(self, filename):
+        """ Write the beads as csv, or as binary if filename ends with .npy """
+        if str(filename).endswith('.npy'):
+            np.save(filename, self.xyzr)
+        else:
+            np.savetxt(filename, self.xyzr, delimiter=',')
+
+    def updateBounds(self):
+        """
+        Calculate bounding points for the packed bed.
+        """
+        xyz = self.xyzr[:, :3]
+        r = self.xyzr[:, 3]
+
+        lower = (xyz - r[:, None]).min(axis=0)
+        upper = (xyz + r[:, None]).max(axis=0)
+
+        self.rmax = float(r.max())
+        self.rmin = float(r.min())
+        self.ravg = float(r.mean())
+
+        self.xmin, self.ymin, self.zmin = lower.tolist()
+        self.xmax, self.ymax, self.zmax = upper.tolist()
+
+        self.dx = self.xmax - self.xmin
+        self.dy = self.ymax - self.ymin
+        self.dz = self.zmax - self.zmin
+
+        self.R = max((self.xmax-self.xmin)/2, (self.ymax-self.ymin)/2) ## Similar to Genmesh
+        self.h = self.zmax - self.zmin
+        self.CylinderVolume = pi * self.R**2 * self.h
+
+    def moveBedtoCenter(self):
+        """
+        Translate bed center to origin of coordinate system.
+        """
+        self.updateBounds()
+        self.xyzr[:, 0] -= (self.xmax + self.xmin)/2
+        self.xyzr[:, 1] -= (self.ymax + self.ymin)/2
+        self.updateBounds()
+
+    def get_bounds(self): 
+        self.updateBounds()
+        return {
+                'xmin': self.xmin,
+                'xmax': self.xmax,
+                'ymin': self.ymin,
+                'ymax': self.ymax,
+                'zmin': self.zmin,
+                'zmax': self.zmax,
+                'rmin': self.rmin,
+                'rmax': self.rmax,
+                'xdelta': self.xmax - self.xmin,
+                'ydelta': self.ymax - self.ymin,
+                'zdelta': self.zmax - self.zmin,
+                'ravg': self.ravg,
+                'R': self.R,
+                'h': self.h,
+                'volume': self.volume(),
+                }
+
+def beadArray(beads):
+    """ (N, 4) array (x, y, z, r) of a PackedBed or a list of beads """
+    if isinstance(beads, PackedBed):
+        return beads.xyzr
+    return np.array([ bead.serialize() for bead in beads ], dtype=np.float64).reshape(-1, 4)
+
+class RadialIndex:
+    """
+    Beads sorted by radial position, to find the ones that straddle a
+    cylinder of a given radius without looking at all the others.
+    """
+
+    def __init__(self, xyzr):
+        pos = np.sqrt(xyzr[:, 0]**2 + xyzr[:, 1]**2)
+        order = np.argsort(pos, kind='stable')
+        self.xyzr = xyzr[order]
+        self.pos = pos[order]
+        self.rmax = xyzr[:, 3].max() if len(xyzr) else 0.0
+
+    def range(self, rmin, rmax):
+        """ Indices of the beads with radial position in [rmin, rmax] """
+        return np.arange(np.searchsorted(self.pos, rmin, side='left'), np.searchsorted(self.pos, rmax, side='right'))
+
+    def straddling(self, radius):
+        """ Indices of the beads cut by the cylinder of the given radius """
+        if radius <= 0:
+            return np.zeros(0, dtype=np.int64)
+        candidates = self.range(radius - self.rmax, radius + self.rmax)
+        r = self.xyzr[candidates, 3]
+        pos = self.pos[candidates]
+        return candidates[(pos - r < radius) & (radius < pos + r)]
+
+def volShellRegion(beads, rShells, i, index=None):
+    """
+    Find the intersection volumes between rShells[i] & rShells[i+1]
+
+    @input: beads, shell_radii, index of shell, RadialIndex of the beads (optional)
+    @output:
+        - total volume of all particles within the i'th shell
+        - list of all radii based on intersected volumes.
+
+    """
+    ## NOTE: Beads entirely inside the shell count with their full volume and
+    ## beads entirely outside not at all. Only the beads cut by one of the two
+    ## cylinders need the intersection volumes.
+    if index is None:
+        index = RadialIndex(beadArray(beads))
+
+    rInner, rOuter = rShells[i], rShells[i+1]
+    cut = np.union1d(index.straddling(rInner), index.straddling(rOuter))
+    inside = np.setdiff1d(index.range(rInner, rOuter), cut, assume_unique=True)
+
+    volCut = volBeadSliceArray(index.xyzr[cut], rInner, rOuter)
+    radCut = np.cbrt(volCut/(4.0/3.0*pi))
+    radInside = index.xyzr[inside, 3]
+
+    volShell = 4.0/3.0*pi * np.sum(radInside**3) + volCut.sum()
+    return volShell, list(radInside) + list(radCut[radCut != 0])
+
+# def radsShellRegion(beads, rShells, i):
+#     """
+#     In order to calculate histogram for beads in individual shells.
+#     > 1. Calculate Volumes of each bead in given shell,
+#     > 2. Extrapolate "radius" from each volume, even sliced ones.
+#     > 3. Return list of radii to be used by histo()
+#     """
+#     radsShell=[]
+#     for bead in beads:
+#         volBead = volBeadSlice(bead, rShells[i], rShells[i+1])
+#         radBead = pow(volBead/(4.0/3.0*pi), 1.0/3.0)
+#         radsShell.append(radBead)
+#     return radsShell
+
+def bridgePairs(xyzr, bridgeTol):
+    """
+    Find all pairs of beads closer than r1 + r2 + bridgeTol
+
+    Beads are binned into a uniform grid of cells no smaller than the largest
+    cutoff, so only beads in the same or adjacent cells are compared.
+
+    @input: (N, 4) array of beads (x, y, z, r), bridge tolerance
+    @output: indices i < j of the pairs, and their distances
+    """
+    n = len(xyzr)
+    if n < 2:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0)
+
+    cellSize = 2 * xyzr[:, 3].max() + bridgeTol
+    cells = np.floor((xyzr[:, :3] - xyzr[:, :3].min(axis=0)) / cellSize).astype(np.int64) + 1
+    dims = cells.max(axis=0) + 2 ## Padded, so that neighbor cells never wrap around
+    keys = (cells[:, 0] * dims[1] + cells[:, 1]) * dims[2] + cells[:, 2]
+
+    order = np.argsort(keys, kind='stable')
+    sortedKeys = keys[order]
+
+    pairs_i = []
+    pairs_j = []
+    for dx in (-1, 0, 1):
+        for dy in (-1, 0, 1):
+            for dz in (-1, 0, 1):
+                neighborKeys = keys + (dx * dims[1] + dy) * dims[2] + dz
+                start = np.searchsorted(sortedKeys, neighborKeys, side='left')
+                counts = np.searchsorted(sortedKeys, neighborKeys, side='right') - start
+
+                i = np.repeat(np.arange(n), counts)
+                j = order[np.repeat(start - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())]
+
+                keep = i < j
+                pairs_i.append(i[keep])
+                pairs_j.append(j[keep])
+
+    i = np.concatenate(pairs_i)
+    j = np.concatenate(pairs_j)
+    distance = np.sqrt(np.sum((xyzr[i, :3] - xyzr[j, :3])**2, axis=1))
+    close = distance < xyzr[i, 3] + xyzr[j, 3] + bridgeTol
+
+    return i[close], j[close], distance[close]
+
+def bridgeVolumes(beads, bridgeTol, relativeBridgeRadius, bridgeOffsetRatio):
+    """
+    Find the total volume of the bridges between beads
+
+    Returns the volume added and the bead volume removed by the bridges, and the number of bridges.
+    """
+    xyzr = beadArray(beads)
+    i, j, beadDistance = bridgePairs(xyzr, bridgeTol)
+    r1 = xyzr[i, 3]
+    r2 = xyzr[j, 3]
+
+    bridgeRadius = relativeBridgeRadius * np.minimum(r1, r2)
+    intVol1 = volBridgeSliceArray(r1, bridgeRadius, bridgeOffsetRatio)
+    intVol2 = volBridgeSliceArray(r2, bridgeRadius, bridgeOffsetRatio)
+    addedBridgeVol = np.sum(pi * bridgeRadius**2 * (beadDistance - bridgeOffsetRatio * r1 - bridgeOffsetRatio * r2) - intVol1 - intVol2)
+    removedBridgeVol = np.sum(intVol1 + intVol2)
+    ## NOTE: Some beads will be intersecting due to single precision. That's not handled here.
+
+    return float(addedBridgeVol), float(removedBridgeVol), len(i)
+
+def volBridgeSlice(bead, bridgeRadius, offsetRatio):
+    """
+    Volume of intersection between bridge and bead
+    """
+    rho = bridgeRadius/bead.r
+    # eta = bead.pos()/bead.r ##FIXME, eta == 0
+    eta = 0
+    vol = CylSphIntVolume(rho, eta) * bead.r**3
+    ## There's no need to find the accurate internal union volume since it will be deleted to find only the extra volume added by bridges in the first place.
+    vol = vol/2 - pi * bridgeRadius**2 * offsetRatio * bead.r
+    return vol
+
+def volBridgeSliceArray(r, bridgeRadius, offsetRatio):
+    """
+    Same as volBridgeSlice() for arrays of bead and bridge radii
+    """
+    vol = CylSphIntVolumeArray(bridgeRadius/r, 0) * r**3
+    return vol/2 - pi * bridgeRadius**2 * offsetRatio * r
+
+def volBeadSlice(bead, rInnerShell, rOuterShell):
+    """
+    Find intersection volume of an individual bead between two shells (cylinders)
+    """
+    rhoOuter = rOuterShell/bead.r
+    etaOuter = bead.pos()/bead.r
+    volOuter = CylSphIntVolume(rhoOuter, etaOuter) * bead.r**3
+    rhoInner = rInnerShell/bead.r
+    etaInner = bead.pos()/bead.r
+    volInner = CylSphIntVolume(rhoInner, etaInner) * bead.r**3
+    volIntBead = volOuter - volInner
+    return volIntBead
+
+def volBeadSliceArray(xyzr, rInnerShell, rOuterShell):
+    """
+    Same as volBeadSlice() for an (N, 4) array of beads (x, y, z, r) at once
+    """
+    r = xyzr[:, 3]
+    eta = np.sqrt(xyzr[:, 0]**2 + xyzr[:, 1]**2) / r
+    volOuter = CylSphIntVolumeArray(rOuterShell/r, eta) * r**3
+    volInner = CylSphIntVolumeArray(rInnerShell/r, eta) * r**3
+    return volOuter - volInner
+
+def histo(radii, **kwargs):
+    """Create histogram for a particular bead size distribution.
+        Also output volume fractions & mean radii to be used in CADET Polydisperse"""
+
+    bins = kwargs.get('bins', 1)
+
+    radii = np.asarray(radii, dtype=np.float64)
+    V = 4*np.pi*radii**3/3
+
+    ## Dump into bins by weight of each bead's volume
+    ## h (height of histogram bar) is then a representation of
+    ## the volume of beads present at a certain radius (partype).
+    ## if density==true weights are normalized
+    h,e = np.histogram(radii, bins=bins, density=True, weights=V)
+
+    ## Find the volume fraction at each point
+    frac = list(h/np.sum(h))
+    # print(sum(frac))
+
+    ## Find means of each bin from the edges (e)
+    w=2
+    avg=np.convolve(e, np.ones(w), 'valid') / w
+
+    return frac, list(avg)
+
+def CylSphIntVolume(rho, eta):
+    """ Analytical Formulae to calculate intersection between cylinder and sphere.
+        See http://dx.doi.org/10.1016/s1385-7258(61)50049-2 for more info.
+    """
+    if rho == 0.0:
+        return 0
+    elif (eta - rho) <= -1:
+        return 4/3 * pi
+    elif (eta - rho) >= 1:
+        return 0
+
+    ## NOTE: Ideally eta & rho are floats & never equal. But test cases are not handled yet. Similarly rho+eta == 1
+    if eta == rho:
+        print("Rho & Eta are Equal")
+
+    if eta == 0 and 0 <= rho <= 1:
+        V = 4/3 * pi - 4/3 * pi * (1 - rho**2)**(3/2)
+        return V
+    elif (rho + eta > 1):
+        nu = asin(eta - rho)
+        m = (1-(eta - rho)**2)/(4*rho*eta)
+
+        K = ellipk(m)
+        E = ellipe(m)
+
+        F = ellipf(nu ,1-m)
+        Ep = ellipe(nu, 1-m)
+
+        L0 = 2/pi * (E * F + K * Ep - K * F )
+
+        # V = (2/3 * pi * ( 1 - L0(nu, m) ) )\
+        V = (2/3 * pi * ( 1 - L0 ) )\
+        - (8/9 * sqrt(rho * eta) * (6 * rho**2 + 2 * rho * eta - 3) * (1 - m) * K)\
+        + (8/9 * sqrt(rho * eta) * (7 * rho**2 + eta**2 - 4) * E)
+
+        return V
+
+    elif (rho + eta < 1):
+        nu = asin((eta - rho)/(eta + rho))
+        m = 4*rho*eta / (1 - (eta-rho)**2)
+        K = ellipk(m)
+        E = ellipe(m)
+        F = ellipf(nu ,1-m)
+        Ep = ellipe(nu, 1-m)
+        L0 = 2/pi * (E * F + K * Ep - K * F )
+
+        V = (2/3 * pi * ( 1 - L0 ))\
+        - (4 * sqrt(1 - (eta-rho)**2) / (9*(eta+rho)) ) * (2*rho - 4*eta + (eta+rho)*(eta-rho)**2) * (1-m) * K\
+        + (4/9 * sqrt(1 - (eta-rho)**2) * (7*rho**2 + eta**2 - 4) * E)
+
+        return V
+
+    else:
+        print("ERROR")
+        return 0
+
+def _carlson_rf(x, y, z):
+    """ Carlson's symmetric elliptic integral of the first kind, by duplication """
+    x, y, z = np.broadcast_arrays(*(np.asarray(v, dtype=np.float64) for v in (x, y, z)))
+    x, y, z = x.copy(), y.copy(), z.copy()
+    for _ in range(100):
+        sx, sy, sz = np.sqrt(x), np.sqrt(y), np.sqrt(z)
+        lam = sx*sy + sx*sz + sy*sz
+        x, y, z = (x + lam)/4, (y + lam)/4, (z + lam)/4
+        ave = (x + y + z)/3
+        dx, dy, dz = (ave - x)/ave, (ave - y)/ave, (ave - z)/ave
+        if np.all(np.maximum(np.abs(dx), np.maximum(np.abs(dy), np.abs(dz))) < 1e-3):
+            break
+    e2 = dx*dy - dz**2
+    e3 = dx*dy*dz
+    return (1 + (e2/24 - 0.1 - 3/44*e3)*e2 + e3/14) / np.sqrt(ave)
+
+def _carlson_rd(x, y, z):
+    """ Carlson's symmetric elliptic integral of the second kind, by duplication """
+    x, y, z = np.broadcast_arrays(*(np.asarray(v, dtype=np.float64) for v in (x, y, z)))
+    x, y, z = x.copy(), y.copy(), z.copy()
+    total = np.zeros_like(x)
+    fac = 1.0
+    for _ in range(100):
+        sx, sy, sz = np.sqrt(x), np.sqrt(y), np.sqrt(z)
+        lam = sx*sy + sx*sz + sy*sz
+        total = total + fac/(sz*(z + lam))
+        fac = fac/4
+        x, y, z = (x + lam)/4, (y + lam)/4, (z + lam)/4
+        ave = (x + y + 3*z)/5
+        dx, dy, dz = (ave - x)/ave, (ave - y)/ave, (ave - z)/ave
+        if np.all(np.maximum(np.abs(dx), np.maximum(np.abs(dy), np.abs(dz))) < 1e-3):
+            break
+    ea = dx*dy
+    eb = dz**2
+    ec = ea - eb
+    ed = ea - 6*eb
+    ee = ed + 2*ec
+    c1, c2, c3, c4 = 3/14, 1/6, 9/22, 3/26
+    return 3*total + fac*(1 + ed*(-c1 + 0.25*c3*ed - 1.5*c4*dz*ee) + dz*(c2*ee + dz*(-c3*ec + dz*c4*ea))) / (ave*np.sqrt(ave))
+
+def ellipkinc(phi, m):
+    """ Incomplete elliptic integral of the first kind F(phi|m), as mpmath.ellipf(phi, m) """
+    if special is not None:
+        return special.ellipkinc(phi, m)
+    s, c = np.sin(phi), np.cos(phi)
+    return s * _carlson_rf(c**2, 1 - m*s**2, 1)
+
+def ellipeinc(phi, m):
+    """ Incomplete elliptic integral of the second kind E(phi|m), as mpmath.ellipe(phi, m) """
+    if special is not None:
+        return special.ellipeinc(phi, m)
+    s, c = np.sin(phi), np.cos(phi)
+    y = 1 - m*s**2
+    return s * _carlson_rf(c**2, y, 1) - m/3 * s**3 * _carlson_rd(c**2, y, 1)
+
+def CylSphIntVolumeArray(rho, eta):
+    """ Vectorized CylSphIntVolume() for arrays of rho and eta, in double precision
+
+    The elliptic integrals use the parameter convention of mpmath (and
+    scipy.special): K(m), E(m), F(phi|m), E(phi|m). Results agree with
+    CylSphIntVolume() to 1e-12 absolute (the full sphere being 4/3 pi).
+    """
+    rho, eta = np.broadcast_arrays(np.asarray(rho, dtype=np.float64), np.asarray(eta, dtype=np.float64))
+    V = np.zeros(rho.shape)
+
+    inside = (eta - rho) <= -1
+    V[inside] = 4/3 * pi
+
+    ## NOTE: rho + eta == 1 is the limit of both branches, where m -> 1 and
+    ## (1 - m) K(m) -> 0. Nudge it into the first branch instead of 0 * inf.
+    rho = np.where(np.isclose(rho + eta, 1, rtol=0, atol=1e-14), rho + 1e-13, rho)
+
+    todo = (rho > 0) & ~inside & ((eta - rho) < 1)
+    axis = todo & (eta == 0)
+    V[axis] = 4/3 * pi - 4/3 * pi * (1 - rho[axis]**2)**(3/2)
+
+    m1 = todo & ~axis & (rho + eta > 1)
+    r, e = rho[m1], eta[m1]
+    nu = np.arcsin(e - r)
+    m = (1 - (e - r)**2) / (4*r*e)
+    K, E, F, Ep = ellipkinc(pi/2, m), ellipeinc(pi/2, m), ellipkinc(nu, 1 - m), ellipeinc(nu, 1 - m)
+    L0 = 2/pi * (E*F + K*Ep - K*F)
+    V[m1] = (2/3 * pi * (1 - L0)) \
+          - (8/9 * np.sqrt(r*e) * (6*r**2 + 2*r*e - 3) * (1 - m) * K) \
+          + (8/9 * np.sqrt(r*e) * (7*r**2 + e**2 - 4) * E)
+
+    m2 = todo & ~axis & (rho + eta < 1)
+    r, e = rho[m2], eta[m2]
+    nu = np.arcsin((e - r)/(e + r))
+    m = 4*r*e / (1 - (e - r)**2)
+    K, E, F, Ep = ellipkinc(pi/2, m), ellipeinc(pi/2, m), ellipkinc(nu, 1 - m), ellipeinc(nu, 1 - m)
+    L0 = 2/pi * (E*F + K*Ep - K*F)
+    V[m2] = (2/3 * pi * (1 - L0)) \
+          - (4 * np.sqrt(1 - (e - r)**2) / (9*(e + r))) * (2*r - 4*e + (e + r)*(e - r)**2) * (1 - m) * K \
+          + (4/9 * np.sqrt(1 - (e - r)**2) * (7*r**2 + e**2 - 4) * E)
+
+    return V
+
+def region_bounds(points, regionIds, nRegions):
+    """
+    Bounds and centroids of every region of a Connectivity output
+
+    The points are grouped by RegionId with one sort, and reduced per group.
+
+    @input: (npoints, 3) points, (npoints,) point RegionIds, number of regions
+    @output: (nRegions, 6) bounds (x0, x1, y0, y1, z0, z1) and (nRegions, 3) centroids.
+             NaN for regions without points.
+    """
+    regionIds = np.asarray(regionIds).astype(np.int64).ravel()
+    order = np.argsort(regionIds, kind='stable')
+    sortedIds = regionIds[order]
+    sortedPoints = np.asarray(points, dtype=np.float64)[order]
+
+    starts = np.searchsorted(sortedIds, np.arange(nRegions), side='left')
+    counts = np.searchsorted(sortedIds, np.arange(nRegions), side='right') - starts
+    present = counts > 0
+
+    bounds = np.full((nRegions, 6), np.nan)
+    centroids = np.full((nRegions, 3), np.nan)
+    if np.any(present):
+        ## NOTE: reduceat needs non-empty segments, so empty regions are skipped
+        starts = starts[present]
+        bounds[present, 0::2] = np.minimum.reduceat(sortedPoints, starts, axis=0)
+        bounds[present, 1::2] = np.maximum.reduceat(sortedPoints, starts, axis=0)
+        centroids[present] = np.add.reduceat(sortedPoints, starts, axis=0) / counts[present, None]
+
+    return bounds, centroids
+
+def fit_spheres(points, regionIds, nRegions):
+    """
+    Algebraic least-squares sphere fit for every region of a Connectivity output
+
+    |p|^2 = 2 c.p + (r^2 - |c|^2) is linear in the center c and d = r^2 - |c|^2,
+    so every region is a small (4 x 4) normal equation. They are assembled with
+    grouped sums over RegionId and solved all at once. Points are centered on
+    their region's centroid and scaled to unit size first, for conditioning.
+
+    @input: (npoints, 3) points, (npoints,) point RegionIds, number of regions
+    @output: (nRegions, 4) fitted spheres (x, y, z, r) and (nRegions,) RMS distance
+             of the points to the fitted sphere, relative to r. NaN for regions
+             with fewer than 4 points or no unique fit (e.g. planar surfaces).
+    """
+    points = np.asarray(points, dtype=np.float64)
+    regionIds = np.asarray(regionIds).astype(np.int64).ravel()
+    _, centroids = region_bounds(points, regionIds, nRegions)
+
+    counts = np.bincount(regionIds, minlength=nRegions)
+    local = points - centroids[regionIds]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        scale = np.sqrt(np.bincount(regionIds, np.sum(local**2, axis=1), minlength=nRegions) / counts)
+        q = local / scale[regionIds, None]
+
+    A = np.column_stack([2*q, np.ones(len(q))])
+    b = np.sum(q**2, axis=1)
+
+    AtA = np.empty((nRegions, 4, 4))
+    Atb = np.empty((nRegions, 4))
+    for k in range(4):
+        Atb[:, k] = np.bincount(regionIds, A[:, k] * b, minlength=nRegions)
+        for l in range(k, 4):
+            AtA[:, k, l] = AtA[:, l, k] = np.bincount(regionIds, A[:, k] * A[:, l], minlength=nRegions)
+
+    spheres = np.full((nRegions, 4), np.nan)
+    residuals = np.full(nRegions, np.nan)
+
+    regular = (counts >= 4) & (scale > 0)
+    regular[regular] = np.linalg.cond(AtA[regular]) < 1e12
+    if not np.any(regular):
+        return spheres, residuals
+
+    solution = np.linalg.solve(AtA[regular], Atb[regular][..., None])[..., 0]
+    center = solution[:, :3]
+    r2 = solution[:, 3] + np.sum(center**2, axis=1)
+    with np.errstate(invalid='ignore'):
+        spheres[regular, :3] = centroids[regular] + center * scale[regular, None]
+        spheres[regular, 3] = np.sqrt(r2) * scale[regular]
+
+    distance = np.linalg.norm(points - spheres[regionIds, :3], axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        error = ((distance - spheres[regionIds, 3]) / spheres[regionIds, 3])**2
+        residuals[regular] = np.sqrt(np.bincount(regionIds, error, minlength=nRegions) / counts)[regular]
+
+    return spheres, residuals
@@ -1,6 +1,7 @@
 from paraview.simple import *
 
-from paravision.utils import csvWriter, read_files, get_bounds, get_volume
+from paravision.utils import csvWriter, read_files, get_bounds, get_volume, fetch_mesh
+from paravision.shells import shell_radii, annulus_fragments
 from paravision.integrate import integrate
 from paravision.project import projector
 
@@ -10,9 +11,10 @@ from addict import Dict
 
 from rich import print, print_json
 
-from math import sqrt, pi
+from math import pi
+import numpy as np
 
-def radial_porosity_profile(reader, nrad, shelltype, projectargs, output_prefix=None):
+def radial_porosity_profile(reader, nrad, shelltype, projectargs, output_prefix=None, engine='binned'):
     nRegions = nrad
     shellType = shelltype
 
@@ -30,18 +32,10 @@ def radial_porosity_profile(reader, nrad, shelltype, projectargs, output_prefix=
     print('Bounds: ',*(xmin,xmax,ymin,ymax,zmin,zmax))
     Hide(projection, view)
 
-    nShells = nRegions + 1 #Including r = 0
-    rShells = []
-
     R = (xmax - xmin + ymax - ymin)/4
     print("R:", R)
 
-    if shellType == 'EQUIVOLUME':
-        for n in range(nShells):
-            rShells.append(R * sqrt(n/nRegions))
-    elif shellType == 'EQUIDISTANT':
-        for n in range(nShells):
-            rShells.append(R * (n/nRegions))
+    rShells = shell_radii(R, nRegions, shellType)
 
     print("rShells:", rShells)
 
@@ -51,30 +45,41 @@ def radial_porosity_profile(reader, nrad, shelltype, projectargs, output_prefix=
 
     porosity_profile = []
 
-    for radIn, radOut in zip(rShells[:-1], rShells[1:]+rShells[:0]):
+    if engine == 'binned':
+        ## Volume of every shell from the annulus fragments, in one sweep
+        mesh = fetch_mesh(projection)
+        fragments = annulus_fragments(mesh.points, mesh.connectivity, mesh.offsets, mesh.types, rShells)
+        shell_volumes = np.bincount(fragments.shells, weights=fragments.measures, minlength=nRegions)
+
+        for radIn, radOut, int_volume in zip(rShells[:-1], rShells[1:], shell_volumes):
+            ## WARNING: Assumes cylinder
+            full_volume = (zmax - zmin) * pi * (radOut**2 - radIn**2)
+            porosity_profile.append( int_volume/ full_volume )
+    else:
+        for radIn, radOut in zip(rShells[:-1], rShells[1:]+rShells[:0]):
 
-        # radAvg.append( (radIn + radOut) / 2 )
+            # radAvg.append( (radIn + radOut) / 2 )
 
-        clipOuter = Clip(Input=projection)
-        clipOuter.ClipType = 'Cylinder'
-        clipOuter.ClipType.Axis = [0.0, 0.0, 1.0]
-        clipOuter.ClipType.Radius = radOut
-        Hide3DWidgets(proxy=clipOuter.ClipType)
+            clipOuter = Clip(Input=projection)
+            clipOuter.ClipType = 'Cylinder'
+            clipOuter.ClipType.Axis = [0.0, 0.0, 1.0]
+            clipOuter.ClipType.Radius = radOut
+            Hide3DWidgets(proxy=clipOuter.ClipType)
 
-        clipInner = Clip(Input=clipOuter)
-        clipInner.ClipType = 'Cylinder'
-        clipInner.ClipType.Axis = [0.0, 0.0, 1.0]
-        clipInner.ClipType.Radius = radIn
-        clipInner.Invert = 0
+            clipInner = Clip(Input=clipOuter)
+            clipInner.ClipType = 'Cylinder'
+            clipInner.ClipType.Axis = [0.0, 0.0, 1.0]
+            clipInner.ClipType.Radius = radIn
+            clipInner.Invert = 0
 
-        int_volume = get_volume(clipInner)
-        ## WARNING: Assumes cylinder
-        full_volume = (zmax - zmin) * pi * (radOut**2 - radIn**2)
+            int_volume = get_volume(clipInner)
+            ## WARNING: Assumes cylinder
+            full_volume = (zmax - zmin) * pi * (radOut**2 - radIn**2)
 
-        porosity_profile.append( int_volume/ full_volume )
+            porosity_profile.append( int_volume/ full_volume )
 
-        Delete(clipInner)
-        Delete(clipOuter)
+            Delete(clipInner)
+            Delete(clipOuter)
 
     print(porosity_profile)
     csvWriter(f'porosity_profile_{shelltype}_{nrad}_{output_prefix}.csv', radAvg, porosity_profile)
@@ -87,6 +92,7 @@ def radial_porosity_parser(args, local_args_list):
 
     ap.add_argument("-nr", "--nrad", type=int, help="Radial discretization size for shell chromatograms. Also see --shelltype")
     ap.add_argument("-st", "--shelltype", choices = ['EQUIDISTANT', 'EQUIVOLUME'], help="Radial shell discretization type. See --nrad")
+    ap.add_argument("--engine", choices=['binned', 'clip'], help="binned: cut cells against all shells in one sweep. clip: Clip + IntegrateVariables per shell.")
 
     print(local_args_list)
 
@@ -109,4 +115,4 @@ if __name__=="__main__":
     print_json(data=args)
 
     reader = read_files(args['FILES'], filetype=args['filetype'])
-    radial_porosity_profile(reader, args.nrad, args.shelltype, args.project, args.output_prefix )
+    radial_porosity_profile(reader, args.nrad, args.shelltype, args.project, args.output_prefix, args.engine or 'binned')
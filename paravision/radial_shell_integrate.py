@@ -4,10 +4,14 @@ from paravision import ConfigHandler
 from paravision.integrate import integrate
 from paravision.project import projector
 from paravision.utils import csvWriter, read_files, get_bounds, script_main_new, default_parser
+from paravision.utils import fetch_mesh, number_of_processes
+from paravision.shells import shell_radii, shell_operator
+from paravision.operators import cached_operator
+from paravision.checkpoint import checkpoint_store
+from paravision.timesteps import TimeSteps
 from paravision.defaults import DEFAULT_CONFIG
 
 from addict import Dict
-from math import sqrt
 from rich import print, print_json
 import argparse
 import numpy as np
@@ -21,8 +25,12 @@ def radial_shell_integrate(reader, **args):
     normalize = args.get('normalize', DEFAULT_CONFIG.normalize)
     output_prefix = args.get('output_prefix', DEFAULT_CONFIG.output_prefix)
     _project = args.get('project', DEFAULT_CONFIG.project) 
+    ## NOTE: The binned engine gathers the mesh and the point data of every
+    ## timestep on the client, which doesn't scale under MPI. Parallel runs
+    ## default to the clip engine, which integrates on the ranks.
+    engine = args.get('engine') or ('binned' if number_of_processes() == 1 else 'clip')
+    prefetch = args.get('prefetch', DEFAULT_CONFIG.prefetch)
 
-    timeKeeper = GetTimeKeeper()
     timeArray = reader.TimestepValues
     nts = len(timeArray) or 1
 
@@ -43,77 +51,83 @@ def radial_shell_integrate(reader, **args):
     print('Bounds: ',*(xmin,xmax,ymin,ymax,zmin,zmax))
     Hide(projection, view)
 
-    nShells = nRegions + 1 #Including r = 0
-    rShells = []
-
     R = (xmax - xmin + ymax - ymin)/4
     print("R:", R)
     print("zdelta:", zmax - zmin)
 
-    if shellType == 'EQUIVOLUME':
-        for n in range(nShells):
-            rShells.append(R * sqrt(n/nRegions))
-    elif shellType == 'EQUIDISTANT':
-        for n in range(nShells):
-            rShells.append(R * (n/nRegions))
+    rShells = shell_radii(R, nRegions, shellType)
 
     print("rShells:", rShells)
 
+    if engine == 'binned':
+        ## Label the cells (and their clipped fragments) with shells once. The
+        ## geometry doesn't change between timesteps.
+        mesh = fetch_mesh(projection)
+        operator = cached_operator(mesh, f"shells_{rShells}",
+                                   lambda m: shell_operator(m.points, m.connectivity, m.offsets, m.types, rShells),
+                                   args.get('operator_cache'))
+        shell_volumes = operator.measures()
+        print("Shell volumes:", shell_volumes)
+
     radAvg = []
     for radIn, radOut in zip(rShells[:-1], rShells[1:]+rShells[:0]):
         radAvg.append( (radIn + radOut) / 2 )
 
-    values_all = []
-    if args.get('load_checkpoint', False):
-        if args.get('checkpoint_file', None):
-            values_all, = np.load(args.get('checkpoint_file'), allow_pickle=True).tolist()
-            print(f"Loaded {args.get('checkpoint_file')}")
-            print(values_all)
-        else:
-            raise ValueError("No checkpoint file specified!")
+    checkpoint = checkpoint_store(args, 'radial_shell_integrate', nts,
+                                  scalars=list(scalars), rShells=rShells, normalize=normalize, project=_project)
 
+    timesteps = TimeSteps(projection, timeArray, prefetch, checkpoint, point_arrays=list(scalars) if engine == 'binned' else None)
+
+    values_all = []
     for timestep in range(nts):
-        if timestep < len(values_all):
-            ## skip until the end. Useful when checkpointing
-            print(f"Skipping timestep {timestep}...")
+        if checkpoint and checkpoint.skip(timestep):
+            continue
+
+        if checkpoint and checkpoint.done(timestep):
+            print(f"Loading checkpointed timestep {timestep}...")
+            values_all.append(checkpoint.load(timestep).tolist())
             continue
 
-        try: 
-            timeKeeper.Time = timestep
-            projection.UpdatePipeline(timeArray[timestep])
-        except IndexError: 
-            print(f"INDEX ERROR WITH TIMESTEP: {timestep}. Ignore this if we only have 1 timestep.")
-            pass
+        timesteps.update(timestep)
 
         print("===============")
         print("its:", timestep)
 
-        values_radial_zone = []
-        # radAvg = []
+        if engine == 'binned':
+            values_radial_zone = integrate_shells(operator, shell_volumes, timesteps.point_data(), normalize)
+        else:
+            values_radial_zone = []
+            # radAvg = []
 
-        for radIn, radOut in zip(rShells[:-1], rShells[1:]+rShells[:0]):
-            clipOuter = Clip(Input=projection)
-            clipOuter.ClipType = 'Cylinder'
-            clipOuter.ClipType.Axis = [0.0, 0.0, 1.0]
-            clipOuter.ClipType.Radius = radOut
-            Hide3DWidgets(proxy=clipOuter.ClipType)
+            for radIn, radOut in zip(rShells[:-1], rShells[1:]+rShells[:0]):
+                clipOuter = Clip(Input=projection)
+                clipOuter.ClipType = 'Cylinder'
+                clipOuter.ClipType.Axis = [0.0, 0.0, 1.0]
+                clipOuter.ClipType.Radius = radOut
+                Hide3DWidgets(proxy=clipOuter.ClipType)
 
-            clipInner = Clip(Input=clipOuter)
-            clipInner.ClipType = 'Cylinder'
-            clipInner.ClipType.Axis = [0.0, 0.0, 1.0]
-            clipInner.ClipType.Radius = radIn
-            clipInner.Invert = 0
+                clipInner = Clip(Input=clipOuter)
+                clipInner.ClipType = 'Cylinder'
+                clipInner.ClipType.Axis = [0.0, 0.0, 1.0]
+                clipInner.ClipType.Radius = radIn
+                clipInner.Invert = 0
 
-            values_scalars = integrate(clipInner, scalars, normalize=normalize)[0]
+                values_scalars = integrate(clipInner, scalars, normalize=normalize)[0]
 
-            Delete(clipInner)
-            Delete(clipOuter)
+                Delete(clipInner)
+                Delete(clipOuter)
 
-            values_radial_zone.append(values_scalars)
+                values_radial_zone.append(values_scalars)
 
-        if args.get('checkpoint_file'):
-            np.save(args.get('checkpoint_file'), values_all)
         values_all.append(values_radial_zone)
+        if checkpoint:
+            checkpoint.save(timestep, values_radial_zone)
+
+    timesteps.close()
+
+    if checkpoint and checkpoint.worker:
+        ## NOTE: Outputs are written by the merge run once all workers are done
+        return
 
     values_all = np.array(values_all) * args.get('scale', 1.0)
 
@@ -132,6 +146,22 @@ def radial_shell_integrate(reader, **args):
             for i, scalar in enumerate(scalars): 
                 csvWriter(f'radial_shell_integrate_time_{scalar}_{rad}_{output_prefix}.csv', timeArray, map(lambda x: x[rad][i], values_all))
 
+def integrate_shells(operator, shell_volumes, point_values, normalize=None):
+    """ Integrate all scalars over all shells in one pass using a precomputed shell operator
+
+    point_values: (npoints, nscalars) values of the scalars at the mesh points
+    Returns a list (nshells) of lists (nscalars), same as the Clip based loop.
+    """
+    values = operator.apply(point_values)
+
+    ## IntegrateVariables gives Volume for 3D cells and Area for 2D cells
+    if normalize == operator.measure_name:
+        values = values / shell_volumes[:, None]
+    elif normalize in ['Volume', 'Area']:
+        print("".join(["Cannot normalize by ", normalize, ". No such CellData!"]))
+
+    return values.tolist()
+
 def radial_shell_integrate_parser(local_args_list):
     ap = default_parser()
 
@@ -141,14 +171,20 @@ def radial_shell_integrate_parser(local_args_list):
     ap.add_argument("-n", "--normalize", default='NoNorm', choices = ['NoNorm', 'Volume', 'Area'], help="Normalization for integration. Divides integrated result by Volume or Area")
     ap.add_argument("--scale", type=float, default=1.0, help="Scale factor applied after integration.")
     ap.add_argument("--divide-by-length", action="store_true", help="Divide result by object length in z-direction. To calculate average flux in z-dir.")
-    ap.add_argument("--checkpoint-file", help="checkpoint file to load from. (Stores current state)")
-    ap.add_argument("--load-checkpoint", action="store_true", help="Load checkpoint from file. See --checkpoint-file")
+    ap.add_argument("--engine", choices=['binned', 'clip'], help="binned: label cells with shells once and integrate all shells in one pass, but the mesh and the point data of every timestep are gathered on the client. clip: Clip + IntegrateVariables per shell, on the ranks. Default: binned in serial runs, clip in parallel runs.")
+
+    ## NOTE: Replaced by the per-timestep store of --checkpoint-dir. Kept only to point old scripts there.
+    ap.add_argument("--checkpoint-file", help="Deprecated. Use --checkpoint-dir.")
+    ap.add_argument("--load-checkpoint", action="store_true", help="Deprecated. Use --checkpoint-dir, which resumes automatically.")
 
     print(local_args_list)
     args = ap.parse_args(local_args_list)
+    if args.checkpoint_file or args.load_checkpoint:
+        ap.error("--checkpoint-file and --load-checkpoint were removed. Use --checkpoint-dir <directory> instead: "
+                 "it saves every timestep as soon as it's done, and reruns with the same directory resume from there.")
     args = Dict(vars(args))
     print_json(data=args)
     return args
 
 if __name__=="__main__":
-    script_main_new(radial_shell_integrate_parser, radial_shell_integrate)
+    script_main_new(radial_shell_integrate_parser, radial_shell_integrate, implicit_arrays=[])
@@ -0,0 +1,200 @@
+"""
+Persistent interpolation maps between meshes.
+
+ResampleWithDataset locates every destination point in the source mesh and
+interpolates the source point data there, on every run. Both meshes are fixed
+though (e.g. the flowfield mesh and the mass transport mesh of a column), so
+the point location only has to be done once: for every destination point, the
+source cell containing it and the interpolation weights of the cell's points.
+That is stored as a sparse (ndestination x nsource) map W, keyed by the
+fingerprints of both meshes, and resampling any point data is W @ values.
+
+Maps are built with one vtkProbeFilter pass (vtkStaticCellLocator) and cached
+like integration operators (see paravision.operators.cached_operator).
+
+The resampled data is served to the pipeline from this process, so in
+parallel runs resample_with_dataset() falls back to ResampleWithDataset.
+"""
+
+import numpy as np
+from rich import print
+
+from vtkmodules.numpy_interface import dataset_adapter as dsa
+import vtk.util.numpy_support as ns #type:ignore
+
+from paravision.operators import IntegrationOperator, cached_operator, mesh_fingerprint
+
+## NOTE: ParaView is imported where it's used, so that the interpolation
+## maps can be built (and tested) with plain VTK.
+
+## Number of points of the VTK simplex cell types (vertex, line, triangle, tetra)
+SIMPLEX_POINTS = { 1: 1, 3: 2, 5: 3, 10: 4 }
+
+CELL_ID = 'paravision_cell_id'
+
+def barycentric(vertices, points):
+    """ Barycentric coordinates (m, k) of points (m, 3) in simplices with vertices (m, k, 3)
+
+    For triangles and lines in 3D, these are the coordinates of the points
+    projected onto them, as with vtkCell.EvaluatePosition.
+    """
+    if vertices.shape[1] == 1:
+        return np.ones((len(points), 1))
+    edges = vertices[:, 1:] - vertices[:, :1]
+    gram = edges @ edges.transpose(0, 2, 1)
+    rhs = edges @ (points - vertices[:, 0])[..., None]
+    coordinates = np.linalg.solve(gram, rhs)[..., 0]
+    return np.column_stack([1 - coordinates.sum(axis=1), coordinates])
+
+def locate_points(source, points):
+    """ Id of the source cell containing every point, and whether it was found at all
+
+    A single vtkProbeFilter pass, probing an array of cell ids.
+    """
+    from vtkmodules.vtkCommonCore import vtkPoints
+    from vtkmodules.vtkCommonDataModel import vtkPolyData, vtkStaticCellLocator
+    from vtkmodules.vtkFiltersCore import vtkProbeFilter
+
+    ## NOTE: Cell data of the probe source is passed on as the value of the cell containing each point
+    probed = source.NewInstance()
+    probed.CopyStructure(source)
+    cell_ids = ns.numpy_to_vtkIdTypeArray(np.arange(source.GetNumberOfCells(), dtype=ns.get_numpy_array_type(ns.VTK_ID_TYPE)), deep=1)
+    cell_ids.SetName(CELL_ID)
+    probed.GetCellData().AddArray(cell_ids)
+
+    destination = vtkPolyData()
+    destination.SetPoints(vtkPoints())
+    destination.GetPoints().SetData(ns.numpy_to_vtk(points, deep=1))
+
+    ## NOTE: The tolerance is computed by the probe filter from the source cells,
+    ## same as the defaults of ResampleWithDataset, which parallel runs fall back to.
+    probe = vtkProbeFilter()
+    probe.SetInputData(destination)
+    probe.SetSourceData(probed)
+    probe.SetCellLocatorPrototype(vtkStaticCellLocator())
+    probe.ComputeToleranceOn()
+    probe.Update()
+
+    output = probe.GetOutput().GetPointData()
+    found = ns.vtk_to_numpy(output.GetArray(probe.GetValidPointMaskArrayName())).astype(bool)
+    cells = ns.vtk_to_numpy(output.GetArray(CELL_ID)).astype(np.int64)
+    return cells, found
+
+def interpolation_map(source, points, mesh=None):
+    """ Sparse (npoints x nsource) interpolation map from the points of a vtk dataset
+
+    source: vtkDataSet the data is interpolated from
+    points: (npoints, 3) destination points
+    mesh: mesh_arrays(source), if already at hand
+
+    The weights in simplices are solved for all points at once. Points in
+    other cells (hexahedra, wedges, quads...) use the cell's EvaluatePosition.
+    Points outside the source mesh get no weights, i.e. resample to 0, as
+    with ResampleWithDataset.
+    """
+    from vtkmodules.vtkCommonCore import reference
+    from vtkmodules.vtkCommonDataModel import vtkGenericCell
+
+    points = np.ascontiguousarray(points, dtype=np.float64)
+    if mesh is None:
+        from paravision.utils import mesh_arrays
+        mesh = mesh_arrays(source)
+    cells, found = locate_points(source, points)
+    located = np.flatnonzero(found)
+
+    ## NOTE: mesh_arrays() only has the polygons of polydata, whose cell ids
+    ## then don't match if there are verts or lines too.
+    types = mesh.types[cells[located]] if len(mesh.types) == source.GetNumberOfCells() else np.zeros(len(located), dtype=np.uint8)
+
+    rows, cols, vals = [], [], []
+    for vtk_type, npts in SIMPLEX_POINTS.items():
+        index = located[types == vtk_type]
+        if not len(index):
+            continue
+        ids = mesh.connectivity[mesh.offsets[cells[index]][:, None] + np.arange(npts)]
+        rows.append(np.repeat(index, npts))
+        cols.append(ids.ravel())
+        vals.append(barycentric(mesh.points[ids], points[index]).ravel())
+
+    others = located[~np.isin(types, list(SIMPLEX_POINTS))]
+    if len(others):
+        cell = vtkGenericCell()
+        closest = [0.0, 0.0, 0.0]
+        subId = reference(0)
+        pcoords = [0.0, 0.0, 0.0]
+        dist2 = reference(0.0)
+        weights = [0.0] * source.GetMaxCellSize()
+        for index in others.tolist():
+            source.GetCell(int(cells[index]), cell)
+            cell.EvaluatePosition(points[index].tolist(), closest, subId, pcoords, dist2, weights)
+            npts = cell.GetNumberOfPoints()
+            rows.append(np.full(npts, index))
+            cols.append([ cell.GetPointId(i) for i in range(npts) ])
+            vals.append(weights[:npts])
+
+    print(f"Located {len(located)}/{len(points)} points in the source mesh")
+
+    concat = lambda arrays, dtype: np.concatenate(arrays).astype(dtype) if arrays else np.zeros(0, dtype=dtype)
+    return IntegrationOperator(concat(rows, np.int64), concat(cols, np.int64), concat(vals, np.float64),
+                               len(points), source.GetNumberOfPoints(), dim=0)
+
+## Resampled point data for the filters made by resample_with_dataset(), keyed by filter
+_RESAMPLED = {}
+
+def resample_with_dataset(source, destination, cache_dir=None):
+    """ Same as ResampleWithDataset(SourceDataArrays=source, DestinationMesh=destination)
+
+    The interpolation map is built once per pair of meshes, and stored in
+    cache_dir if given. The output is the destination with all point arrays
+    of the source, plus vtkValidPointMask.
+
+    The resampled arrays live in this process, which the satellite ranks of
+    a parallel run can't reach. Parallel runs use ResampleWithDataset.
+    """
+    from paraview.simple import ResampleWithDataset, ProgrammableFilter, servermanager
+    from paravision.utils import fetch_mesh, mesh_arrays, number_of_processes
+
+    if number_of_processes() > 1:
+        print("[yellow]Parallel run: resampling with ResampleWithDataset instead of a cached interpolation map[/yellow]")
+        resampled = ResampleWithDataset(registrationName='resampled_flow', SourceDataArrays=source, DestinationMesh=destination)
+        resampled.CellLocator = 'Static Cell Locator'
+        return resampled
+
+    source_data = servermanager.Fetch(source)
+    source_mesh = mesh_arrays(source_data)
+    destination_mesh = fetch_mesh(destination)
+
+    operator = cached_operator(destination_mesh, f"resample_{mesh_fingerprint(source_mesh)}",
+                               lambda m: interpolation_map(source_data, m.points, source_mesh),
+                               cache_dir)
+
+    source_data = dsa.WrapDataObject(source_data)
+    arrays = { name: operator.apply(np.asarray(source_data.PointData[name])) for name in source_data.PointData.keys() }
+
+    valid = np.zeros(operator.nzones, dtype=np.uint8)
+    valid[operator.nonempty] = 1
+    arrays['vtkValidPointMask'] = valid
+
+    key = f"{mesh_fingerprint(destination_mesh)}_{len(_RESAMPLED)}"
+    _RESAMPLED[key] = arrays
+
+    resampled = ProgrammableFilter(registrationName='resampled_flow', Input=destination)
+    resampled.Script = f"from paravision.resample import request_data; request_data(self, {key!r})"
+    return resampled
+
+def request_data(algorithm, key):
+    """ RequestData of resample_with_dataset(): destination geometry plus the resampled arrays """
+    arrays = _RESAMPLED[key]
+
+    output = algorithm.GetOutputDataObject(0)
+    output.ShallowCopy(algorithm.GetInputDataObject(0, 0))
+    output.GetPointData().Initialize()
+
+    npoints = output.GetNumberOfPoints()
+    if npoints != len(arrays['vtkValidPointMask']):
+        raise ValueError(f"Resampled data is for {len(arrays['vtkValidPointMask'])} points, got {npoints}. Resampling requires a serial run.")
+
+    for name, values in arrays.items():
+        array = ns.numpy_to_vtk(values, deep=1)
+        array.SetName(name)
+        output.GetPointData().AddArray(array)
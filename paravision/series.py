@@ -0,0 +1,240 @@
+"""
+Consolidated time-series store.
+
+A solver run writes one .pvtu (plus pieces) per timestep, and every file
+repeats the same points and connectivity. convert_series() ingests such a
+series into a single HDF5 file where the geometry is stored once and every
+point data array is one compressed dataset of shape (nts, npoints, ...),
+chunked by (time, points):
+
+    /times                      (nts,)
+    /files                      (nts,) source filenames
+    /geometry/points            (npoints, 3)
+    /geometry/connectivity      (nconnectivity,)
+    /geometry/offsets           (ncells+1,)
+    /geometry/types             (ncells,)
+    /point_data/<name>          (nts, npoints[, ncomponents])
+
+read_files(..., filetype='h5') reads it as a time series in ParaView through a
+ProgrammableSource. open_series() gives plain NumPy access without ParaView.
+
+The ParaView source is serial-only: the whole grid is produced on piece 0 and
+the other pieces of a parallel run are left empty. The VTK geometry is built
+once per file, and only the point data arrays change between timesteps.
+
+Requires h5py.
+"""
+
+import argparse
+from pathlib import Path
+
+from addict import Dict
+import numpy as np
+
+from paravision.vtkxml import SeriesReader
+
+## NOTE: h5py is optional. It's only needed to write or read series files.
+try:
+    import h5py
+except ImportError:
+    h5py = None
+
+SERIES_FORMAT = 'paravision-series'
+SERIES_VERSION = 1
+
+CHUNK_POINTS = 65536
+
+def _require_h5py():
+    if h5py is None:
+        raise ImportError("h5py is required for series files. Please install it with `pip install h5py`.")
+
+def convert_series(files, output, point_arrays=None, compression='gzip'):
+    """ Convert a time series of .vtu/.pvtu files into one series file
+
+    files: ordered list of files, one per timestep (see utils.find_files)
+    point_arrays: names of the point arrays to store. None stores all.
+
+    All timesteps must share the geometry of the first one.
+    """
+    _require_h5py()
+
+    reader = SeriesReader(files, point_arrays, cell_arrays=[])
+    first = reader.read(0)
+    reader.point_arrays = list(first.point_data.keys())
+    npoints = len(first.points)
+    nts = len(files)
+    chunk_points = min(npoints, CHUNK_POINTS) or 1
+
+    with h5py.File(output, 'w') as h5:
+        h5.attrs['format'] = SERIES_FORMAT
+        h5.attrs['version'] = SERIES_VERSION
+
+        geometry = h5.create_group('geometry')
+        for key in ['points', 'connectivity', 'offsets', 'types']:
+            geometry.create_dataset(key, data=np.asarray(first[key]), compression=compression)
+
+        times = h5.create_dataset('times', shape=(nts,), dtype='f8')
+        h5.create_dataset('files', data=[ str(ifile) for ifile in files ], dtype=h5py.string_dtype())
+
+        point_data = h5.create_group('point_data')
+        for name, values in first.point_data.items():
+            shape = (nts,) + values.shape
+            chunks = (1, chunk_points) + values.shape[1:]
+            point_data.create_dataset(name, shape=shape, dtype=values.dtype, chunks=chunks, compression=compression, shuffle=True)
+
+        for timestep, ifile in enumerate(files):
+            print(f"Converting timestep {timestep}: {ifile}")
+            mesh = first if timestep == 0 else reader.read(timestep)
+
+            if timestep and not same_geometry(first, mesh):
+                raise ValueError(f"{ifile}: Geometry differs from {files[0]}. Series files store the geometry only once.")
+
+            times[timestep] = mesh.field_data.TimeValue[0] if 'TimeValue' in mesh.field_data else timestep
+            for name, values in mesh.point_data.items():
+                point_data[name][timestep] = values
+
+    print(f"Wrote {nts} timesteps to {output}")
+
+def same_geometry(mesh, other):
+    ## NOTE: Geometry reused by the SeriesReader is the same object
+    return all( mesh[key] is other[key] or np.array_equal(mesh[key], other[key]) for key in ['points', 'connectivity', 'offsets', 'types'] )
+
+class Series:
+    """ NumPy access to a series file
+
+    mesh: Dict(points, connectivity, offsets, types), read once
+    times: (nts,) time values
+    point_arrays: names of the stored point arrays
+    """
+
+    def __init__(self, filename):
+        _require_h5py()
+        self.filename = filename
+        self.h5 = h5py.File(filename, 'r')
+
+        if self.h5.attrs.get('format') != SERIES_FORMAT:
+            raise ValueError(f"{filename}: Not a paravision series file")
+
+        self.mesh = Dict({ key: self.h5['geometry'][key][...] for key in self.h5['geometry'] })
+        self.times = self.h5['times'][...]
+        self.point_arrays = list(self.h5['point_data'].keys())
+
+    def __len__(self):
+        return len(self.times)
+
+    def read(self, timestep, names=None):
+        """ Point data arrays of one timestep as a Dict """
+        names = self.point_arrays if names is None else names
+        return Dict({ name: self.h5['point_data'][name][timestep] for name in names })
+
+    def close(self):
+        self.h5.close()
+
+def open_series(filename):
+    return Series(filename)
+
+_SERIES = {}
+
+def _cached_series(filename):
+    """ Keep series files open across pipeline updates, so the geometry is read only once """
+    if filename not in _SERIES:
+        _SERIES[filename] = Series(filename)
+    return _SERIES[filename]
+
+def series_source(filename, point_arrays=None):
+    """ ParaView source for a series file. Used by utils.read_files_inner for filetype 'h5' """
+    from paraview.simple import ProgrammableSource
+
+    filename = str(Path(filename).resolve())
+    source = ProgrammableSource()
+    source.OutputDataSetType = 'vtkUnstructuredGrid'
+    source.ScriptRequestInformation = f"from paravision.series import request_information; request_information(self, {filename!r})"
+    source.Script = f"from paravision.series import request_data; request_data(self, {filename!r}, {point_arrays!r})"
+    source.UpdatePipelineInformation()
+
+    ## NOTE: Plugins fall back to reader.PointArrayStatus when no --scalars are given
+    source.add_attribute('PointArrayStatus', point_arrays or _cached_series(filename).point_arrays)
+    return source
+
+## Geometry of the series files as vtkUnstructuredGrid, keyed by filename
+_GEOMETRY = {}
+
+def _cached_geometry(filename):
+    """ Points and cells of a series file as a vtkUnstructuredGrid, built only once """
+    if filename not in _GEOMETRY:
+        from vtkmodules.vtkCommonCore import vtkPoints
+        from vtkmodules.vtkCommonDataModel import vtkCellArray, vtkUnstructuredGrid
+        import vtk.util.numpy_support as ns #type:ignore
+
+        mesh = _cached_series(filename).mesh
+        points = vtkPoints()
+        points.SetData(ns.numpy_to_vtk(mesh.points, deep=1))
+        cells = vtkCellArray()
+        cells.SetData(ns.numpy_to_vtkIdTypeArray(mesh.offsets.astype(ns.get_numpy_array_type(ns.VTK_ID_TYPE)), deep=1),
+                      ns.numpy_to_vtkIdTypeArray(mesh.connectivity.astype(ns.get_numpy_array_type(ns.VTK_ID_TYPE)), deep=1))
+
+        grid = vtkUnstructuredGrid()
+        grid.SetPoints(points)
+        grid.SetCells(ns.numpy_to_vtk(mesh.types.astype(np.uint8), deep=1), cells)
+        _GEOMETRY[filename] = grid
+    return _GEOMETRY[filename]
+
+def request_information(algorithm, filename):
+    """ RequestInformation of series_source(): advertise the timesteps """
+    series = _cached_series(filename)
+    executive = algorithm.GetExecutive()
+    outInfo = executive.GetOutputInformation(0)
+
+    outInfo.Remove(executive.TIME_STEPS())
+    for time in series.times:
+        outInfo.Append(executive.TIME_STEPS(), time)
+
+    outInfo.Remove(executive.TIME_RANGE())
+    outInfo.Append(executive.TIME_RANGE(), series.times[0])
+    outInfo.Append(executive.TIME_RANGE(), series.times[-1])
+
+def request_data(algorithm, filename, point_arrays=None):
+    """ RequestData of series_source(): the cached geometry with the point data of the requested timestep """
+    from vtkmodules.vtkCommonDataModel import vtkUnstructuredGrid
+    import vtk.util.numpy_support as ns #type:ignore
+
+    series = _cached_series(filename)
+    executive = algorithm.GetExecutive()
+    outInfo = executive.GetOutputInformation(0)
+    output = vtkUnstructuredGrid.GetData(outInfo)
+
+    ## NOTE: Serial-only. In parallel runs the whole grid is produced on piece
+    ## 0 and the other pieces are empty, instead of every rank holding a copy.
+    if outInfo.Has(executive.UPDATE_PIECE_NUMBER()) and outInfo.Get(executive.UPDATE_PIECE_NUMBER()) > 0:
+        return
+
+    timestep = 0
+    if outInfo.Has(executive.UPDATE_TIME_STEP()):
+        timestep = int(np.argmin(np.abs(series.times - outInfo.Get(executive.UPDATE_TIME_STEP()))))
+
+    ## NOTE: Shallow copy, so every timestep shares the points and cells
+    output.ShallowCopy(_cached_geometry(filename))
+    output.GetPointData().Initialize()
+
+    for name, values in series.read(timestep, point_arrays).items():
+        array = ns.numpy_to_vtk(values, deep=1)
+        array.SetName(name)
+        output.GetPointData().AddArray(array)
+
+    output.GetInformation().Set(output.DATA_TIME_STEP(), series.times[timestep])
+
+def convert_series_parser():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-o", "--output", default='series.h5', help="Output series file")
+    ap.add_argument("-s", "--scalars", nargs='*', help="Point arrays to store. Default: all")
+    ap.add_argument("-f", "--filetype", default='pvtu', choices=['vtu', 'pvtu'], help="Filetype to look for if no FILES are given")
+    ap.add_argument("--compression", default='gzip', help="HDF5 compression filter")
+    ap.add_argument("FILES", nargs='*', help="files..")
+    return Dict(vars(ap.parse_args()))
+
+if __name__=="__main__":
+    from paravision.utils import find_files
+
+    args = convert_series_parser()
+    files, _ = find_files(args.FILES, args.filetype)
+    convert_series(files, args.output, point_arrays=args.scalars, compression=args.compression)
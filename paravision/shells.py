@@ -0,0 +1,562 @@
+"""
+Radial shell binning engine.
+
+Replaces the per-shell, per-timestep Clip/Clip/IntegrateVariables round trips
+with a sparse operator (paravision.operators.IntegrationOperator) that is
+assembled once from the mesh geometry:
+
+    shell_integrals = operator @ point_data
+
+Cells are split into simplices (tetrahedra for 3D cells, triangles for 2D
+cells), labeled with the shell(s) they touch, and simplices crossing shell
+boundaries are cut into annulus fragments the way a cylinder Clip cuts them:
+the implicit function r^2 - R^2 is evaluated at the points and interpolated
+linearly inside the cell. Since IntegrateVariables integrates the linearly
+interpolated point data, the fragment weights reproduce the Clip pair results.
+"""
+
+import numpy as np
+from math import sqrt
+from addict import Dict
+
+## VTK cell types
+VTK_TRIANGLE = 5
+VTK_POLYGON = 7
+VTK_PIXEL = 8
+VTK_QUAD = 9
+VTK_TETRA = 10
+VTK_VOXEL = 11
+VTK_HEXAHEDRON = 12
+VTK_WEDGE = 13
+VTK_PYRAMID = 14
+
+## Decomposition of linear 3D cells into tetrahedra (local point indices)
+## NOTE: Same as vtkCell::Triangulate(1, ...), which IntegrateVariables
+## (vtkIntegrateAttributes) uses. The integral of the linearly interpolated
+## point data depends on the split of cells with non-planar faces, so any
+## other split would differ from the pipeline results on distorted meshes.
+TET_DECOMPOSITION = {
+    VTK_TETRA      : [[0, 1, 2, 3]],
+    VTK_VOXEL      : [[0, 1, 2, 4], [1, 4, 5, 7], [1, 4, 7, 2], [1, 2, 7, 3], [2, 7, 6, 4]],
+    VTK_HEXAHEDRON : [[0, 1, 3, 4], [1, 4, 5, 6], [1, 4, 6, 3], [1, 3, 6, 2], [3, 6, 7, 4]],
+    VTK_WEDGE      : [[0, 1, 2, 3], [1, 4, 5, 3], [1, 3, 5, 2]],
+    VTK_PYRAMID    : [[0, 1, 3, 4], [1, 2, 3, 4]],
+}
+
+## Decomposition of linear 2D cells into triangles, as vtkCell::Triangulate(1, ...). Polygons are fanned.
+TRI_DECOMPOSITION = {
+    VTK_TRIANGLE : [[0, 1, 2]],
+    VTK_PIXEL    : [[0, 1, 2], [1, 3, 2]],
+    VTK_QUAD     : [[0, 1, 2], [0, 2, 3]],
+}
+
+def shell_radii(R, nRegions, shellType='EQUIDISTANT'):
+    """ Radii of the shell boundaries (including r = 0) for the given shell type
+    """
+    nShells = nRegions + 1 #Including r = 0
+    rShells = []
+
+    if shellType == 'EQUIVOLUME':
+        for n in range(nShells):
+            rShells.append(R * sqrt(n/nRegions))
+    elif shellType == 'EQUIDISTANT':
+        for n in range(nShells):
+            rShells.append(R * (n/nRegions))
+
+    return rShells
+
+def _decompose(connectivity, offsets, types, decomposition):
+    simplices = []
+    parents = []
+    for celltype, local_ids in decomposition.items():
+        cell_ids = np.flatnonzero(types == celltype)
+        if len(cell_ids) == 0:
+            continue
+        starts = offsets[cell_ids]
+        for local in local_ids:
+            simplices.append(connectivity[starts[:, None] + np.array(local)[None, :]])
+            parents.append(cell_ids)
+    return simplices, parents
+
+def simplices(connectivity, offsets, types):
+    """ Split the cells of a mesh into simplices
+
+    offsets must have ncells + 1 entries, starting at 0 (vtkCellArray layout).
+    If the mesh has supported 3D cells, they are split into tetrahedra and 2D
+    cells are ignored (as IntegrateVariables does for the Volume). Otherwise 2D
+    cells are split into triangles.
+
+    Returns (simplices, parent cell ids, dimension)
+    """
+    tets, parents = _decompose(connectivity, offsets, types, TET_DECOMPOSITION)
+    if len(tets):
+        return np.concatenate(tets), np.concatenate(parents), 3
+
+    tris, parents = _decompose(connectivity, offsets, types, TRI_DECOMPOSITION)
+
+    ## Fan triangulation of polygons, grouped by number of points
+    polygon_ids = np.flatnonzero(types == VTK_POLYGON)
+    counts = offsets[polygon_ids + 1] - offsets[polygon_ids]
+    for npts in np.unique(counts):
+        cell_ids = polygon_ids[counts == npts]
+        starts = offsets[cell_ids]
+        for i in range(1, npts - 1):
+            tris.append(connectivity[starts[:, None] + np.array([0, i, i + 1])[None, :]])
+            parents.append(cell_ids)
+
+    if len(tris):
+        return np.concatenate(tris), np.concatenate(parents), 2
+
+    raise ValueError("No supported cells found. The shell binning engine requires linear 2D or 3D cells.")
+
+def tetrahedralize(connectivity, offsets, types):
+    """ Split all supported 3D cells into tetrahedra
+
+    Returns an (ntets, 4) array of point ids. Cells of other types are ignored.
+    """
+    tets, _ = _decompose(connectivity, offsets, types, TET_DECOMPOSITION)
+    if len(tets) == 0:
+        return np.zeros((0, 4), dtype=np.int64)
+    return np.concatenate(tets)
+
+def simplex_measures(points, simplices):
+    """ Unsigned volumes (tetrahedra) or areas (triangles)
+    """
+    p0 = points[simplices[:, 0]]
+    d1 = points[simplices[:, 1]] - p0
+    d2 = points[simplices[:, 2]] - p0
+    if simplices.shape[1] == 4:
+        d3 = points[simplices[:, 3]] - p0
+        return np.abs(np.einsum('ij,ij->i', d1, np.cross(d2, d3))) / 6
+    else:
+        return np.linalg.norm(np.cross(d1, d2), axis=1) / 2
+
+def _subsimplex_weights(L):
+    """ Point weights of sub-simplices given in barycentric coordinates
+
+    L: (n, k, k) array, rows are the sub-simplex vertices in terms of the
+    parent simplex vertices. Returns (n, k) integrals of the parent hat
+    functions over the sub-simplex, as a fraction of the parent measure.
+    """
+    k = L.shape[1]
+    return np.abs(np.linalg.det(L))[:, None] * L.sum(axis=1) / k
+
+def level_weights(s, level):
+    """ Integrals of the hat functions over {s <= level} for every simplex
+
+    s: (n, k) values of a linear function at the vertices of n tetrahedra
+    (k = 4) or triangles (k = 3). level: scalar or (n,) array.
+
+    Returns (n, k) weights, as fractions of the simplex measure, such that
+    measure * weights @ u_vertices is the integral of the linearly
+    interpolated u over the part of the simplex where s <= level.
+    """
+    n, k = s.shape
+    level = np.broadcast_to(np.asarray(level, dtype=np.float64), (n,))
+
+    order = np.argsort(s, axis=1)
+    ss = np.take_along_axis(s, order, axis=1)
+    nbelow = np.sum(ss <= level[:, None], axis=1)
+
+    wsorted = np.zeros((n, k))
+    wsorted[nbelow == k] = 1 / k
+
+    eye = np.eye(k)
+
+    def vertex(i, m):
+        return np.broadcast_to(eye[i], (m, k))
+
+    def edge_point(i, j, sm, lm):
+        ## Point on edge i->j where the linear function equals the level
+        t = (lm - sm[:, i]) / (sm[:, j] - sm[:, i])
+        return (1 - t)[:, None] * eye[i] + t[:, None] * eye[j]
+
+    ## First vertex below: small simplex at vertex 0
+    m = nbelow == 1
+    if np.any(m):
+        sm, lm = ss[m], level[m]
+        L = np.stack([vertex(0, len(sm))] + [ edge_point(0, j, sm, lm) for j in range(1, k) ], axis=1)
+        wsorted[m] = _subsimplex_weights(L)
+
+    ## All but the last vertex below: full simplex minus small simplex at the last vertex
+    m = nbelow == k - 1
+    if np.any(m):
+        sm, lm = ss[m], level[m]
+        L = np.stack([vertex(k - 1, len(sm))] + [ edge_point(k - 1, j, sm, lm) for j in range(k - 1) ], axis=1)
+        wsorted[m] = 1 / k - _subsimplex_weights(L)
+
+    ## Tetrahedra with two vertices below: prism between the edge 0-1 and the cut plane
+    m = nbelow == 2
+    if k == 4 and np.any(m):
+        sm, lm = ss[m], level[m]
+        v0 = vertex(0, len(sm))
+        v1 = edge_point(0, 2, sm, lm)
+        v2 = edge_point(0, 3, sm, lm)
+        v3 = vertex(1, len(sm))
+        v4 = edge_point(1, 2, sm, lm)
+        v5 = edge_point(1, 3, sm, lm)
+        wsorted[m] = _subsimplex_weights(np.stack([v0, v1, v2, v5], axis=1)) \
+                   + _subsimplex_weights(np.stack([v0, v1, v5, v4], axis=1)) \
+                   + _subsimplex_weights(np.stack([v0, v4, v5, v3], axis=1))
+
+    weights = np.zeros((n, k))
+    np.put_along_axis(weights, order, wsorted, axis=1)
+
+    return weights
+
+def _annulus_sweep(s, rShells):
+    """ Cut simplices with vertex values s = r^2 against all shell boundaries at once
+
+    Returns (simplex index, shell index, weights) per fragment, with weights
+    as fractions of the simplex measure.
+    """
+    smin = s.min(axis=1)
+    smax = s.max(axis=1)
+
+    levels = np.array(rShells, dtype=np.float64)**2
+    nshells = len(rShells) - 1
+
+    ## Range of shells touched by each simplex
+    first = np.clip(np.searchsorted(levels, smin, side='right') - 1, 0, None)
+    last = np.minimum(np.searchsorted(levels, smax, side='left') - 1, nshells - 1)
+    last = np.maximum(last, first)
+    nfrag = np.where(first < nshells, last - first + 1, 0)
+
+    frag_simplex = np.repeat(np.arange(len(s)), nfrag)
+    frag_shell = first[frag_simplex] + np.arange(len(frag_simplex)) - np.repeat(np.cumsum(nfrag) - nfrag, nfrag)
+
+    ## Fragments of simplices that don't cross a boundary get the full simplex
+    k = s.shape[1]
+    weights = np.full((len(frag_simplex), k), 1 / k)
+
+    lo = levels[frag_shell]
+    hi = levels[frag_shell + 1]
+    fs = s[frag_simplex]
+    cut_hi = hi < smax[frag_simplex]
+    cut_lo = lo > smin[frag_simplex]
+
+    weights[cut_hi] = level_weights(fs[cut_hi], hi[cut_hi])
+    weights[cut_lo] -= level_weights(fs[cut_lo], lo[cut_lo])
+
+    return frag_simplex, frag_shell, weights
+
+def annulus_fragments(points, connectivity, offsets, types, rShells, axis_origin=(0.0, 0.0)):
+    """ Cut the cells of a mesh against a set of concentric cylinders in one sweep
+
+    Shells are cylinders along z around axis_origin, bounded by consecutive
+    entries of rShells. Parts of cells outside rShells[-1] are dropped, as
+    with the outer Clip.
+
+    Returns a Dict of per-fragment arrays:
+        cells    : parent cell id
+        shells   : shell index
+        point_ids: (nfrag, k) point ids of the parent simplex
+        weights  : (nfrag, k) integrals of the point hat functions over the
+                   fragment. (weights * values[point_ids]).sum(axis=1)
+                   integrates the interpolated point data.
+        measures : fragment volume (3D) or area (2D)
+        dim      : 3 or 2
+    """
+    simplex_ids, parents, dim = simplices(connectivity, offsets, types)
+    measures = simplex_measures(points, simplex_ids)
+
+    r2 = (points[:, 0] - axis_origin[0])**2 + (points[:, 1] - axis_origin[1])**2
+
+    frag_simplex, frag_shell, weights = _annulus_sweep(r2[simplex_ids], rShells)
+
+    weights = weights * measures[frag_simplex, None]
+
+    return Dict(
+        cells     = parents[frag_simplex],
+        shells    = frag_shell,
+        point_ids = simplex_ids[frag_simplex],
+        weights   = weights,
+        measures  = weights.sum(axis=1),
+        dim       = dim,
+    )
+
+def _prism(a0, a1, a2, b0, b1, b2):
+    ## Tetrahedra of the prism with triangles (a0, a1, a2), (b0, b1, b2) and edges ai-bi
+    return [ np.stack(tet, axis=1) for tet in [(a0, a1, a2, b2), (a0, a1, b2, b1), (a0, b1, b2, b0)] ]
+
+def split_simplices(B, f, level):
+    """ Split simplices into the parts below and above a level of a linear function
+
+    B: (n, k, k) sub-simplex vertices in barycentric coordinates of the parent
+    simplex. f: (n, k) values of the linear function at the sub-simplex
+    vertices.
+
+    Returns (B_below, index_below, B_above, index_above), where index maps the
+    resulting sub-simplices to the rows of B.
+    """
+    n, k, _ = B.shape
+
+    order = np.argsort(f, axis=1)
+    fs = np.take_along_axis(f, order, axis=1)
+    Bs = np.take_along_axis(B, order[:, :, None], axis=1)
+    nbelow = np.sum(fs <= level, axis=1)
+
+    ## Simplices touching the level only at a face, edge or vertex aren't split
+    nbelow[fs[:, -1] <= level] = k
+    nbelow[(fs[:, 0] >= level) & (fs[:, -1] > level)] = 0
+
+    below = [ (B[nbelow == k], np.flatnonzero(nbelow == k)) ]
+    above = [ (B[nbelow == 0], np.flatnonzero(nbelow == 0)) ]
+
+    def vertex(i, Bm):
+        return Bm[:, i]
+
+    def edge_point(i, j, fm, Bm):
+        t = (level - fm[:, i]) / (fm[:, j] - fm[:, i])
+        return (1 - t)[:, None] * Bm[:, i] + t[:, None] * Bm[:, j]
+
+    for nb in range(1, k):
+        idx = np.flatnonzero(nbelow == nb)
+        if len(idx) == 0:
+            continue
+        fm, Bm = fs[idx], Bs[idx]
+        v = [ vertex(i, Bm) for i in range(k) ]
+        p = { (i, j): edge_point(i, j, fm, Bm) for i in range(nb) for j in range(nb, k) }
+
+        if k == 3:
+            if nb == 1:
+                parts_below = [ np.stack([v[0], p[0, 1], p[0, 2]], axis=1) ]
+                parts_above = [ np.stack([p[0, 1], v[1], v[2]], axis=1), np.stack([p[0, 1], v[2], p[0, 2]], axis=1) ]
+            else:
+                parts_below = [ np.stack([v[0], v[1], p[1, 2]], axis=1), np.stack([v[0], p[1, 2], p[0, 2]], axis=1) ]
+                parts_above = [ np.stack([v[2], p[0, 2], p[1, 2]], axis=1) ]
+        else:
+            if nb == 1:
+                parts_below = [ np.stack([v[0], p[0, 1], p[0, 2], p[0, 3]], axis=1) ]
+                parts_above = _prism(p[0, 1], p[0, 2], p[0, 3], v[1], v[2], v[3])
+            elif nb == 2:
+                parts_below = _prism(v[0], p[0, 2], p[0, 3], v[1], p[1, 2], p[1, 3])
+                parts_above = _prism(v[2], p[0, 2], p[1, 2], v[3], p[0, 3], p[1, 3])
+            else:
+                parts_below = _prism(v[0], v[1], v[2], p[0, 3], p[1, 3], p[2, 3])
+                parts_above = [ np.stack([v[3], p[0, 3], p[1, 3], p[2, 3]], axis=1) ]
+
+        below.extend([ (part, idx) for part in parts_below ])
+        above.extend([ (part, idx) for part in parts_above ])
+
+    B_below = np.concatenate([ part for part, _ in below ])
+    index_below = np.concatenate([ idx for _, idx in below ])
+    B_above = np.concatenate([ part for part, _ in above ])
+    index_above = np.concatenate([ idx for _, idx in above ])
+
+    return B_below, index_below, B_above, index_above
+
+def zone_fragments(points, connectivity, offsets, types, zEdges, rShells, axis_origin=(0.0, 0.0)):
+    """ Cut the cells of a mesh into axial x radial zones
+
+    The cells are first split exactly at the axial zone boundaries zEdges (as
+    an exact Box Clip does), and the resulting pieces are then cut against the
+    cylinders rShells, with r^2 evaluated at the new points, as a Cylinder Clip
+    of the Box Clip output does. Parts outside [zEdges[0], zEdges[-1]] or
+    rShells[-1] are dropped.
+
+    Returns a Dict like annulus_fragments(), with an additional 'columns'
+    array holding the axial zone index of each fragment.
+    """
+    simplex_ids, parents, dim = simplices(connectivity, offsets, types)
+    measures = simplex_measures(points, simplex_ids)
+    n, k = simplex_ids.shape
+
+    ## Sub-simplices in barycentric coordinates of their parent simplex
+    B = np.broadcast_to(np.eye(k), (n, k, k))
+    owner = np.arange(n)
+
+    def physical(B, owner):
+        return np.einsum('nij,njd->nid', B, points[simplex_ids[owner]])
+
+    ## Drop everything below the first edge
+    z = physical(B, owner)[:, :, 2]
+    _, _, B, index = split_simplices(B, z, zEdges[0])
+    owner = owner[index]
+
+    columns = []
+    for col, zRight in enumerate(zEdges[1:]):
+        z = physical(B, owner)[:, :, 2]
+        B_col, index_col, B, index = split_simplices(B, z, zRight)
+        columns.append((col, B_col, owner[index_col]))
+        owner = owner[index]
+
+    cells, cols, shells, point_ids, weights = [], [], [], [], []
+    for col, B_col, owner_col in columns:
+        xyz = physical(B_col, owner_col)
+        s = (xyz[:, :, 0] - axis_origin[0])**2 + (xyz[:, :, 1] - axis_origin[1])**2
+
+        frag, frag_shell, w = _annulus_sweep(s, rShells)
+
+        ## Back from sub-simplex hat functions to the parent points
+        sub_measures = np.abs(np.linalg.det(B_col)) * measures[owner_col]
+        w = np.einsum('fi,fij->fj', w * sub_measures[frag, None], B_col[frag])
+
+        cells.append(parents[owner_col[frag]])
+        cols.append(np.full(len(frag), col))
+        shells.append(frag_shell)
+        point_ids.append(simplex_ids[owner_col[frag]])
+        weights.append(w)
+
+    weights = np.concatenate(weights)
+
+    return Dict(
+        cells     = np.concatenate(cells),
+        columns   = np.concatenate(cols),
+        shells    = np.concatenate(shells),
+        point_ids = np.concatenate(point_ids),
+        weights   = weights,
+        measures  = weights.sum(axis=1),
+        dim       = dim,
+    )
+
+## Cut edges of a tetrahedron with nbelow of its (sorted) vertices below a
+## plane, as triangles of the cross-section. Two vertices below give a quad.
+SLICE_TRIANGLES = {
+    1: [[(0, 1), (0, 2), (0, 3)]],
+    2: [[(0, 2), (0, 3), (1, 3)], [(0, 2), (1, 3), (1, 2)]],
+    3: [[(0, 3), (1, 3), (2, 3)]],
+}
+
+def slice_triangles(points, tets, z):
+    """ Cross-section of tetrahedra with the plane at z, as triangles
+
+    The vertices of the triangles are points on tetrahedron edges, as the
+    Slice filter makes them. Each one is given by the pair of mesh points of
+    its edge and the linear interpolation coefficients of the pair.
+
+    Returns (pairs (ntri, 3, 2), coefficients (ntri, 3, 2), coordinates (ntri, 3, 3))
+    """
+    s = points[tets, 2] - z
+    ## NOTE: Faces lying in the plane are taken from the tetrahedra above it.
+    ## At the top end of the mesh there are none, so take them from below.
+    if not np.any(s > 0):
+        s = -s
+    nbelow = np.sum(s <= 0, axis=1)
+    cut = (nbelow > 0) & (nbelow < 4)
+
+    order = np.argsort(s[cut], axis=1)
+    ids = np.take_along_axis(tets[cut], order, axis=1)
+    ss = np.take_along_axis(s[cut], order, axis=1)
+    nbelow = nbelow[cut]
+
+    pairs = []
+    coefficients = []
+    for n, triangles in SLICE_TRIANGLES.items():
+        m = nbelow == n
+        for triangle in triangles:
+            a = np.array([ edge[0] for edge in triangle ])
+            b = np.array([ edge[1] for edge in triangle ])
+            sa, sb = ss[m][:, a], ss[m][:, b]
+            t = sa / (sa - sb)
+            pairs.append(np.stack([ids[m][:, a], ids[m][:, b]], axis=2))
+            coefficients.append(np.stack([1 - t, t], axis=2))
+
+    pairs = np.concatenate(pairs)
+    coefficients = np.concatenate(coefficients)
+    coordinates = np.einsum('tvk,tvkx->tvx', coefficients, points[pairs])
+
+    return pairs, coefficients, coordinates
+
+def detector_fragments(points, connectivity, offsets, types, zPositions, rShells, axis_origin=(0.0, 0.0)):
+    """ Cross-sections of the 3D cells at several axial positions, cut into shells
+
+    Every position is a detector with nshells + 1 zones: the full
+    cross-section first, then the shells. Zone index is
+    detector * (nshells + 1) + zone.
+
+    Returns a Dict of per-fragment arrays:
+        zones       : zone index
+        pairs       : (nfrag, 3, 2) mesh point ids of the triangle vertices' edges
+        coefficients: (nfrag, 3, 2) interpolation coefficients of the pairs
+        weights     : (nfrag, 3) integrals of the triangle hat functions over the fragment
+    """
+    tets = tetrahedralize(connectivity, offsets, types)
+    nzones = len(rShells)
+
+    zones, pairs, coefficients, weights = [], [], [], []
+    for detector, z in enumerate(zPositions):
+        tri_pairs, tri_coefficients, xyz = slice_triangles(points, tets, z)
+        areas = np.linalg.norm(np.cross(xyz[:, 1] - xyz[:, 0], xyz[:, 2] - xyz[:, 0]), axis=1) / 2
+
+        ## Full cross-section
+        zones.append(np.full(len(areas), detector * nzones))
+        pairs.append(tri_pairs)
+        coefficients.append(tri_coefficients)
+        weights.append(np.repeat(areas[:, None] / 3, 3, axis=1))
+
+        ## Shells, with r^2 interpolated linearly on the triangles as a Clip of the slice does
+        r2 = (xyz[..., 0] - axis_origin[0])**2 + (xyz[..., 1] - axis_origin[1])**2
+        frag_tri, frag_shell, frag_weights = _annulus_sweep(r2, rShells)
+
+        zones.append(detector * nzones + 1 + frag_shell)
+        pairs.append(tri_pairs[frag_tri])
+        coefficients.append(tri_coefficients[frag_tri])
+        weights.append(frag_weights * areas[frag_tri, None])
+
+    return Dict(
+        zones        = np.concatenate(zones),
+        pairs        = np.concatenate(pairs),
+        coefficients = np.concatenate(coefficients),
+        weights      = np.concatenate(weights),
+    )
+
+def detector_operator(points, connectivity, offsets, types, zPositions, rShells, axis_origin=(0.0, 0.0), velocity=None):
+    """ Assemble the (ndetectors * (nshells + 1) x npoints) operator of detector_fragments()
+
+    Applying it to point data is equivalent to Slice at each position, then
+    IntegrateVariables on the full slice and on each shell of it. With a
+    velocity, the slice integrates the product of the interpolated velocity
+    and the interpolated point data, as a PythonCalculator after the Slice
+    does. measures() are then the flowrates through the zones.
+    """
+    from paravision.operators import IntegrationOperator
+
+    fragments = detector_fragments(points, connectivity, offsets, types, zPositions, rShells, axis_origin)
+    weights = fragments.weights
+    if velocity is not None:
+        weights = weights * np.sum(fragments.coefficients * velocity[fragments.pairs], axis=2)
+
+    return IntegrationOperator(
+            np.repeat(fragments.zones, 6),
+            fragments.pairs.ravel(),
+            (weights[..., None] * fragments.coefficients).ravel(),
+            len(zPositions) * len(rShells),
+            len(points),
+            2)
+
+def shell_operator(points, connectivity, offsets, types, rShells, axis_origin=(0.0, 0.0)):
+    """ Assemble the (nshells x npoints) integration operator for a mesh from its annulus fragments
+
+    Applying it to point data is equivalent to IntegrateVariables on each
+    radial shell. See paravision.operators.IntegrationOperator.
+    """
+    from paravision.operators import IntegrationOperator
+
+    fragments = annulus_fragments(points, connectivity, offsets, types, rShells, axis_origin)
+    k = fragments.point_ids.shape[1]
+    return IntegrationOperator(
+            np.repeat(fragments.shells, k),
+            fragments.point_ids.ravel(),
+            fragments.weights.ravel(),
+            len(rShells) - 1,
+            len(points),
+            fragments.dim)
+
+def zone_operator(points, connectivity, offsets, types, zEdges, rShells, axis_origin=(0.0, 0.0)):
+    """ Assemble the (ncol * nrad x npoints) integration operator for axial x radial zones
+
+    Zone index is col * nrad + rad, the GRM2D output ordering.
+    """
+    from paravision.operators import IntegrationOperator
+
+    fragments = zone_fragments(points, connectivity, offsets, types, zEdges, rShells, axis_origin)
+    k = fragments.point_ids.shape[1]
+    nrad = len(rShells) - 1
+    return IntegrationOperator(
+            np.repeat(fragments.columns * nrad + fragments.shells, k),
+            fragments.point_ids.ravel(),
+            fragments.weights.ravel(),
+            (len(zEdges) - 1) * nrad,
+            len(points),
+            fragments.dim)
@@ -0,0 +1,183 @@
+"""
+Time iteration over pipeline objects with background prefetching.
+
+Plugins loop over the timesteps of a reader and reduce each one (integrate,
+clip, render). Reading timestep t+1 used to start only once t was done.
+TimeSteps moves the pipeline to each timestep, same as
+
+    timeKeeper.Time = timestep
+    object.UpdatePipeline(timeArray[timestep])
+
+and, with prefetch > 0, meanwhile reads the files of the next timesteps on a
+background thread, so they are in the page cache when the pipeline gets to
+them. Of .vtu/.pvtu files with appended data, only the byte ranges of the
+arrays that will be used are read (see warm_file). Only the timesteps the
+loop will visit are read ahead, i.e. not those of other --time-partition
+workers or already checkpointed ones. The pipeline update itself has to stay
+on the main thread, since the ParaView server manager isn't thread safe.
+
+Prefetching is off by default, and always off in parallel runs: the ranks
+read their own pieces, possibly on other nodes, so reading whole .pvtu series
+here only multiplies the I/O.
+
+Loops that only need point data (point_arrays) read it with point_data().
+If the object is a .vtu/.pvtu reader in a serial run, the arrays are then
+decoded straight from the files by vtkxml.SeriesReader and the pipeline
+isn't updated at all. Otherwise they are fetched from the pipeline.
+"""
+
+import bisect
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+from paravision.vtkxml import SeriesReader, byte_ranges
+
+## NOTE: ParaView is imported where it's used, so that warm_file() and
+## prefetch_schedule() work (and are tested) without it.
+
+READ_SIZE = 1 << 22
+
+def source_files(object):
+    """ Files of the reader upstream of object, one entry per timestep """
+    proxy = object
+    while proxy is not None:
+        properties = proxy.ListProperties()
+        for name in ['FileName', 'FileNames']:
+            if name in properties:
+                files = proxy.GetPropertyValue(name)
+                return [files] if isinstance(files, str) else list(files)
+        inputs = proxy.Input if 'Input' in properties else None
+        proxy = inputs[0] if isinstance(inputs, list) else inputs
+    return []
+
+def series_reader(object, ntimesteps, point_arrays):
+    """ SeriesReader for the point arrays of object, if it's a serial .vtu/.pvtu reader with one file per timestep """
+    from paravision.utils import number_of_processes
+    if number_of_processes() > 1 or not any( name in object.ListProperties() for name in ['FileName', 'FileNames'] ):
+        return None
+    files = source_files(object)
+    if len(files) != ntimesteps or any( Path(file).suffix not in ['.vtu', '.pvtu'] for file in files ):
+        return None
+    return SeriesReader(files, point_arrays, cell_arrays=[])
+
+def warm_file(filename, point_arrays=None, geometry=True):
+    """ Read the parts of a file (and the pieces of a .pvtu) that the reader will use into the page cache
+
+    Of .vtu/.pvtu files with appended data, only the XML header and the byte
+    ranges of the selected point arrays (and of the geometry, if the pipeline
+    reads it) are read. See vtkxml.byte_ranges(). Files with inline data and
+    other formats are read whole, since their readers parse all of them.
+    """
+    path = Path(filename)
+    if path.suffix in ['.vtu', '.pvtu']:
+        ranges = byte_ranges(path, point_arrays, geometry)
+    else:
+        ranges = [ (path, 0, path.stat().st_size) ]
+
+    buffer = bytearray(READ_SIZE)
+    for path, start, end in ranges:
+        with open(path, 'rb', buffering=0) as f:
+            if hasattr(os, 'posix_fadvise'):
+                os.posix_fadvise(f.fileno(), start, end - start, os.POSIX_FADV_WILLNEED)
+            f.seek(start)
+            while start < end:
+                nbytes = f.readinto(memoryview(buffer)[:min(READ_SIZE, end - start)])
+                if not nbytes:
+                    break
+                start += nbytes
+
+def prefetch_schedule(visit, timestep, prefetch):
+    """ Timesteps to read ahead when the loop gets to timestep: the next prefetch ones it will visit """
+    position = bisect.bisect_right(visit, timestep)
+    return visit[position:position+prefetch]
+
+class TimeSteps:
+    """ Timesteps of a pipeline object, prefetching the files of the next ones
+
+    prefetch: number of timesteps to read ahead. 0 disables prefetching.
+    checkpoint: CheckpointStore of the loop. Timesteps it skips or has done
+                are not visited, so they aren't read ahead either.
+    point_arrays: point arrays returned by point_data(). Given only by loops
+                  that need nothing else from the pipeline, since the files
+                  may then be read directly, without updating it.
+
+    Iterate to visit the timesteps, or call update(timestep) for each of
+    self.visit in loops that also handle the others (e.g. load checkpoints).
+    """
+
+    def __init__(self, object, timeArray=None, prefetch=0, checkpoint=None, point_arrays=None):
+        from paraview.simple import GetTimeKeeper
+        from paravision.utils import number_of_processes
+
+        self.object = object
+        self.timeArray = list(object.TimestepValues if timeArray is None else timeArray)
+        self.timeKeeper = GetTimeKeeper()
+        self.prefetch = prefetch or 0
+        if self.prefetch and number_of_processes() > 1:
+            print("Prefetching is disabled in parallel runs")
+            self.prefetch = 0
+
+        self.visit = [ timestep for timestep in range(len(self))
+                       if not (checkpoint and (checkpoint.skip(timestep) or checkpoint.done(timestep))) ]
+
+        files = source_files(object) if self.prefetch else []
+        self.files = files if len(files) == len(self.timeArray) else []
+        self.pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='prefetch') if self.files else None
+        self.scheduled = {}
+
+        self.point_arrays = point_arrays
+        self.series = series_reader(object, len(self.timeArray), point_arrays) if point_arrays and self.timeArray else None
+        self.timestep = None
+
+    def __len__(self):
+        return len(self.timeArray) or 1
+
+    def __iter__(self):
+        for timestep in self.visit:
+            self.update(timestep)
+            yield timestep
+        self.close()
+
+    def update(self, timestep):
+        """ Move the pipeline to the timestep """
+        self._schedule(prefetch_schedule(self.visit, timestep, self.prefetch))
+
+        ## NOTE: No need to wait for a prefetch still in flight. The reader
+        ## then simply shares the pages that are already cached.
+        self.scheduled.pop(timestep, None)
+
+        ## NOTE: Without a time array the object is left as it is, e.g. a
+        ## clip of an object that's already at the current timestep.
+        self.timeKeeper.Time = timestep
+        self.timestep = timestep
+        if self.timeArray and self.series is None:
+            self.object.UpdatePipeline(self.timeArray[timestep])
+
+    def point_data(self):
+        """ point_arrays at the current timestep as columns of an (npoints, len(point_arrays)) array """
+        if self.series is None:
+            from paravision.utils import fetch_point_arrays
+            return fetch_point_arrays(self.object, self.point_arrays)
+        data = self.series.read(self.timestep).point_data
+        return np.column_stack([ np.asarray(data[name], dtype=np.float64) for name in self.point_arrays ])
+
+    def _schedule(self, timesteps):
+        if self.pool is None:
+            return
+        for timestep in timesteps:
+            if timestep < len(self.files) and timestep not in self.scheduled:
+                ## NOTE: The files are read by SeriesReader (the point arrays, geometry only
+                ## while it changes) or by the pipeline (whichever arrays its reader selects)
+                if self.series is not None:
+                    self.scheduled[timestep] = self.pool.submit(warm_file, self.files[timestep], self.point_arrays, False)
+                else:
+                    self.scheduled[timestep] = self.pool.submit(warm_file, self.files[timestep])
+
+    def close(self):
+        if self.pool is not None:
+            for future in self.scheduled.values():
+                future.cancel()
+            self.pool.shutdown(wait=False)
+            self.pool = None
@@ -10,6 +10,8 @@ from addict import Dict
 from rich import print, print_json
 
 from vtkmodules.numpy_interface import dataset_adapter as dsa
+import vtk.util.numpy_support as ns #type:ignore
+import numpy as np
 
 from rich import print
 
@@ -171,6 +173,65 @@ def get_volume(object):
     Delete(integrated)
     return int_volume
 
+def fetch_mesh(object):
+    """ Fetch the geometry of an unstructured dataset (or polydata) as numpy arrays
+
+    Returns a Dict with points (npoints, 3), connectivity, offsets (ncells + 1,
+    starting at 0) and VTK cell types. In parallel runs, Fetch appends the
+    pieces on the client, so the point ordering is the same at every timestep.
+    """
+    return mesh_arrays(servermanager.Fetch(object))
+
+def mesh_arrays(data):
+    """ Geometry of a vtkUnstructuredGrid or vtkPolyData as numpy arrays. See fetch_mesh() """
+    points = ns.vtk_to_numpy(data.GetPoints().GetData()).astype(np.float64)
+
+    if data.IsA('vtkPolyData'):
+        ## NOTE: Only polygons are considered. Slices and extracted surfaces have no verts/lines of interest.
+        cells = data.GetPolys()
+        connectivity = ns.vtk_to_numpy(cells.GetConnectivityArray()).astype(np.int64)
+        offsets = ns.vtk_to_numpy(cells.GetOffsetsArray()).astype(np.int64)
+        counts = np.diff(offsets)
+        types = np.where(counts == 3, 5, np.where(counts == 4, 9, 7)).astype(np.uint8)
+    else:
+        cells = data.GetCells()
+        connectivity = ns.vtk_to_numpy(cells.GetConnectivityArray()).astype(np.int64)
+        offsets = ns.vtk_to_numpy(cells.GetOffsetsArray()).astype(np.int64)
+        types = ns.vtk_to_numpy(data.GetCellTypesArray()).astype(np.uint8)
+
+    return Dict(points=points, connectivity=connectivity, offsets=offsets, types=types)
+
+_POINT_ARRAY_FILTERS = {}
+
+def point_array_filter(object, names):
+    """ Filters that reduce object to the given point arrays, cached per (object, names)
+
+    Only the arrays are moved to the client then. The geometry is fetched once
+    by fetch_mesh() and reused through the cached operators.
+    """
+    key = (object.GetGlobalIDAsString(), tuple(names))
+    if key not in _POINT_ARRAY_FILTERS:
+        passed = PassArrays(Input=object, PointDataArrays=list(names), CellDataArrays=[], FieldDataArrays=[])
+        if number_of_processes() == 1:
+            ## NOTE: A table of the point data drops the geometry too. In parallel runs, the
+            ## pieces are appended as datasets instead, so that the point ordering is the
+            ## same as in fetch_mesh().
+            passed = ProgrammableFilter(Input=passed, OutputDataSetType='vtkTable',
+                    Script="self.GetOutputDataObject(0).GetRowData().ShallowCopy(self.GetInputDataObject(0, 0).GetPointData())")
+        _POINT_ARRAY_FILTERS[key] = passed
+    return _POINT_ARRAY_FILTERS[key]
+
+def fetch_point_arrays(object, names):
+    """ Fetch the given point data arrays of object as columns of a (npoints, len(names)) array
+    """
+    data = servermanager.Fetch(point_array_filter(object, names))
+    arrays = data.GetRowData() if data.IsA('vtkTable') else data.GetPointData()
+    return np.column_stack([ ns.vtk_to_numpy(arrays.GetArray(name)).astype(np.float64) for name in names ])
+
+def number_of_processes():
+    """ Number of MPI ranks of the ParaView server (1 in serial runs) """
+    return servermanager.vtkProcessModule.GetProcessModule().GetNumberOfLocalPartitions()
+
 # TODO: remove dependence on args. See also handle_coloring()
 def save_screenshot(object, view, scalar, args, filename:str='screenshot.png' ): 
     display = Show(object, view)
@@ -233,20 +294,21 @@ def load_scientific_colormaps():
     for filename in filenames:
         preset = find_preset(filename, score_cutoff=100)
 
-def read_files(files, filetype='pvtu', standalone=False):
+def read_files(files, filetype='pvtu', standalone=False, point_arrays=None):
     """ Read the given list of files 
 
     standalone: bool => if true, reads files individually instead of serially
     filetype: default filetype to read. If files is [], look for files of this extension in current dir.
+    point_arrays: list of point data arrays to load. None loads all of them.
     """
     assert isinstance(files, list)
     files, filetype = find_files(files, filetype)
 
     if standalone:
-        readers = [ read_files_inner(ifile, filetype) for ifile in files ]
+        readers = [ read_files_inner(ifile, filetype, point_arrays) for ifile in files ]
         return readers
     else:
-        reader =  read_files_inner(files, filetype)
+        reader =  read_files_inner(files, filetype, point_arrays)
         return reader
 
 def find_files(files, filetype='pvtu'):
@@ -273,7 +335,7 @@ def find_files(files, filetype='pvtu'):
 
     return files, filetype
 
-def read_files_inner(files, filetype):
+def read_files_inner(files, filetype, point_arrays=None):
     reader=None
 
     if filetype == 'xdmf':
@@ -286,12 +348,48 @@ def read_files_inner(files, filetype):
         reader = LegacyVTKReader(FileNames=files)
     elif filetype == 'pvd':
         reader = PVDReader(FileName=files)
+    elif filetype == 'h5':
+        ## NOTE: Consolidated series file, see paravision.series
+        from paravision.series import series_source
+        files = files if isinstance(files, list) else [files]
+        if len(files) > 1:
+            print(f"[bold yellow]Only reading the first series file: {files[0]}[/bold yellow]")
+        return series_source(files[0], point_arrays)
     else:
         print(f"Unsupported File Format! ({filetype})")
         raise(ValueError)
+
+    if point_arrays is not None:
+        select_point_arrays(reader, point_arrays)
     
     return reader
 
+def select_point_arrays(reader, names):
+    """ Make the reader load only the given point data arrays
+
+    Names the files don't contain are reported and ignored. Readers without an
+    array selection (e.g. legacy vtk) load everything.
+    """
+    for prop in ['PointArrayStatus', 'PointArrays']:
+        if prop in reader.ListProperties():
+            available = getattr(reader, prop).Available
+            missing = [ name for name in names if name not in available ]
+            if missing:
+                print(f"[bold yellow]Point arrays not found in files: {missing}[/bold yellow]")
+            setattr(reader, prop, [ name for name in names if name in available ])
+            print(f"Loading point arrays: {getattr(reader, prop)}")
+            return
+
+def required_point_arrays(scalars, implicit=[]):
+    """ Point arrays a plugin needs: the given --scalars plus the ones it always uses
+
+    Returns None, i.e. load all arrays, when no scalars are given, since
+    plugins then fall back to processing every array in the files.
+    """
+    if not scalars:
+        return None
+    return list(dict.fromkeys([*scalars, *implicit]))
+
 # TODO: remove plugin names from args
 # TODO: remove plugin specific args (like --flow)
 def parse_cmdline_args():
@@ -325,6 +423,11 @@ def parse_cmdline_args():
 
     ap.add_argument("-st"  , "--shelltype", choices = ['EQUIDISTANT', 'EQUIVOLUME'], default='EQUIDISTANT', help="Shell discretization type. See --nrad")
     ap.add_argument("-nr"  , "--nrad", type=int, default=5, help="Radial discretization in particular plugins")
+    ap.add_argument("--engine", choices=['binned', 'clip'], help="Zonal integration engine for --grm2d: single-pass sparse operator (binned), which gathers the mesh and point data on the client, or nested clip filters (clip), which integrate on the ranks. Default: binned in serial runs, clip in parallel runs.")
+    ap.add_argument("--operator-cache", help="Directory to cache precomputed integration operators between runs")
+    ap.add_argument("--checkpoint-dir", help="Directory to store per-timestep results. Reruns resume at the first missing timestep.")
+    ap.add_argument("--time-partition", nargs=2, type=int, metavar=("RANK", "NPARTS"), help="Compute only every NPARTS-th timestep, starting at RANK, into --checkpoint-dir. Used by pvrun --ntime-parallel.")
+    ap.add_argument("--prefetch", type=int, default=0, help="Number of timesteps to read ahead in the background (serial runs only). 0 disables prefetching.")
 
     ap.add_argument("-cm", "--colormap", default='Viridis (matplotlib)', help="Show coordinate axis")
     ap.add_argument("-sa", "--show-axis", action='store_true', help="Show coordinate axis")
@@ -348,7 +451,7 @@ def parse_cmdline_args():
 
     ap.add_argument("-o", "--output-prefix", help="prefix for output filenames")
 
-    ap.add_argument("-f", "--filetype", default='pvtu', choices=['xdmf', 'vtu', 'vtk', 'pvtu', 'pvd'], help="filetype: xdmf | vtu | vtk | pvtu")
+    ap.add_argument("-f", "--filetype", default='pvtu', choices=['xdmf', 'vtu', 'vtk', 'pvtu', 'pvd', 'h5'], help="filetype: xdmf | vtu | vtk | pvtu | pvd | h5 (series file, see convert_series)")
     ap.add_argument("--standalone", action='store_true', help="Read files as separate standalone objects, not part of time series.")
 
     ap.add_argument("--append-datasets", action='store_true', help="Use AppendDatasets on standalone files before processing.")
@@ -458,7 +561,7 @@ def handle_coloring(object, display, scalar, args):
 
     return wLUT, wPWF
 
-def script_main_new(parser, driver):
+def script_main_new(parser, driver, implicit_arrays=None):
     """ A wrapper function to make it easy to write individual scripts"""
     config = ConfigHandler()
     args = config.load_and_parse_args(parser)
@@ -466,9 +569,9 @@ def script_main_new(parser, driver):
     print("[bold yellow]Final set of args:[/bold yellow]")
     print_json(data=args)
 
-    read_and_execute(args, driver)
+    read_and_execute(args, driver, implicit_arrays)
 
-def script_main(local_parser, local_driver):
+def script_main(local_parser, local_driver, implicit_arrays=None):
     """ A wrapper function to make it easy to write individual scripts"""
     config = ConfigHandler()
     args, local_args_list = config.parse_config_and_cmdline_args()
@@ -477,11 +580,19 @@ def script_main(local_parser, local_driver):
     print("[bold yellow]Final set of args:[/bold yellow]")
     print_json(data=args)
 
-    read_and_execute(args, local_driver)
+    read_and_execute(args, local_driver, implicit_arrays)
+
+def read_and_execute(args, driver, implicit_arrays=None):
+    """ Read args.FILES and run the driver on them
+
+    implicit_arrays: point arrays the driver uses besides --scalars. If given,
+    only --scalars and these are loaded. None loads all arrays, for drivers
+    that haven't declared what they use.
+    """
+    point_arrays = None if implicit_arrays is None else required_point_arrays(args.scalars, implicit_arrays)
 
-def read_and_execute(args, driver):
     if args['standalone']: 
-        readers = read_files(args['FILES'], filetype=args['filetype'], standalone=args['standalone'])
+        readers = read_files(args['FILES'], filetype=args['filetype'], standalone=args['standalone'], point_arrays=point_arrays)
 
         if args['append_datasets']:
             appended = AppendDatasets(Input=readers)
@@ -495,7 +606,7 @@ def read_and_execute(args, driver):
                 args['output_prefix'] = f"{Path(files[ind]).stem.strip()}_{_output_prefix}"
                 driver(ireader, **args)
     else: 
-        reader = read_files(args['FILES'], filetype=args['filetype'], standalone=args['standalone'])
+        reader = read_files(args['FILES'], filetype=args['filetype'], standalone=args['standalone'], point_arrays=point_arrays)
         driver(reader, **args)
 
 def extract_surface_with_aligned_normal(object, normal_dir:str='Z', value:float=1.0):
@@ -553,11 +664,16 @@ def default_parser():
     ap.add_argument("-g", "--geometry", nargs=2, type=int, help="Animation geometry size")
 
     ap.add_argument("-o", "--output-prefix", help="prefix for output filenames")
-    ap.add_argument("-f", "--filetype", choices=['xdmf', 'vtu', 'vtk', 'pvtu', 'pvd'], help="filetype: xdmf | vtu | vtk | pvtu")
+    ap.add_argument("-f", "--filetype", choices=['xdmf', 'vtu', 'vtk', 'pvtu', 'pvd', 'h5'], help="filetype: xdmf | vtu | vtk | pvtu | pvd | h5 (series file, see convert_series)")
 
     ap.add_argument("--standalone", action=argparse.BooleanOptionalAction, default=None, help="Read files as separate standalone objects, not part of time series.")
     ap.add_argument("--append-datasets", action=argparse.BooleanOptionalAction, default=None, help="Use AppendDatasets on standalone files before processing.")
 
+    ap.add_argument("--operator-cache", help="Directory to store precomputed integration operators for reuse across runs.")
+    ap.add_argument("--checkpoint-dir", help="Directory to store per-timestep results. Reruns resume at the first missing timestep.")
+    ap.add_argument("--time-partition", nargs=2, type=int, metavar=("RANK", "NPARTS"), help="Compute only every NPARTS-th timestep, starting at RANK, into --checkpoint-dir. Used by pvrun --ntime-parallel.")
+    ap.add_argument("--prefetch", type=int, default=0, help="Number of timesteps to read ahead in the background (serial runs only). 0 disables prefetching.")
+
     ap.add_argument("FILES", nargs='*', help="files..")
 
     return ap
@@ -1,8 +1,9 @@
 from paraview.simple import *
 
-from paravision.utils import read_files, csvWriter
+from paravision.utils import read_files, csvWriter, required_point_arrays, number_of_processes
 from paravision.integrate import integrate
 from paravision.project import projector
+from paravision.checkpoint import checkpoint_store
 
 # TODO: Update this with --integrate?
 
@@ -27,7 +28,18 @@ def volume_integral(reader, args):
     view = GetActiveViewOrCreate('RenderView')
     projection = projector(reader, *_project)
 
-    result = integrate(projection, scalars, normalize=args.normalize, timeArray=timeArray)
+    checkpoint = checkpoint_store(args, 'volume_integral', len(timeArray) or 1, scalars=list(scalars), normalize=args.normalize, project=_project)
+
+    ## NOTE: The operator engine fetches the point data of every timestep to
+    ## the client, which doesn't scale under MPI. Parallel runs default to
+    ## the pipeline, which integrates on the ranks.
+    engine = args.engine or ('pipeline' if number_of_processes() > 1 else 'operator')
+
+    result = integrate(projection, scalars, normalize=args.normalize, timeArray=timeArray, engine=engine, cache_dir=args.operator_cache, checkpoint=checkpoint)
+
+    if checkpoint and checkpoint.worker:
+        ## NOTE: Outputs are written by the merge run once all workers are done
+        return
 
     print(result)
     for i,scalar in enumerate(scalars):
@@ -40,6 +52,7 @@ def volume_integral_parser(args, local_args_list):
 
     ap = argparse.ArgumentParser()
     ap.add_argument("-n", "--normalize", choices = ['NoNorm', 'Volume', 'Area'], help="files..")
+    ap.add_argument("--engine", choices = ['operator', 'pipeline'], help="operator: precomputed quadrature weights reused across timesteps, but the point data of every timestep is gathered on the client. pipeline: IntegrateVariables per timestep, on the ranks. Default: operator in serial runs, pipeline in parallel runs.")
     ap.add_argument("FILES", nargs='*', help="files..")
 
     print(local_args_list)
@@ -64,7 +77,7 @@ if __name__=="__main__":
     print_json(data=args)
 
     if args['standalone']: 
-        readers = read_files(args['FILES'], filetype=args['filetype'], standalone=args['standalone'])
+        readers = read_files(args['FILES'], filetype=args['filetype'], standalone=args['standalone'], point_arrays=required_point_arrays(args['scalars']))
 
         if args['append_datasets']:
             appended = AppendDatasets(Input=readers)
@@ -78,5 +91,5 @@ if __name__=="__main__":
                 args['output_prefix'] = f"{Path(files[ind]).stem.strip()}_{_output_prefix}"
                 volume_integral(ireader, args)
     else: 
-        reader = read_files(args['FILES'], filetype=args['filetype'], standalone=args['standalone'])
+        reader = read_files(args['FILES'], filetype=args['filetype'], standalone=args['standalone'], point_arrays=required_point_arrays(args['scalars']))
         volume_integral(reader, args)
@@ -0,0 +1,467 @@
+"""
+ParaView-free reader for VTK XML unstructured grids (.vtu and .pvtu).
+
+Arrays are decoded straight into NumPy, without a pvpython session or a VTK
+pipeline. Supported are ascii, inline base64 ("binary") and appended data in
+raw or base64 encoding, UInt32 and UInt64 headers, both byte orders, and
+zlib or lzma compressed blocks.
+
+Files are memory mapped rather than read. Uncompressed arrays in appended raw
+encoding are returned as read-only numpy.memmap views at their byte offsets,
+so only the pages of the arrays actually used are read, and processes reading
+the same files share them through the page cache.
+
+The pieces of a .pvtu and the compressed blocks of large arrays are read and
+inflated on thread pools. zlib, lzma and lz4 release the GIL while working,
+so a single process uses all cores and the full disk bandwidth.
+
+Timesteps of a series usually share their geometry. With a GeometryCache
+(see SeriesReader), the geometry arrays of every piece are fingerprinted from
+the XML header, their appended data offsets and sizes and samples of their
+encoded bytes, without decoding them, and decoded only if the fingerprint
+differs from the cached one. Otherwise just the point and cell data of the
+timestep are read. The time loops of the plugins read through SeriesReader
+when they only need point data of a serial .vtu/.pvtu reader (see
+timesteps.TimeSteps), and convert_series() uses it as well.
+
+The mesh is returned in the same layout as utils.fetch_mesh(), so it can be
+used directly with the integration operators:
+
+    Dict(points, connectivity, offsets, types, point_data, cell_data, field_data)
+
+offsets has ncells+1 entries, starting at 0.
+"""
+
+import base64
+import hashlib
+import lzma
+import mmap
+import os
+import re
+import xml.etree.ElementTree as ET
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from addict import Dict
+import numpy as np
+
+VTK_TYPES = {
+        'Int8'   : 'i1', 'UInt8'  : 'u1',
+        'Int16'  : 'i2', 'UInt16' : 'u2',
+        'Int32'  : 'i4', 'UInt32' : 'u4',
+        'Int64'  : 'i8', 'UInt64' : 'u8',
+        'Float32': 'f4', 'Float64': 'f8',
+        }
+
+## NOTE: Decompressors are called with (block, uncompressed_size)
+DECOMPRESSORS = {
+        'vtkZLibDataCompressor': lambda block, size: zlib.decompress(block, bufsize=size),
+        'vtkLZMADataCompressor': lambda block, size: lzma.decompress(block),
+        }
+
+## NOTE: lz4 is optional. Without it, LZ4 compressed files raise NotImplementedError
+try:
+    import lz4.block
+    DECOMPRESSORS['vtkLZ4DataCompressor'] = lambda block, size: lz4.block.decompress(block, uncompressed_size=size)
+except ImportError:
+    pass
+
+NTHREADS = os.cpu_count() or 1
+
+_block_pool = None
+
+def block_pool():
+    """ Shared thread pool for inflating compressed blocks """
+    global _block_pool
+    if _block_pool is None:
+        _block_pool = ThreadPoolExecutor(max_workers=NTHREADS, thread_name_prefix='vtkxml_blocks')
+    return _block_pool
+
+def b64len(nbytes):
+    """ Number of base64 characters needed to encode nbytes """
+    return 4 * ((nbytes + 2) // 3)
+
+class VTKXMLFile:
+    """ Header and raw contents of one VTK XML file
+
+    Only the XML before <AppendedData> is parsed. The appended section may be
+    arbitrarily large binary data and is sliced at the array offsets instead.
+    """
+
+    def __init__(self, filename):
+        self.filename = Path(filename)
+        with open(self.filename, 'rb') as f:
+            self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        start = self.buffer.find(b'<AppendedData')
+        if start >= 0:
+            end = self.buffer.find(b'>', start)
+            self.appended_encoding = re.search(rb'encoding="(\w+)"', self.buffer[start:end+1]).group(1).decode()
+            self.appended_start = self.buffer.find(b'_', end) + 1
+            self.appended_end = self.buffer.rfind(b'</AppendedData>')
+            self.root = ET.fromstring(self.buffer[:start] + b'</VTKFile>')
+        else:
+            self.appended_encoding = None
+            self.appended_start = None
+            self.root = ET.fromstring(self.buffer[:])
+
+        self.appended_offsets = sorted(set( int(element.get('offset')) for element in self.root.iter('DataArray') if element.get('format') == 'appended' ))
+
+        endian = '<' if self.root.get('byte_order', 'LittleEndian') == 'LittleEndian' else '>'
+        self.endian = endian
+        self.header_dtype = np.dtype(endian + VTK_TYPES[self.root.get('header_type', 'UInt32')])
+
+        compressor = self.root.get('compressor')
+        if compressor and compressor not in DECOMPRESSORS:
+            raise NotImplementedError(f"{self.filename}: Unsupported compressor {compressor}")
+        self.decompress = DECOMPRESSORS.get(compressor)
+
+    def close(self):
+        self.buffer.close()
+
+    def dtype(self, element):
+        return np.dtype(self.endian + VTK_TYPES[element.get('type')])
+
+    def read_array(self, element):
+        """ Decode a <DataArray> into an array of shape (ntuples,) or (ntuples, ncomponents) """
+        dtype = self.dtype(element)
+        fmt = element.get('format', 'ascii')
+
+        if fmt == 'ascii':
+            values = np.array((element.text or '').split(), dtype=dtype)
+        elif fmt == 'binary':
+            values = self._read_base64(''.join((element.text or '').split()).encode(), 0, dtype)
+        elif fmt == 'appended':
+            offset = self.appended_start + int(element.get('offset'))
+            if self.appended_encoding == 'raw':
+                values = self._read_raw(offset, dtype)
+            else:
+                values = self._read_base64(self.buffer, offset, dtype)
+        else:
+            raise NotImplementedError(f"{self.filename}: Unsupported DataArray format {fmt}")
+
+        ncomponents = int(element.get('NumberOfComponents', 1))
+        if ncomponents > 1:
+            values = values.reshape(-1, ncomponents)
+        return values
+
+    def appended_range(self, element):
+        """ Start and end of the encoded bytes of an appended <DataArray> in the file """
+        offset = int(element.get('offset'))
+        index = self.appended_offsets.index(offset)
+        start = self.appended_start + offset
+        end = self.appended_start + self.appended_offsets[index+1] if index+1 < len(self.appended_offsets) else self.appended_end
+        return start, end
+
+    def encoded(self, element, sample=None):
+        """ Encoded bytes of a <DataArray>, without decoding them
+
+        With sample=n, only the length and n bytes at the start, middle and end.
+        """
+        if element.get('format') == 'appended':
+            start, end = self.appended_range(element)
+        else:
+            text = ''.join((element.text or '').split()).encode()
+            start, end = 0, len(text)
+
+        buffer = self.buffer if element.get('format') == 'appended' else text
+        if sample is None or end - start <= 3*sample:
+            return buffer[start:end]
+        middle = (start + end) // 2
+        return b''.join([ str(end - start).encode(), buffer[start:start+sample], buffer[middle:middle+sample], buffer[end-sample:end] ])
+
+    def _header(self, raw, count):
+        return np.frombuffer(raw, dtype=self.header_dtype, count=count).astype(np.int64)
+
+    def _block_sizes(self, header):
+        """ Compressed and uncompressed block sizes from a compression header [nblocks, block_size, last_block_size, sizes...] """
+        nblocks, block_size, last_size = header[:3]
+        sizes = np.full(nblocks, block_size)
+        if nblocks and last_size:
+            sizes[-1] = last_size
+        return header[3:3+nblocks], sizes
+
+    def _inflate(self, raw, block_sizes, dtype):
+        compressed_sizes, sizes = block_sizes
+        ends = np.cumsum(compressed_sizes)
+        blocks = [ raw[end-csize:end] for csize, end in zip(compressed_sizes, ends) ]
+
+        if len(blocks) > 1 and NTHREADS > 1:
+            data = b''.join(block_pool().map(self.decompress, blocks, sizes.tolist()))
+        else:
+            data = b''.join(map(self.decompress, blocks, sizes.tolist()))
+        return np.frombuffer(data, dtype=dtype)
+
+    def _read_raw(self, offset, dtype):
+        hsize = self.header_dtype.itemsize
+        if self.decompress is None:
+            nbytes, = self._header(self.buffer[offset:offset+hsize], 1)
+            if nbytes == 0:
+                return np.empty(0, dtype=dtype)
+            return np.memmap(self.filename, dtype=dtype, mode='r', offset=offset+hsize, shape=(nbytes // dtype.itemsize,))
+
+        nblocks, = self._header(self.buffer[offset:offset+hsize], 1)
+        header = self._header(self.buffer[offset:offset+(3+nblocks)*hsize], 3+nblocks)
+        block_sizes = self._block_sizes(header)
+        start = offset + (3+nblocks)*hsize
+        return self._inflate(self.buffer[start:start+block_sizes[0].sum()], block_sizes, dtype)
+
+    def _read_base64(self, text, start, dtype):
+        hsize = self.header_dtype.itemsize
+
+        if self.decompress is None:
+            nbytes, = self._header(base64.b64decode(text[start:start+b64len(hsize)])[:hsize], 1)
+            data = self._split_base64(text, start, hsize, nbytes)
+            return np.frombuffer(data, dtype=dtype, count=nbytes // dtype.itemsize)
+
+        nblocks, = self._header(base64.b64decode(text[start:start+b64len(3*hsize)])[:hsize], 1)
+        hbytes = (3+nblocks)*hsize
+        header = self._header(base64.b64decode(text[start:start+b64len(hbytes)])[:hbytes], 3+nblocks)
+        block_sizes = self._block_sizes(header)
+        raw = self._split_base64(text, start, hbytes, block_sizes[0].sum())
+        return self._inflate(raw, block_sizes, dtype)
+
+    def _split_base64(self, text, start, hbytes, nbytes):
+        """ Decoded data following a base64 encoded header of hbytes at text[start:] """
+        ## NOTE: Writers encode the header and the data either as two separately
+        ## padded blocks (VTK) or as one block. A header that isn't a multiple
+        ## of 3 bytes ends in padding ('=') only in the former case.
+        hlen = start + b64len(hbytes)
+        if hbytes % 3 == 0 or text[hlen-1:hlen] == b'=':
+            return base64.b64decode(text[hlen:hlen+b64len(nbytes)])
+        return base64.b64decode(text[start:start+b64len(hbytes+nbytes)])[hbytes:]
+
+def _read_arrays(vtkfile, section, names=None):
+    arrays = Dict()
+    if section is None:
+        return arrays
+    for element in section.findall('DataArray'):
+        name = element.get('Name')
+        if names is None or name in names:
+            arrays[name] = vtkfile.read_array(element)
+    return arrays
+
+class GeometryCache:
+    """ Decoded geometry of the pieces of a time series, reused while their fingerprints match
+
+    The fingerprint of a piece is cheap: its XML header (the attributes of the
+    piece and its geometry arrays, e.g. the value ranges VTK writes), the
+    sizes of the encoded arrays, from their appended data offsets, and SAMPLE
+    bytes at their start, middle and end. A changed mesh with the same header
+    and sizes, differing only between the samples, goes unnoticed.
+
+    full: hash all encoded bytes of the geometry arrays instead. Safe, but
+          reads the whole geometry of every timestep.
+    """
+
+    SAMPLE = 4096
+
+    def __init__(self, full=False):
+        self.full = full
+        self.pieces = {}
+        self.merged = None
+        self.hits = 0
+        self.misses = 0
+
+    def fingerprint(self, vtkfile, piece):
+        """ Fingerprint of the geometry of a <Piece> from its header and encoded arrays """
+        digest = hashlib.sha1()
+        digest.update(f"{sorted(piece.attrib.items())} {vtkfile.root.get('compressor')}".encode())
+        elements = piece.find('Points').findall('DataArray') + piece.find('Cells').findall('DataArray')
+        for element in elements:
+            ## NOTE: Not the offset itself, which shifts with the size of the point data written before
+            digest.update(str(sorted( item for item in element.attrib.items() if item[0] != 'offset' )).encode())
+            digest.update(vtkfile.encoded(element, None if self.full else self.SAMPLE))
+        return digest.hexdigest()
+
+    def get(self, key, fingerprint):
+        cached = self.pieces.get(key)
+        if cached is not None and cached[0] == fingerprint:
+            self.hits += 1
+            return cached[1]
+        self.misses += 1
+        return None
+
+    def put(self, key, fingerprint, geometry):
+        self.pieces[key] = (fingerprint, geometry)
+
+def read_vtu(filename, point_arrays=None, cell_arrays=None, geometry=None, key=()):
+    """ Read a serial .vtu file
+
+    point_arrays, cell_arrays: names of the arrays to decode. None reads all.
+    geometry: GeometryCache to reuse the points and cells from, under key.
+    Multiple pieces in one file are merged into one mesh.
+    """
+    vtkfile = VTKXMLFile(filename)
+    try:
+        return _read_pieces(vtkfile, point_arrays, cell_arrays, geometry, key)
+    finally:
+        vtkfile.close()
+
+def _read_geometry(vtkfile, piece):
+    cells = { element.get('Name'): vtkfile.read_array(element) for element in piece.find('Cells').findall('DataArray') }
+    points = piece.find('Points').find('DataArray')
+    return Dict({
+        'points'      : vtkfile.read_array(points) if points is not None else np.empty((0, 3)),
+        'connectivity': cells['connectivity'],
+        'offsets'     : np.concatenate([[0], cells['offsets']]).astype(np.int64),
+        'types'       : cells['types'],
+        })
+
+def _read_pieces(vtkfile, point_arrays, cell_arrays, geometry=None, key=()):
+    grid = vtkfile.root.find('UnstructuredGrid')
+    if grid is None:
+        raise ValueError(f"{vtkfile.filename}: Not a VTK XML UnstructuredGrid file")
+
+    field_data = _read_arrays(vtkfile, grid.find('FieldData'))
+
+    pieces = []
+    for index, piece in enumerate(grid.findall('Piece')):
+        fingerprint = None
+        mesh = None
+        if geometry is not None:
+            fingerprint = geometry.fingerprint(vtkfile, piece)
+            mesh = geometry.get(key + (index,), fingerprint)
+        if mesh is None:
+            mesh = _read_geometry(vtkfile, piece)
+            if geometry is not None:
+                geometry.put(key + (index,), fingerprint, mesh)
+
+        pieces.append(Dict(mesh, {
+            'point_data'  : _read_arrays(vtkfile, piece.find('PointData'), point_arrays),
+            'cell_data'   : _read_arrays(vtkfile, piece.find('CellData'), cell_arrays),
+            'field_data'  : field_data,
+            'fingerprint' : fingerprint,
+            }))
+
+    return merge_pieces(pieces, geometry, key + ('merged',))
+
+def read_pvtu(filename, point_arrays=None, cell_arrays=None, geometry=None):
+    """ Read a partitioned .pvtu file and all its pieces into one mesh
+
+    Points on the interfaces between pieces are duplicated, as in the
+    pieces. Integrals over the merged mesh are the same as over the pieces.
+    Merging several pieces copies their arrays; a single piece keeps its
+    memory mapped arrays.
+    """
+    vtkfile = VTKXMLFile(filename)
+    try:
+        grid = vtkfile.root.find('PUnstructuredGrid')
+        if grid is None:
+            raise ValueError(f"{filename}: Not a VTK XML PUnstructuredGrid file")
+        field_data = _read_arrays(vtkfile, grid.find('FieldData'))
+    finally:
+        vtkfile.close()
+
+    directory = Path(filename).parent
+    sources = [ directory / piece.get('Source') for piece in grid.findall('Piece') ]
+    read_source = lambda index: read_vtu(sources[index], point_arrays, cell_arrays, geometry, key=(index,))
+
+    if len(sources) > 1 and NTHREADS > 1:
+        with ThreadPoolExecutor(max_workers=min(NTHREADS, len(sources)), thread_name_prefix='vtkxml_pieces') as pool:
+            pieces = list(pool.map(read_source, range(len(sources))))
+    else:
+        pieces = [ read_source(index) for index in range(len(sources)) ]
+
+    mesh = merge_pieces(pieces, geometry)
+    mesh.field_data.update(field_data)
+    return mesh
+
+def read_vtk_xml(filename, point_arrays=None, cell_arrays=None, geometry=None):
+    """ Read a .vtu or .pvtu file. See read_vtu() """
+    if Path(filename).suffix == '.pvtu':
+        return read_pvtu(filename, point_arrays, cell_arrays, geometry)
+    return read_vtu(filename, point_arrays, cell_arrays, geometry)
+
+def byte_ranges(filename, point_arrays=None, geometry=True):
+    """ Byte ranges (path, start, end) that reading the given arrays of a .vtu or .pvtu touches
+
+    point_arrays: names of the point arrays. None includes all.
+    geometry: include the points, cells and cell data, as read by ParaView readers.
+
+    The XML header is always included. Inline (ascii or binary) arrays are
+    part of the XML, which is parsed whole, so a file with any selected inline
+    array is one range over the whole file.
+    """
+    path = Path(filename)
+    vtkfile = VTKXMLFile(path)
+    try:
+        size = len(vtkfile.buffer)
+        if path.suffix == '.pvtu':
+            ranges = [ (path, 0, size) ]
+            for piece in vtkfile.root.find('PUnstructuredGrid').findall('Piece'):
+                ranges.extend(byte_ranges(path.parent / piece.get('Source'), point_arrays, geometry))
+            return ranges
+
+        elements = []
+        for piece in vtkfile.root.iter('Piece'):
+            sections = [ piece.find('PointData') ] + ([ piece.find('Points'), piece.find('Cells'), piece.find('CellData') ] if geometry else [])
+            for section in sections:
+                if section is None:
+                    continue
+                elements.extend( element for element in section.findall('DataArray')
+                                 if section.tag != 'PointData' or point_arrays is None or element.get('Name') in point_arrays )
+
+        if vtkfile.appended_start is None or any( element.get('format') != 'appended' for element in elements ):
+            return [ (path, 0, size) ]
+        return [ (path, 0, vtkfile.appended_start) ] + sorted( (path, *vtkfile.appended_range(element)) for element in elements )
+    finally:
+        vtkfile.close()
+
+def merge_pieces(pieces, geometry=None, key=('merged',)):
+    """ Concatenate meshes, renumbering connectivity and offsets
+
+    With a GeometryCache, the merged geometry is reused while the
+    fingerprints of all pieces match.
+    """
+    if len(pieces) == 1:
+        return pieces[0]
+
+    fingerprint = None
+    mesh = None
+    if geometry is not None:
+        fingerprint = hashlib.sha1(' '.join( piece.fingerprint for piece in pieces ).encode()).hexdigest()
+        mesh = geometry.get(key, fingerprint)
+
+    if mesh is None:
+        point_starts = np.cumsum([0] + [ len(piece.points) for piece in pieces[:-1] ])
+        connectivity_starts = np.cumsum([0] + [ len(piece.connectivity) for piece in pieces[:-1] ])
+        mesh = Dict({
+            'points'      : np.concatenate([ piece.points for piece in pieces ]),
+            'connectivity': np.concatenate([ piece.connectivity + start for piece, start in zip(pieces, point_starts) ]),
+            'offsets'     : np.concatenate([[0]] + [ piece.offsets[1:] + start for piece, start in zip(pieces, connectivity_starts) ]),
+            'types'       : np.concatenate([ piece.types for piece in pieces ]),
+            })
+        if geometry is not None:
+            geometry.put(key, fingerprint, mesh)
+
+    return Dict(mesh, {
+        'point_data'  : Dict({ name: np.concatenate([ piece.point_data[name] for piece in pieces ]) for name in pieces[0].point_data }),
+        'cell_data'   : Dict({ name: np.concatenate([ piece.cell_data[name] for piece in pieces ]) for name in pieces[0].cell_data }),
+        'field_data'  : pieces[0].field_data,
+        'fingerprint' : fingerprint,
+        })
+
+class SeriesReader:
+    """ Read the timesteps of a .vtu/.pvtu series, decoding shared geometry only once
+
+    files: ordered list of files, one per timestep (see utils.find_files)
+    full: fingerprint all encoded bytes of the geometry, not just samples. See GeometryCache
+    """
+
+    def __init__(self, files, point_arrays=None, cell_arrays=None, full=False):
+        self.files = list(files)
+        self.point_arrays = point_arrays
+        self.cell_arrays = cell_arrays
+        self.geometry = GeometryCache(full)
+
+    def __len__(self):
+        return len(self.files)
+
+    def __iter__(self):
+        for timestep in range(len(self)):
+            yield self.read(timestep)
+
+    def read(self, timestep):
+        return read_vtk_xml(self.files[timestep], self.point_arrays, self.cell_arrays, self.geometry)
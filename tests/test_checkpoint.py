@@ -0,0 +1,71 @@
+"""
+CheckpointStore resume and time partitions.
+"""
+
+import numpy as np
+import pytest
+from addict import Dict
+
+from paravision.checkpoint import CheckpointStore, checkpoint_store
+
+def run(store, compute, nts):
+    """ A plugin time loop: computes the missing timesteps, loads the others """
+    results = []
+    for timestep in range(nts):
+        if store.skip(timestep):
+            continue
+        if store.done(timestep):
+            results.append(store.load(timestep))
+            continue
+        results.append(compute(timestep))
+        store.save(timestep, results[-1])
+    return results
+
+def test_resume_computes_only_missing(tmp_path):
+    computed = []
+    def compute(timestep):
+        computed.append(timestep)
+        if timestep == 3 and len(computed) == 4:
+            raise KeyboardInterrupt ## Killed mid-run
+        return np.array([timestep, timestep**2], dtype=float)
+
+    store = CheckpointStore(tmp_path, 'plugin', 6, meta={'scalars': ['scalar_0']})
+    with pytest.raises(KeyboardInterrupt):
+        run(store, compute, 6)
+    assert store.missing() == [3, 4, 5]
+    assert store.first_missing() == 3
+
+    store = CheckpointStore(tmp_path, 'plugin', 6, meta={'scalars': ['scalar_0']})
+    results = run(store, compute, 6)
+    assert computed == [0, 1, 2, 3, 3, 4, 5]
+    assert np.array(results) == pytest.approx(store.load_all())
+    assert store.load_all()[:, 1] == pytest.approx([0, 1, 4, 9, 16, 25])
+    assert not list(tmp_path.glob('.*.tmp'))
+
+def test_different_settings_are_refused(tmp_path):
+    CheckpointStore(tmp_path, 'plugin', 4, meta={'nrad': 5})
+    with pytest.raises(ValueError):
+        CheckpointStore(tmp_path, 'plugin', 4, meta={'nrad': 6})
+    with pytest.raises(ValueError):
+        CheckpointStore(tmp_path, 'plugin', 5, meta={'nrad': 5})
+
+def test_time_partition_merge(tmp_path):
+    compute = lambda timestep: np.array([timestep * 10.0])
+
+    for rank in range(3):
+        worker = CheckpointStore(tmp_path, 'plugin', 7, partition=(rank, 3))
+        assert worker.worker
+        assert [ timestep for timestep in range(7) if not worker.skip(timestep) ] == list(range(rank, 7, 3))
+        run(worker, compute, 7)
+
+    merged = CheckpointStore(tmp_path, 'plugin', 7)
+    assert not merged.worker
+    assert merged.load_all()[:, 0] == pytest.approx(np.arange(7) * 10.0)
+
+def test_checkpoint_store_from_args(tmp_path):
+    assert checkpoint_store(Dict(), 'plugin', 3) is None
+    with pytest.raises(ValueError):
+        checkpoint_store(Dict(time_partition=[0, 2]), 'plugin', 3)
+
+    store = checkpoint_store(Dict(checkpoint_dir=str(tmp_path), output_prefix='run1'), 'plugin', 3)
+    assert store.name == 'plugin_run1'
@@ -0,0 +1,68 @@
+"""
+MomentAccumulator on Gaussian pulses.
+"""
+
+import csv
+
+import numpy as np
+import pytest
+
+from paravision.moments import MomentAccumulator
+
+def pulses(time, means, sigmas, areas):
+    """ Gaussian peaks, one column per series """
+    return areas / (sigmas * np.sqrt(2 * np.pi)) * np.exp(-0.5 * ((time[:, None] - means) / sigmas)**2)
+
+def trapezoid(y, x):
+    return np.sum((y[1:] + y[:-1]) * np.diff(x)) / 2
+
+def accumulate(time, values):
+    moments = MomentAccumulator(values.shape[1])
+    for t, row in zip(time, values):
+        moments.add(t, row)
+    return moments
+
+def test_gaussian_pulse():
+    means, sigmas, areas = np.array([20.0, 35.0]), np.array([2.0, 5.0]), np.array([1.0, 3.0])
+    time = np.linspace(0, 100, 2001)
+    moments = accumulate(time, pulses(time, means, sigmas, areas))
+
+    assert moments.m0 == pytest.approx(areas, rel=1e-9)
+    assert moments.mean == pytest.approx(means, rel=1e-9)
+    assert moments.variance == pytest.approx(sigmas**2, rel=1e-6)
+    assert moments.plates() == pytest.approx(means**2 / sigmas**2, rel=1e-6)
+    assert moments.hetp(0.1) == pytest.approx(0.1 * sigmas**2 / means**2, rel=1e-6)
+
+def test_matches_trapezoid_on_uneven_times():
+    rng = np.random.default_rng(0)
+    time = np.sort(rng.uniform(0, 60, 300))
+    values = pulses(time, np.array([25.0]), np.array([4.0]), np.array([2.0]))
+    moments = accumulate(time, values)
+
+    c = values[:, 0]
+    m0 = trapezoid(c, time)
+    mean = trapezoid(time * c, time) / m0
+    assert moments.m0 == pytest.approx([m0], rel=1e-12)
+    assert moments.mean == pytest.approx([mean], rel=1e-12)
+    assert moments.variance == pytest.approx([trapezoid((time - mean)**2 * c, time) / m0], rel=1e-10)
+
+def test_empty_series_and_order():
+    moments = MomentAccumulator(2)
+    moments.add(0.0, [0.0, 1.0])
+    moments.add(1.0, [0.0, 1.0])
+    assert moments.m0 == pytest.approx([0.0, 1.0])
+    assert np.isnan(moments.variance[0])
+
+    with pytest.raises(ValueError):
+        moments.add(1.0, [0.0, 1.0])
+
+def test_write(tmp_path):
+    time = np.linspace(0, 50, 501)
+    moments = accumulate(time, pulses(time, np.array([10.0, 20.0]), np.array([1.0, 2.0]), np.array([1.0, 1.0])))
+    moments.write(tmp_path / 'moments.csv', labels=['inner', 'outer'], length=0.5)
+
+    with open(tmp_path / 'moments.csv') as f:
+        rows = list(csv.DictReader(f))
+    assert [ row['series'] for row in rows ] == ['inner', 'outer']
+    assert [ float(row['mean']) for row in rows ] == pytest.approx([10.0, 20.0], rel=1e-9)
+    assert [ float(row['hetp']) for row in rows ] == pytest.approx([0.5 / 100, 0.5 / 100], rel=1e-6)
@@ -0,0 +1,64 @@
+"""
+IntegrationOperator assembly and caching, without ParaView.
+"""
+
+import numpy as np
+import pytest
+
+from paravision import operators
+from paravision.operators import IntegrationOperator, cached_operator, mesh_fingerprint, volume_operator
+
+from paravision.shells import VTK_VOXEL
+
+from test_shells import box_mesh, integrate_attributes
+
+def test_duplicates_are_summed():
+    operator = IntegrationOperator([0, 0, 1, 0], [2, 2, 0, 1], [1.0, 2.0, 4.0, 0.5], nzones=3, npoints=3)
+    assert operator.dense() == pytest.approx(np.array([[0, 0.5, 3.0], [4.0, 0, 0], [0, 0, 0]]))
+    assert operator.measures() == pytest.approx([3.5, 4.0, 0.0])
+    assert list(operator.nonempty) == [0, 1]
+
+def test_apply_matches_dense():
+    rng = np.random.default_rng(0)
+    operator = IntegrationOperator(rng.integers(0, 4, 50), rng.integers(0, 20, 50), rng.random(50), nzones=5, npoints=20)
+    values = rng.random((20, 3))
+    assert operator.apply(values) == pytest.approx(operator.dense() @ values)
+    assert operator.apply(values[:, 0]) == pytest.approx(operator.dense() @ values[:, 0])
+
+    with pytest.raises(ValueError):
+        operator.apply(values[:10])
+
+def test_cached_operator_roundtrip(tmp_path, monkeypatch):
+    mesh = box_mesh(3, 2)
+    monkeypatch.setattr(operators, '_OPERATORS', {})
+
+    built = cached_operator(mesh, 'volume', volume_operator, tmp_path)
+    assert len(list(tmp_path.glob('operator_*.npz'))) == 1
+    assert cached_operator(mesh, 'volume', None, tmp_path) is built
+
+    ## A new run loads it from the cache directory instead of building it
+    monkeypatch.setattr(operators, '_OPERATORS', {})
+    loaded = cached_operator(mesh, 'volume', None, tmp_path)
+    assert loaded.dense() == pytest.approx(built.dense())
+    assert loaded.dim == built.dim
+
+def test_fingerprint_changes_with_geometry():
+    mesh = box_mesh(3, 2)
+    moved = box_mesh(3, 2, height=2.0)
+    assert mesh_fingerprint(mesh) == mesh_fingerprint(box_mesh(3, 2))
+    assert mesh_fingerprint(mesh) != mesh_fingerprint(moved)
+
+def test_voxels_are_integrated_exactly():
+    """ IntegrateVariables integrates voxels as their volume times the mean point value """
+    mesh = box_mesh(3, 2, height=2.0)
+    ## Every other hexahedron as a voxel, whose points are ordered x fastest, then y, then z
+    cells = mesh.connectivity.reshape(-1, 8).copy()
+    cells[::2] = cells[::2][:, [0, 1, 3, 2, 4, 5, 7, 6]]
+    mesh.connectivity = cells.ravel()
+    mesh.types[::2] = VTK_VOXEL
+    values = np.random.default_rng(3).random(len(mesh.points))
+
+    operator = volume_operator(mesh)
+    volume, integral = integrate_attributes(mesh, values)
+    assert operator.measures() == pytest.approx([volume], rel=1e-12)
+    assert operator.apply(values) == pytest.approx([integral], rel=1e-12)
@@ -0,0 +1,207 @@
+"""
+Packed bed geometry, without ParaView.
+"""
+
+from math import pi
+
+import mpmath
+import numpy as np
+import pytest
+
+from paravision import packed_bed
+from paravision.packed_bed import Bead, PackedBed, beadArray, histo, RadialIndex, volShellRegion, bridgePairs, bridgeVolumes, region_bounds, fit_spheres, volBeadSlice, CylSphIntVolume, CylSphIntVolumeArray, ellipkinc, ellipeinc
+
+def random_bed(n, seed=0, radius=1.0, height=2.0):
+    """ Random (possibly overlapping) beads in a cylinder """
+    rng = np.random.default_rng(seed)
+    pos = radius * np.sqrt(rng.random(n))
+    angle = 2 * pi * rng.random(n)
+    return np.column_stack([pos * np.cos(angle), pos * np.sin(angle), height * rng.random(n), rng.uniform(0.02, 0.08, n)])
+
+@pytest.fixture
+def carlson(monkeypatch):
+    """ Use the numpy Carlson integrals even if scipy is installed """
+    monkeypatch.setattr(packed_bed, 'special', None)
+
+def test_carlson_elliptic_integrals(carlson):
+    phi = np.array([0.0, 0.3, 1.0, pi/2, pi/2, 1.2])
+    m = np.array([0.5, 0.0, 0.9, 0.2, 0.999999, 1.0])
+    F = [ float(mpmath.ellipf(p, k)) for p, k in zip(phi, m) ]
+    E = [ float(mpmath.ellipe(p, k)) for p, k in zip(phi, m) ]
+    assert ellipkinc(phi, m) == pytest.approx(F, rel=1e-13, abs=1e-15)
+    assert ellipeinc(phi, m) == pytest.approx(E, rel=1e-13, abs=1e-15)
+
+def intersection_grid():
+    rho, eta = np.meshgrid(np.linspace(0, 2.5, 26), np.linspace(0, 2.5, 21))
+    rho, eta = rho.ravel(), eta.ravel()
+    ## NOTE: The scalar version doesn't handle eta == rho
+    keep = ~np.isclose(rho, eta)
+    return rho[keep], eta[keep]
+
+def test_intersection_volume_matches_mpmath(carlson):
+    rho, eta = intersection_grid()
+    expected = [ float(CylSphIntVolume(r, e)) for r, e in zip(rho, eta) ]
+    assert CylSphIntVolumeArray(rho, eta) == pytest.approx(expected, abs=1e-12)
+
+def test_intersection_volume_limits(carlson):
+    ## Sphere on the axis
+    rho = np.linspace(0.1, 0.9, 5)
+    assert CylSphIntVolumeArray(rho, 0) == pytest.approx(4/3 * pi * (1 - (1 - rho**2)**1.5))
+    ## No cylinder, sphere outside and sphere inside
+    assert CylSphIntVolumeArray([0.0, 0.5, 3.0], [0.3, 2.0, 0.5]) == pytest.approx([0, 0, 4/3 * pi])
+    ## rho + eta == 1 is the limit of both branches, where the scalar version gives up
+    assert CylSphIntVolumeArray([0.4 - 1e-9, 0.4, 0.4 + 1e-9], 0.6) == pytest.approx(float(CylSphIntVolume(0.4 + 1e-9, 0.6)), abs=1e-7)
+
+def test_scipy_and_carlson_agree(monkeypatch):
+    special = pytest.importorskip('scipy.special')
+    rho, eta = intersection_grid()
+    monkeypatch.setattr(packed_bed, 'special', special)
+    with_scipy = CylSphIntVolumeArray(rho, eta)
+    monkeypatch.setattr(packed_bed, 'special', None)
+    assert CylSphIntVolumeArray(rho, eta) == pytest.approx(with_scipy, abs=1e-12)
+
+def test_shell_volumes_match_bead_loop():
+    """ The radial index gives the volumes of looping volBeadSlice over all beads """
+    bed = PackedBed(random_bed(300))
+    rShells = np.linspace(0, 1.1, 8)
+    index = RadialIndex(bed.xyzr)
+
+    for i in range(len(rShells) - 1):
+        volShell, radii = volShellRegion(bed, rShells, i, index)
+        volumes = np.array([ float(volBeadSlice(bead, rShells[i], rShells[i+1])) for bead in bed ])
+        assert volShell == pytest.approx(volumes.sum(), rel=1e-10)
+        assert sorted(radii) == pytest.approx(sorted(np.cbrt(volumes[volumes > 1e-15] / (4/3 * pi))), rel=1e-8, abs=1e-9)
+
+    volumes = [ volShellRegion(bed, rShells, i)[0] for i in range(len(rShells) - 1) ]
+    assert sum(volumes) == pytest.approx(bed.volume(), rel=1e-10)
+
+def test_radial_index_straddling():
+    xyzr = random_bed(200, seed=1)
+    index = RadialIndex(xyzr)
+    for radius in [0.0, 0.3, 0.75]:
+        pos = np.hypot(xyzr[:, 0], xyzr[:, 1])
+        expected = np.sort(xyzr[(pos - xyzr[:, 3] < radius) & (radius < pos + xyzr[:, 3]) & (radius > 0)], axis=0)
+        assert np.array_equal(np.sort(index.xyzr[index.straddling(radius)], axis=0), expected)
+
+def brute_force_pairs(xyzr, bridgeTol):
+    i, j = np.triu_indices(len(xyzr), k=1)
+    distance = np.linalg.norm(xyzr[i, :3] - xyzr[j, :3], axis=1)
+    close = distance < xyzr[i, 3] + xyzr[j, 3] + bridgeTol
+    return set(zip(i[close].tolist(), j[close].tolist()))
+
+@pytest.mark.parametrize('seed, bridgeTol', [(0, 0.0), (1, 0.01), (2, 0.1)])
+def test_bridge_pairs_match_brute_force(seed, bridgeTol):
+    xyzr = random_bed(400, seed=seed)
+    i, j, distance = bridgePairs(xyzr, bridgeTol)
+    assert np.all(i < j)
+    assert set(zip(i.tolist(), j.tolist())) == brute_force_pairs(xyzr, bridgeTol)
+    assert distance == pytest.approx(np.linalg.norm(xyzr[i, :3] - xyzr[j, :3], axis=1))
+
+def test_bridge_pairs_small_beds():
+    assert len(bridgePairs(np.zeros((0, 4)), 0.1)[0]) == 0
+    assert len(bridgePairs(np.array([[0, 0, 0, 1.0]]), 0.1)[0]) == 0
+    i, j, distance = bridgePairs(np.array([[0, 0, 0, 1.0], [2.05, 0, 0, 1.0], [5, 0, 0, 1.0]]), 0.1)
+    assert list(zip(i, j)) == [(0, 1)]
+    assert distance == pytest.approx([2.05])
+
+def test_bridge_volumes():
+    """ One bridge between two touching unit beads, each bored through by the bridge cylinder """
+    bed = PackedBed([[0, 0, 0, 1.0], [2.0, 0, 0, 1.0]])
+    added, removed, nBridges = bridgeVolumes(bed, 0.1, 0.2, 0.0)
+    assert nBridges == 1
+    ## Half the bore of each bead lies inside the bridge
+    bore = 4/3 * pi * (1 - (1 - 0.2**2)**1.5)
+    assert removed == pytest.approx(bore, rel=1e-12)
+    assert added + removed == pytest.approx(pi * 0.2**2 * 2.0, rel=1e-12)
+
+def test_region_bounds_match_per_region_loop():
+    rng = np.random.default_rng(3)
+    points = rng.normal(size=(500, 3))
+    regionIds = rng.integers(0, 7, 500)
+    regionIds[regionIds == 4] = 5 ## Region 4 has no points
+
+    bounds, centroids = region_bounds(points, regionIds.astype(np.float64), 8)
+    for region in range(8):
+        selected = points[regionIds == region]
+        if len(selected) == 0:
+            assert np.all(np.isnan(bounds[region])) and np.all(np.isnan(centroids[region]))
+            continue
+        assert bounds[region, 0::2] == pytest.approx(selected.min(axis=0))
+        assert bounds[region, 1::2] == pytest.approx(selected.max(axis=0))
+        assert centroids[region] == pytest.approx(selected.mean(axis=0))
+
+def test_region_bounds_without_points():
+    bounds, centroids = region_bounds(np.zeros((0, 3)), np.zeros(0), 2)
+    assert bounds.shape == (2, 6) and np.all(np.isnan(bounds))
+
+def test_bead_views():
+    bead = Bead(0.3, 0.4, 1.0, 0.1)
+    assert bead.pos() == pytest.approx(0.5)
+    assert bead.distance(Bead(0.3, 0.4, 2.0, 0.1)) == pytest.approx(1.0)
+
+    ## Beads of a bed write through to its array
+    bed = PackedBed([[0, 0, 0, 1.0], [1, 2, 3, 0.5]])
+    bed.beads[1].z = 4.0
+    assert bed.xyzr[1] == pytest.approx([1, 2, 4, 0.5])
+
+def test_packed_bed_grows_and_bounds():
+    xyzr = random_bed(50, seed=4)
+    bed = PackedBed()
+    for row in xyzr[:20]:
+        bed.add(Bead(*row))
+    bed.extend(xyzr[20:])
+    assert len(bed) == bed.size() == 50
+    assert np.array_equal(bed.xyzr, xyzr)
+    assert np.array_equal(beadArray(list(bed)), xyzr)
+    assert bed.volume() == pytest.approx(4/3 * pi * np.sum(xyzr[:, 3]**3))
+
+    bounds = bed.get_bounds()
+    assert bounds['zmin'] == pytest.approx(np.min(xyzr[:, 2] - xyzr[:, 3]))
+    assert bounds['rmax'] == pytest.approx(xyzr[:, 3].max())
+
+    bed.moveBedtoCenter()
+    assert bed.xmin == pytest.approx(-bed.xmax) and bed.ymin == pytest.approx(-bed.ymax)
+    assert bed.xyzr[:, 2:] == pytest.approx(xyzr[:, 2:])
+
+@pytest.mark.parametrize('filename', ['xyzr.csv', 'xyzr.npy'])
+def test_packed_bed_write_read(tmp_path, filename):
+    bed = PackedBed(random_bed(30, seed=5))
+    bed.write(tmp_path / filename)
+    assert PackedBed.read(tmp_path / filename).xyzr == pytest.approx(bed.xyzr, rel=1e-15)
+
+def test_histo_volume_fractions():
+    frac, avg = histo([1.0, 1.0, 2.0], bins=2)
+    assert frac == pytest.approx([2 / 10, 8 / 10])
+    assert avg == pytest.approx([1.25, 1.75])
+
+def sphere_points(center, radius, n, rng):
+    direction = rng.normal(size=(n, 3))
+    return center + radius * direction / np.linalg.norm(direction, axis=1)[:, None]
+
+def test_fit_spheres():
+    rng = np.random.default_rng(6)
+    spheres = np.column_stack([rng.uniform(-1e-3, 1e-3, (5, 3)), rng.uniform(1e-5, 1e-4, 5)])
+    points = np.concatenate([ sphere_points(sphere[:3], sphere[3], 200, rng) for sphere in spheres ])
+    regionIds = np.repeat(np.arange(5), 200)
+    order = rng.permutation(len(points))
+
+    fitted, residuals = fit_spheres(points[order], regionIds[order], 5)
+    assert fitted == pytest.approx(spheres, rel=1e-9, abs=1e-12)
+    assert np.all(residuals < 1e-9)
+
+def test_fit_spheres_rejects_other_shapes():
+    rng = np.random.default_rng(7)
+    cube = rng.uniform(-1, 1, (300, 3))
+    cube[np.arange(300), rng.integers(0, 3, 300)] = rng.choice([-1.0, 1.0], 300) ## Points on the faces
+    plane = np.column_stack([rng.random((50, 2)), np.zeros(50)])
+    few = sphere_points(np.zeros(3), 1.0, 3, rng)
+    sphere = sphere_points(np.ones(3), 0.5 * (1 + 1e-3 * rng.normal(size=(100, 1))), 100, rng) ## A slightly rough bead
+
+    points = np.concatenate([cube, plane, few, sphere])
+    regionIds = np.repeat([0, 1, 2, 4], [300, 50, 3, 100]) ## Region 3 is empty
+    fitted, residuals = fit_spheres(points, regionIds, 5)
+
+    assert residuals[0] > 0.05
+    assert np.all(np.isnan(residuals[1:4])) and np.all(np.isnan(fitted[1:4]))
+    assert residuals[4] < 1e-2
+    assert fitted[4] == pytest.approx([1, 1, 1, 0.5], rel=1e-2)
@@ -0,0 +1,79 @@
+"""
+Commands built by pvrun, with the processes it would start recorded instead.
+"""
+
+import importlib.machinery
+import importlib.util
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+def load_pvrun():
+    path = Path(__file__).parents[1] / 'pvrun'
+    loader = importlib.machinery.SourceFileLoader('pvrun', str(path))
+    module = importlib.util.module_from_spec(importlib.util.spec_from_loader('pvrun', loader))
+    loader.exec_module(module)
+    return module
+
+class Processes:
+    """ Stand-in for the subprocess module: records commands, runs nothing """
+
+    def __init__(self, failing=()):
+        self.failing = failing
+        self.run_commands = []
+        self.started = []
+
+    def run(self, command, capture_output=False, env=None):
+        if command[0] != 'which':
+            self.run_commands.append(command)
+        return type('Completed', (), { 'stdout': f"/usr/bin/{command[-1]}\n".encode(), 'returncode': 0 })()
+
+    def Popen(self, command, env=None):
+        rank = len(self.started)
+        self.started.append(command)
+        return type('Process', (), { 'wait': lambda _: 1 if rank in self.failing else 0 })()
+
+@pytest.fixture
+def pvrun(monkeypatch):
+    monkeypatch.setenv('PYTHONPATH', '')
+    return load_pvrun()
+
+def test_build_command_serial(pvrun, monkeypatch):
+    monkeypatch.setattr(pvrun, 'subprocess', Processes())
+    command, env = pvrun.build_command('plugin.py', ['--scalars', 'scalar_0'])
+    assert command == ['pvpython', 'plugin.py', '--scalars', 'scalar_0']
+    assert env['PYTHONPATH'].split(os.pathsep) == sys.path
+
+def test_build_command_parallel(pvrun, monkeypatch):
+    monkeypatch.setattr(pvrun, 'subprocess', Processes())
+    command, _ = pvrun.build_command('plugin.py', ['a.pvtu'], nproc=4)
+    assert command == ['mpiexec', '-np', '4', 'pvbatch', 'plugin.py', 'a.pvtu']
+
+def test_run_time_parallel(pvrun, monkeypatch):
+    processes = Processes()
+    monkeypatch.setattr(pvrun, 'subprocess', processes)
+    pvrun.run_time_parallel('plugin.py', ['a.pvtu'], nproc=2, ntime=3)
+
+    assert processes.started == [
+            ['mpiexec', '-np', '2', 'pvbatch', 'plugin.py', 'a.pvtu', '--checkpoint-dir', 'checkpoints_time_parallel', '--time-partition', str(rank), '3']
+            for rank in range(3) ]
+    ## The merge run finds every timestep in the shared store
+    assert processes.run_commands == [ ['mpiexec', '-np', '2', 'pvbatch', 'plugin.py', 'a.pvtu', '--checkpoint-dir', 'checkpoints_time_parallel'] ]
+
+def test_run_time_parallel_keeps_checkpoint_dir(pvrun, monkeypatch):
+    processes = Processes()
+    monkeypatch.setattr(pvrun, 'subprocess', processes)
+    pvrun.run_time_parallel('plugin.py', ['--checkpoint-dir', 'mine'], ntime=2)
+
+    assert processes.started[1] == ['pvpython', 'plugin.py', '--checkpoint-dir', 'mine', '--time-partition', '1', '2']
+    assert processes.run_commands == [ ['pvpython', 'plugin.py', '--checkpoint-dir', 'mine'] ]
+
+def test_run_time_parallel_failed_worker(pvrun, monkeypatch):
+    processes = Processes(failing=[1])
+    monkeypatch.setattr(pvrun, 'subprocess', processes)
+    with pytest.raises(RuntimeError, match=r'\[1\]'):
+        pvrun.run_time_parallel('plugin.py', [], ntime=3)
+    assert len(processes.started) == 3
+    assert processes.run_commands == []
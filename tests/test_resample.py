@@ -0,0 +1,88 @@
+"""
+Interpolation maps against vtkProbeFilter, which ResampleWithDataset uses.
+"""
+
+import numpy as np
+import pytest
+
+vtk = pytest.importorskip('vtk')
+from vtk.util import numpy_support as ns
+
+from addict import Dict
+
+from paravision.resample import barycentric, interpolation_map
+from paravision.shells import simplices, VTK_TETRA
+
+from test_shells import box_mesh, linear_field
+
+def unstructured_grid(mesh, values=None):
+    grid = vtk.vtkUnstructuredGrid()
+    points = vtk.vtkPoints()
+    points.SetData(ns.numpy_to_vtk(mesh.points, deep=1))
+    grid.SetPoints(points)
+    cells = vtk.vtkCellArray()
+    cells.SetData(ns.numpy_to_vtkIdTypeArray(mesh.offsets.astype(np.int64), deep=1), ns.numpy_to_vtkIdTypeArray(mesh.connectivity.astype(np.int64), deep=1))
+    grid.SetCells(ns.numpy_to_vtk(mesh.types, deep=1), cells)
+    if values is not None:
+        array = ns.numpy_to_vtk(values, deep=1)
+        array.SetName('values')
+        grid.GetPointData().AddArray(array)
+    return grid
+
+def tet_mesh(n, nz):
+    mesh = box_mesh(n, nz)
+    tets, _, _ = simplices(mesh.connectivity, mesh.offsets, mesh.types)
+    return Dict(points=mesh.points, connectivity=tets.ravel(), offsets=np.arange(0, tets.size + 1, 4),
+                types=np.full(len(tets), VTK_TETRA, dtype=np.uint8))
+
+def probe(mesh, values, points):
+    """ Values at points and whether they were found, with vtkProbeFilter defaults """
+    destination = vtk.vtkPolyData()
+    destination.SetPoints(vtk.vtkPoints())
+    destination.GetPoints().SetData(ns.numpy_to_vtk(points, deep=1))
+
+    probe = vtk.vtkProbeFilter()
+    probe.SetInputData(destination)
+    probe.SetSourceData(unstructured_grid(mesh, values))
+    probe.SetCellLocatorPrototype(vtk.vtkStaticCellLocator())
+    probe.Update()
+    output = probe.GetOutput().GetPointData()
+    return ns.vtk_to_numpy(output.GetArray('values')), ns.vtk_to_numpy(output.GetArray(probe.GetValidPointMaskArrayName())).astype(bool)
+
+def test_barycentric():
+    rng = np.random.default_rng(0)
+    for k in [2, 3, 4]:
+        vertices = rng.random((50, k, 3))
+        weights = rng.dirichlet(np.ones(k), 50)
+        points = np.einsum('mk,mkd->md', weights, vertices)
+        assert barycentric(vertices, points) == pytest.approx(weights, abs=1e-9)
+    assert barycentric(rng.random((5, 1, 3)), rng.random((5, 3))) == pytest.approx(np.ones((5, 1)))
+
+@pytest.mark.parametrize('make_mesh', [box_mesh, tet_mesh], ids=['hexahedra', 'tetrahedra'])
+def test_interpolation_map_matches_probe_filter(make_mesh):
+    rng = np.random.default_rng(1)
+    mesh = make_mesh(4, 3)
+    values = rng.random(len(mesh.points))
+
+    ## Inside, outside, and on the mesh points and faces
+    points = np.concatenate([
+        rng.uniform([-1.2, -1.2, -0.2], [1.2, 1.2, 1.2], (300, 3)),
+        mesh.points[::7],
+        np.column_stack([rng.uniform(-1, 1, (20, 2)), np.ones(20)]),
+        ])
+
+    operator = interpolation_map(unstructured_grid(mesh), points, mesh)
+    expected, found = probe(mesh, values, points)
+
+    assert np.array_equal(np.isin(np.arange(len(points)), operator.nonempty), found)
+    assert operator.apply(values) == pytest.approx(np.where(found, expected, 0.0), abs=1e-9)
+
+def test_interpolation_map_reproduces_linear_fields():
+    rng = np.random.default_rng(2)
+    mesh = tet_mesh(3, 2)
+    points = rng.uniform([-1, -1, 0], [1, 1, 1], (200, 3))
+
+    operator = interpolation_map(unstructured_grid(mesh), points, mesh)
+    assert len(operator.nonempty) == len(points)
+    assert operator.apply(linear_field(mesh.points)) == pytest.approx(linear_field(points))
+    assert operator.dense().sum(axis=1) == pytest.approx(np.ones(len(points)))
@@ -0,0 +1,96 @@
+"""
+Series files: conversion of .vtu/.pvtu series to HDF5 and reading them back.
+"""
+
+import numpy as np
+import pytest
+
+pytest.importorskip('h5py')
+
+from paravision.series import convert_series, open_series, request_information, request_data
+
+from test_vtkxml import sample_mesh, write_vtu, write_pvtu
+
+def write_series(directory, nts=3, pieces=1):
+    mesh = sample_mesh()
+    files, values = [], []
+    for timestep in range(nts):
+        mesh.point_data['scalar_0'] = np.random.default_rng(timestep).random(len(mesh.points)).astype(np.float32)
+        mesh.point_data['velocity'] = np.full((len(mesh.points), 3), timestep, dtype=np.float64)
+        if pieces == 1:
+            files.append(directory / f"mesh_{timestep}.vtu")
+            write_vtu(files[-1], mesh, 'raw', compressor='vtkZLibDataCompressor', time=0.5 * timestep)
+        else:
+            files.append(write_pvtu(directory, f"mesh_{timestep}", [mesh] * pieces, fmt='raw'))
+        values.append({ name: np.tile(array, (pieces,) + (1,) * (array.ndim - 1)) for name, array in mesh.point_data.items() })
+    return mesh, files, values
+
+@pytest.mark.parametrize('pieces', [1, 2])
+def test_convert_series_roundtrip(tmp_path, pieces):
+    mesh, files, values = write_series(tmp_path, pieces=pieces)
+    convert_series(files, tmp_path / 'series.h5')
+
+    series = open_series(tmp_path / 'series.h5')
+    try:
+        assert len(series) == len(files)
+        assert series.mesh.points.shape == (pieces * len(mesh.points), 3)
+        assert np.array_equal(series.mesh.types, np.tile(mesh.types, pieces))
+        assert sorted(series.point_arrays) == ['scalar_0', 'velocity']
+        if pieces == 1:
+            assert series.times == pytest.approx([0.0, 0.5, 1.0])
+        for timestep, expected in enumerate(values):
+            data = series.read(timestep)
+            for name, array in expected.items():
+                assert np.array_equal(data[name], array)
+    finally:
+        series.close()
+
+def test_convert_series_selected_arrays(tmp_path):
+    _, files, values = write_series(tmp_path)
+    convert_series(files, tmp_path / 'series.h5', point_arrays=['velocity'])
+
+    series = open_series(tmp_path / 'series.h5')
+    try:
+        assert series.point_arrays == ['velocity']
+        assert np.array_equal(series.read(2).velocity, values[2]['velocity'])
+    finally:
+        series.close()
+
+def test_convert_series_rejects_changing_geometry(tmp_path):
+    mesh, files, _ = write_series(tmp_path, nts=2)
+    mesh.points = mesh.points + 1.0
+    write_vtu(files[1], mesh, 'raw', compressor='vtkZLibDataCompressor')
+    with pytest.raises(ValueError, match='Geometry differs'):
+        convert_series(files, tmp_path / 'series.h5')
+
+def test_request_data(tmp_path):
+    """ The ProgrammableSource scripts of series_source(), run by a plain VTK algorithm """
+    pytest.importorskip('vtk')
+    from vtkmodules.util.vtkAlgorithm import VTKPythonAlgorithmBase
+    import vtk.util.numpy_support as ns #type:ignore
+
+    mesh, files, values = write_series(tmp_path)
+    filename = str(tmp_path / 'series.h5')
+    convert_series(files, filename)
+
+    class SeriesSource(VTKPythonAlgorithmBase):
+        def __init__(self):
+            super().__init__(nInputPorts=0, nOutputPorts=1, outputType='vtkUnstructuredGrid')
+
+        def RequestInformation(self, request, inInfo, outInfo):
+            request_information(self, filename)
+            return 1
+
+        def RequestData(self, request, inInfo, outInfo):
+            request_data(self, filename, ['scalar_0'])
+            return 1
+
+    source = SeriesSource()
+    for timestep, time in enumerate([0.0, 0.5, 1.0]):
+        source.UpdateTimeStep(time)
+        output = source.GetOutputDataObject(0)
+        assert output.GetNumberOfPoints() == len(mesh.points)
+        assert output.GetNumberOfCells() == len(mesh.types)
+        assert output.GetPointData().GetNumberOfArrays() == 1
+        assert np.array_equal(ns.vtk_to_numpy(output.GetPointData().GetArray('scalar_0')), values[timestep]['scalar_0'])
+        assert [ output.GetCellType(cell) for cell in range(output.GetNumberOfCells()) ] == mesh.types.tolist()
@@ -0,0 +1,143 @@
+"""
+Shell, zone and detector operators on small meshes, without ParaView.
+"""
+
+from math import pi, sqrt
+
+import numpy as np
+import pytest
+from addict import Dict
+
+from paravision.operators import volume_operator
+from paravision.shells import shell_operator, zone_operator, detector_operator, shell_radii, VTK_HEXAHEDRON, VTK_TETRA, VTK_WEDGE, VTK_PYRAMID
+
+def box_mesh(n, nz, half_width=1.0, height=1.0):
+    """ [-half_width, half_width]^2 x [0, height] as n x n x nz hexahedra """
+    x = np.linspace(-half_width, half_width, n+1)
+    z = np.linspace(0, height, nz+1)
+    X, Y, Z = np.meshgrid(x, x, z, indexing='ij')
+    points = np.column_stack([X.ravel(), Y.ravel(), Z.ravel()])
+
+    index = np.arange(len(points)).reshape(n+1, n+1, nz+1)
+    i, j, k = [ a.ravel() for a in np.meshgrid(np.arange(n), np.arange(n), np.arange(nz), indexing='ij') ]
+    hexes = np.stack([index[i, j, k], index[i+1, j, k], index[i+1, j+1, k], index[i, j+1, k],
+                      index[i, j, k+1], index[i+1, j, k+1], index[i+1, j+1, k+1], index[i, j+1, k+1]], axis=1)
+
+    return Dict(points=points, connectivity=hexes.ravel(), offsets=np.arange(0, hexes.size + 1, 8),
+                types=np.full(len(hexes), VTK_HEXAHEDRON, dtype=np.uint8))
+
+def linear_field(points):
+    return points @ np.array([1.0, 2.0, 3.0]) + 1.0
+
+def test_shell_radii():
+    assert shell_radii(2.0, 4, 'EQUIDISTANT') == pytest.approx([0, 0.5, 1.0, 1.5, 2.0])
+    assert shell_radii(1.0, 2, 'EQUIVOLUME') == pytest.approx([0, sqrt(0.5), 1.0])
+
+def test_volume_operator_box():
+    mesh = box_mesh(6, 3)
+    operator = volume_operator(mesh)
+    assert operator.measures() == pytest.approx([4.0], rel=1e-12)
+    ## Integral of x + 2y + 3z + 1 over [-1, 1]^2 x [0, 1]
+    assert operator.apply(linear_field(mesh.points)) == pytest.approx([10.0], rel=1e-12)
+
+def test_shells_partition_box():
+    """ Shells out to the corners cover the box exactly, linear fields included """
+    mesh = box_mesh(10, 2)
+    operator = shell_operator(mesh.points, mesh.connectivity, mesh.offsets, mesh.types, [0, 0.3, 0.7, 1.0, 1.5])
+    assert operator.measures().sum() == pytest.approx(4.0, rel=1e-12)
+    assert operator.apply(linear_field(mesh.points)).sum() == pytest.approx(10.0, rel=1e-12)
+
+def test_shells_converge_to_annuli():
+    mesh = box_mesh(40, 1)
+    operator = shell_operator(mesh.points, mesh.connectivity, mesh.offsets, mesh.types, [0, 0.5, 1.0])
+    assert operator.measures() == pytest.approx([pi * 0.25, pi * 0.75], rel=5e-3)
+
+def test_shell_cut_of_tetrahedron_is_exact():
+    """ Below a level c between the two lowest vertex values s0 < s1 < s2 < s3 of
+    the (linearly interpolated) r^2, a tetrahedron keeps the volume fraction
+    (c - s0)^3 / ((s1 - s0) (s2 - s0) (s3 - s0)). That's the cut Clip makes.
+    """
+    points = np.array([[0.1, 0.0, 0.0], [0.0, 0.6, 0.1], [0.9, 0.2, 0.5], [0.3, 1.2, -0.4]])
+    s = np.sort(points[:, 0]**2 + points[:, 1]**2)
+    c = (s[0] + s[1]) / 2
+
+    operator = shell_operator(points, np.arange(4), np.array([0, 4]), np.array([VTK_TETRA], dtype=np.uint8), [0, sqrt(c), 10.0])
+    volume = abs(np.linalg.det(points[1:] - points[0])) / 6
+    fraction = (c - s[0])**3 / ((s[1] - s[0]) * (s[2] - s[0]) * (s[3] - s[0]))
+
+    assert operator.measures() == pytest.approx([fraction * volume, (1 - fraction) * volume], rel=1e-12)
+
+def test_zone_operator_axial_columns():
+    """ Axial cuts are planes, so the column volumes are exact """
+    mesh = box_mesh(10, 4)
+    operator = zone_operator(mesh.points, mesh.connectivity, mesh.offsets, mesh.types, [0, 0.25, 1.0], [0, 0.5, 1.5])
+    volumes = operator.measures().reshape(2, 2)
+    assert volumes.sum(axis=1) == pytest.approx([1.0, 3.0], rel=1e-12)
+
+    shells = shell_operator(mesh.points, mesh.connectivity, mesh.offsets, mesh.types, [0, 0.5, 1.5])
+    assert volumes.sum(axis=0) == pytest.approx(shells.measures(), rel=1e-12)
+
+def test_detector_operator_slices():
+    mesh = box_mesh(10, 4)
+    values = linear_field(mesh.points)
+    operator = detector_operator(mesh.points, mesh.connectivity, mesh.offsets, mesh.types, [0.3, 0.8], [0, 0.5, 1.5])
+
+    ## Zones per detector: full cross-section, then the shells
+    areas = operator.measures().reshape(2, 3)
+    integrals = operator.apply(values).reshape(2, 3)
+    assert areas[:, 0] == pytest.approx([4.0, 4.0], rel=1e-12)
+    assert areas[:, 1:].sum(axis=1) == pytest.approx([4.0, 4.0], rel=1e-12)
+    assert integrals[:, 0] == pytest.approx([4 * (1 + 3 * 0.3), 4 * (1 + 3 * 0.8)], rel=1e-12)
+
+    flux = detector_operator(mesh.points, mesh.connectivity, mesh.offsets, mesh.types, [0.3], [0, 0.5, 1.5], velocity=np.full(len(values), 2.0))
+    assert flux.measures() == pytest.approx(2 * areas[0], rel=1e-12)
+
+def integrate_attributes(mesh, values):
+    """ Volume and integral of values with vtkIntegrateAttributes, as IntegrateVariables """
+    vtk = pytest.importorskip('vtk')
+    from vtk.util import numpy_support as ns
+
+    grid = vtk.vtkUnstructuredGrid()
+    points = vtk.vtkPoints()
+    points.SetData(ns.numpy_to_vtk(mesh.points, deep=1))
+    grid.SetPoints(points)
+    cells = vtk.vtkCellArray()
+    cells.SetData(ns.numpy_to_vtkIdTypeArray(mesh.offsets.astype(np.int64), deep=1), ns.numpy_to_vtkIdTypeArray(mesh.connectivity.astype(np.int64), deep=1))
+    grid.SetCells(ns.numpy_to_vtk(mesh.types, deep=1), cells)
+    array = ns.numpy_to_vtk(values, deep=1)
+    array.SetName('values')
+    grid.GetPointData().AddArray(array)
+
+    integrator = vtk.vtkIntegrateAttributes()
+    integrator.SetInputData(grid)
+    integrator.Update()
+    output = integrator.GetOutput()
+    return output.GetCellData().GetArray('Volume').GetValue(0), output.GetPointData().GetArray('values').GetValue(0)
+
+def test_volume_operator_matches_integrate_attributes_on_distorted_hexes():
+    """ Non-planar faces: the integrals depend on how the cells are split """
+    rng = np.random.default_rng(1)
+    mesh = box_mesh(4, 3)
+    mesh.points = mesh.points + rng.uniform(-0.08, 0.08, mesh.points.shape)
+    values = rng.random(len(mesh.points))
+
+    operator = volume_operator(mesh)
+    volume, integral = integrate_attributes(mesh, values)
+    assert operator.measures() == pytest.approx([volume], rel=1e-12)
+    assert operator.apply(values) == pytest.approx([integral], rel=1e-12)
+
+@pytest.mark.parametrize('celltype, points', [
+    (VTK_WEDGE, [[0, 0, 0], [1, 0, 0], [0, 1, 0], [0, 0, 1], [1, 0, 1], [0, 1, 1]]),
+    (VTK_PYRAMID, [[0, 0, 0], [1, 0, 0], [1, 1, 0], [0, 1, 0], [0.5, 0.5, 1]]),
+    ])
+def test_volume_operator_matches_integrate_attributes_on_distorted_cells(celltype, points):
+    rng = np.random.default_rng(2)
+    points = np.array(points, dtype=np.float64) + rng.uniform(-0.1, 0.1, (len(points), 3))
+    mesh = Dict(points=points, connectivity=np.arange(len(points)), offsets=np.array([0, len(points)]),
+                types=np.array([celltype], dtype=np.uint8))
+    values = rng.random(len(points))
+
+    operator = volume_operator(mesh)
+    volume, integral = integrate_attributes(mesh, values)
+    assert operator.measures() == pytest.approx([volume], rel=1e-12)
+    assert operator.apply(values) == pytest.approx([integral], rel=1e-12)
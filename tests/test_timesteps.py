@@ -0,0 +1,79 @@
+"""
+Prefetch schedule and partial file warming of TimeSteps.
+"""
+
+import numpy as np
+import pytest
+
+from paravision.timesteps import prefetch_schedule, warm_file
+from paravision.vtkxml import VTKXMLFile, byte_ranges
+
+from test_vtkxml import sample_mesh, write_vtu, write_pvtu
+
+def test_prefetch_schedule():
+    visit = list(range(10))
+    assert prefetch_schedule(visit, 0, 2) == [1, 2]
+    assert prefetch_schedule(visit, 8, 3) == [9]
+    assert prefetch_schedule(visit, 9, 3) == []
+    assert prefetch_schedule(visit, 4, 0) == []
+
+def test_prefetch_schedule_skips_unvisited():
+    ## e.g. worker 1 of 3 of a time partition, with timestep 4 already checkpointed
+    visit = [1, 7, 10, 13]
+    assert prefetch_schedule(visit, 1, 2) == [7, 10]
+    assert prefetch_schedule(visit, 7, 5) == [10, 13]
+    ## A timestep the loop loads from the checkpoint instead of visiting
+    assert prefetch_schedule(visit, 4, 1) == [7]
+
+def covered(ranges, path, start, end):
+    return any( rpath == path and rstart <= start and end <= rend for rpath, rstart, rend in ranges )
+
+def test_byte_ranges_of_selected_arrays(tmp_path):
+    filename = tmp_path / 'mesh.vtu'
+    write_vtu(filename, sample_mesh(n=8), 'raw', compressor='vtkZLibDataCompressor')
+    size = filename.stat().st_size
+
+    ranges = byte_ranges(filename, ['scalar_0'], geometry=False)
+    vtkfile = VTKXMLFile(filename)
+    try:
+        elements = { element.get('Name'): element for element in vtkfile.root.iter('DataArray') }
+        assert covered(ranges, filename, *vtkfile.appended_range(elements['scalar_0']))
+        assert not covered(ranges, filename, *vtkfile.appended_range(elements['velocity']))
+        assert not covered(ranges, filename, *vtkfile.appended_range(elements['Points']))
+        assert covered(ranges, filename, 0, vtkfile.appended_start)
+
+        ranges = byte_ranges(filename, ['scalar_0'])
+        for name in ['Points', 'connectivity', 'offsets', 'types', 'region']:
+            assert covered(ranges, filename, *vtkfile.appended_range(elements[name]))
+    finally:
+        vtkfile.close()
+
+    assert sum( end - start for _, start, end in byte_ranges(filename, ['scalar_0'], geometry=False) ) < size / 2
+    assert byte_ranges(filename, []) != [ (filename, 0, size) ]
+
+@pytest.mark.parametrize('fmt', ['ascii', 'binary'])
+def test_byte_ranges_of_inline_data(tmp_path, fmt):
+    filename = tmp_path / 'mesh.vtu'
+    write_vtu(filename, sample_mesh(), fmt)
+    assert byte_ranges(filename, ['scalar_0'], geometry=False) == [ (filename, 0, filename.stat().st_size) ]
+
+def test_byte_ranges_of_pvtu_pieces(tmp_path):
+    filename = write_pvtu(tmp_path, 'mesh', [ sample_mesh(seed) for seed in range(2) ], fmt='raw')
+    ranges = byte_ranges(filename, ['scalar_0'], geometry=False)
+    assert (filename, 0, filename.stat().st_size) in ranges
+    assert { path.name for path, _, _ in ranges } == { 'mesh.pvtu', 'mesh_0.vtu', 'mesh_1.vtu' }
+
+def test_warm_file(tmp_path, monkeypatch):
+    advised = []
+    monkeypatch.setattr('os.posix_fadvise', lambda fd, offset, length, advice: advised.append((offset, length)), raising=False)
+    monkeypatch.setattr('os.POSIX_FADV_WILLNEED', 3, raising=False)
+
+    filename = tmp_path / 'mesh.vtu'
+    write_vtu(filename, sample_mesh(), 'raw')
+    warm_file(filename, ['scalar_0'], geometry=False)
+    assert advised == [ (start, end - start) for _, start, end in byte_ranges(filename, ['scalar_0'], geometry=False) ]
+
+    advised.clear()
+    (tmp_path / 'mesh.h5').write_bytes(np.arange(100).tobytes())
+    warm_file(tmp_path / 'mesh.h5')
+    assert advised == [ (0, 800) ]
@@ -0,0 +1,240 @@
+"""
+Round trips through the numpy VTK XML reader for every supported encoding.
+
+Files are written by a small encoder here, so the tests need neither ParaView
+nor VTK. If VTK is installed, files from vtkXMLUnstructuredGridWriter are
+checked as well.
+"""
+
+import base64
+import itertools
+import lzma
+import zlib
+
+import numpy as np
+import pytest
+
+from paravision.vtkxml import GeometryCache, SeriesReader, read_vtk_xml, DECOMPRESSORS
+
+from test_shells import box_mesh
+
+COMPRESSORS = {
+        None                   : None,
+        'vtkZLibDataCompressor': zlib.compress,
+        'vtkLZMADataCompressor': lzma.compress,
+        }
+
+VTK_NAMES = { 'f4': 'Float32', 'f8': 'Float64', 'i4': 'Int32', 'i8': 'Int64', 'u1': 'UInt8' }
+
+BLOCK_SIZE = 100 ## Small, so that arrays span several compressed blocks
+
+def sample_mesh(seed=0, n=2):
+    rng = np.random.default_rng(seed)
+    mesh = box_mesh(n, 2)
+    npoints, ncells = len(mesh.points), len(mesh.types)
+    mesh.point_data = {
+            'scalar_0': rng.random(npoints).astype(np.float32),
+            'velocity': rng.random((npoints, 3)),
+            }
+    mesh.cell_data = { 'region': np.arange(ncells, dtype=np.int32) }
+    return mesh
+
+def encode(values, header_dtype, compress):
+    """ Header and (compressed) data bytes of one array """
+    data = values.tobytes()
+    if compress is None:
+        header = np.array([len(data)], dtype=header_dtype).tobytes()
+        return header, data
+
+    blocks = [ data[i:i+BLOCK_SIZE] for i in range(0, len(data), BLOCK_SIZE) ]
+    compressed = [ compress(block) for block in blocks ]
+    header = np.array([len(blocks), BLOCK_SIZE, len(data) % BLOCK_SIZE] + [ len(block) for block in compressed ], dtype=header_dtype).tobytes()
+    return header, b''.join(compressed)
+
+def base64_encoded(header, data, split):
+    ## NOTE: VTK encodes header and data as separate base64 blocks; other writers as one
+    if split:
+        return base64.b64encode(header) + base64.b64encode(data)
+    return base64.b64encode(header + data)
+
+def write_vtu(filename, mesh, fmt, header_type='UInt32', byte_order='LittleEndian', compressor=None, split=True, time=None):
+    """ Write mesh as a .vtu with all arrays in fmt: ascii, binary, raw (appended) or base64 (appended) """
+    endian = '<' if byte_order == 'LittleEndian' else '>'
+    header_dtype = np.dtype(endian + ('u4' if header_type == 'UInt32' else 'u8'))
+    compress = COMPRESSORS[compressor]
+    appended = []
+    offset = 0
+
+    def data_array(name, values, extra=''):
+        nonlocal offset
+        values = np.ascontiguousarray(values)
+        values = values.astype(values.dtype.newbyteorder(endian))
+        ncomponents = values.shape[1] if values.ndim > 1 else 1
+        attributes = f'type="{VTK_NAMES[values.dtype.str[1:]]}" Name="{name}" NumberOfComponents="{ncomponents}"{extra}'
+
+        if fmt == 'ascii':
+            return f'<DataArray {attributes} format="ascii">{" ".join(map(str, values.ravel().tolist()))}</DataArray>'
+
+        header, data = encode(values, header_dtype, compress)
+        if fmt == 'binary':
+            return f'<DataArray {attributes} format="binary">{base64_encoded(header, data, split).decode()}</DataArray>'
+
+        block = header + data if fmt == 'raw' else base64_encoded(header, data, split)
+        element = f'<DataArray {attributes} format="appended" offset="{offset}"/>'
+        appended.append(block)
+        offset += len(block)
+        return element
+
+    field_data = ''
+    if time is not None:
+        field_data = '<FieldData>' + data_array('TimeValue', np.array([time]), extra=' NumberOfTuples="1"') + '</FieldData>'
+
+    piece = ''.join([
+        f'<Piece NumberOfPoints="{len(mesh.points)}" NumberOfCells="{len(mesh.types)}">',
+        '<PointData>', *[ data_array(name, values) for name, values in mesh.point_data.items() ], '</PointData>',
+        '<CellData>', *[ data_array(name, values) for name, values in mesh.cell_data.items() ], '</CellData>',
+        '<Points>', data_array('Points', mesh.points), '</Points>',
+        '<Cells>',
+        data_array('connectivity', mesh.connectivity.astype(np.int64)),
+        data_array('offsets', mesh.offsets[1:].astype(np.int64)),
+        data_array('types', mesh.types.astype(np.uint8)),
+        '</Cells>',
+        '</Piece>',
+        ])
+
+    compressor_attribute = f' compressor="{compressor}"' if compressor else ''
+    text = (f'<?xml version="1.0"?>\n<VTKFile type="UnstructuredGrid" version="1.0" byte_order="{byte_order}" header_type="{header_type}"{compressor_attribute}>'
+            f'<UnstructuredGrid>{field_data}{piece}</UnstructuredGrid>').encode()
+    if appended:
+        encoding = 'raw' if fmt == 'raw' else 'base64'
+        text += f'<AppendedData encoding="{encoding}">_'.encode() + b''.join(appended) + b'</AppendedData>'
+    text += b'</VTKFile>\n'
+
+    with open(filename, 'wb') as f:
+        f.write(text)
+
+def check_mesh(result, mesh):
+    assert np.array_equal(result.points, mesh.points)
+    assert np.array_equal(result.connectivity, mesh.connectivity)
+    assert np.array_equal(result.offsets, mesh.offsets)
+    assert np.array_equal(result.types, mesh.types)
+    for name, values in mesh.point_data.items():
+        assert np.array_equal(result.point_data[name], values)
+    for name, values in mesh.cell_data.items():
+        assert np.array_equal(result.cell_data[name], values)
+
+ENCODINGS = [ ('ascii', 'UInt32', 'LittleEndian', None, True) ] + [
+        (fmt, header_type, byte_order, compressor, split)
+        for fmt, header_type, byte_order, compressor, split in itertools.product(
+            ['binary', 'raw', 'base64'], ['UInt32', 'UInt64'], ['LittleEndian', 'BigEndian'], list(COMPRESSORS), [True, False])
+        if fmt != 'raw' or split
+        ]
+
+@pytest.mark.parametrize('fmt, header_type, byte_order, compressor, split', ENCODINGS)
+def test_vtu_roundtrip(tmp_path, fmt, header_type, byte_order, compressor, split):
+    mesh = sample_mesh()
+    filename = tmp_path / 'mesh.vtu'
+    write_vtu(filename, mesh, fmt, header_type, byte_order, compressor, split, time=2.5)
+
+    result = read_vtk_xml(filename)
+    check_mesh(result, mesh)
+    assert result.field_data.TimeValue == pytest.approx([2.5])
+
+def test_selected_arrays(tmp_path):
+    mesh = sample_mesh()
+    write_vtu(tmp_path / 'mesh.vtu', mesh, 'raw', compressor='vtkZLibDataCompressor')
+
+    result = read_vtk_xml(tmp_path / 'mesh.vtu', point_arrays=['scalar_0'], cell_arrays=[])
+    assert list(result.point_data.keys()) == ['scalar_0']
+    assert not result.cell_data
+
+def write_pvtu(directory, name, pieces, **kwargs):
+    sources = []
+    for index, piece in enumerate(pieces):
+        source = f"{name}_{index}.vtu"
+        write_vtu(directory / source, piece, **kwargs)
+        sources.append(f'<Piece Source="{source}"/>')
+    (directory / f"{name}.pvtu").write_text(
+            '<?xml version="1.0"?>\n<VTKFile type="PUnstructuredGrid" version="1.0" byte_order="LittleEndian" header_type="UInt32">'
+            f'<PUnstructuredGrid GhostLevel="0">{"".join(sources)}</PUnstructuredGrid></VTKFile>\n')
+    return directory / f"{name}.pvtu"
+
+def test_pvtu_merges_pieces(tmp_path):
+    pieces = [ sample_mesh(seed) for seed in range(3) ]
+    result = read_vtk_xml(write_pvtu(tmp_path, 'mesh', pieces, fmt='raw'))
+
+    npoints = len(pieces[0].points)
+    assert np.array_equal(result.points, np.concatenate([ piece.points for piece in pieces ]))
+    assert np.array_equal(result.connectivity, np.concatenate([ piece.connectivity + i * npoints for i, piece in enumerate(pieces) ]))
+    assert np.array_equal(np.diff(result.offsets), np.concatenate([ np.diff(piece.offsets) for piece in pieces ]))
+    assert np.array_equal(result.point_data['velocity'], np.concatenate([ piece.point_data['velocity'] for piece in pieces ]))
+
+@pytest.mark.parametrize('full', [False, True])
+def test_geometry_cache(tmp_path, full):
+    mesh = sample_mesh()
+    files = []
+    for timestep in range(3):
+        mesh.point_data['scalar_0'] = np.full(len(mesh.points), timestep, dtype=np.float32)
+        if timestep == 2:
+            ## Same sizes, moved points: must not reuse the cached geometry
+            mesh.points = mesh.points + 0.5
+        files.append(write_pvtu(tmp_path, f"mesh_{timestep}", [mesh, mesh], fmt='raw', compressor='vtkZLibDataCompressor'))
+
+    reader = SeriesReader(files, full=full)
+    results = list(reader)
+    for timestep, result in enumerate(results):
+        assert result.point_data['scalar_0'] == pytest.approx(np.full(2 * len(mesh.points), timestep))
+    assert reader.geometry.hits == 3 ## Both pieces and the merged mesh of timestep 1
+    assert np.array_equal(results[2].points[:len(mesh.points)], mesh.points)
+
+@pytest.mark.parametrize('full', [False, True])
+def test_geometry_fingerprint_samples(tmp_path, monkeypatch, full):
+    """ Sampled fingerprints miss changes between the samples, full ones don't """
+    monkeypatch.setattr(GeometryCache, 'SAMPLE', 8)
+    mesh = sample_mesh()
+    write_vtu(tmp_path / 'mesh_0.vtu', mesh, 'raw')
+    mesh.points = mesh.points.copy()
+    mesh.points[len(mesh.points) // 4] += 0.5
+    write_vtu(tmp_path / 'mesh_1.vtu', mesh, 'raw')
+
+    reader = SeriesReader([tmp_path / 'mesh_0.vtu', tmp_path / 'mesh_1.vtu'], full=full)
+    list(reader)
+    assert reader.geometry.hits == (0 if full else 1)
+
+VTK_MODES = list(itertools.product(['ascii', 'binary', 'raw', 'base64'], ['UInt32', 'UInt64'], ['none', 'zlib', 'lzma', 'lz4']))
+
+@pytest.mark.parametrize('fmt, header_type, compressor', VTK_MODES)
+def test_vtk_writer_roundtrip(tmp_path, fmt, header_type, compressor):
+    """ Files written by VTK itself """
+    vtk = pytest.importorskip('vtk')
+    from vtk.util import numpy_support as ns
+    if compressor == 'lz4' and 'vtkLZ4DataCompressor' not in DECOMPRESSORS:
+        pytest.skip("lz4 is not installed")
+
+    mesh = sample_mesh(n=8)
+    grid = vtk.vtkUnstructuredGrid()
+    points = vtk.vtkPoints()
+    points.SetData(ns.numpy_to_vtk(mesh.points, deep=1))
+    grid.SetPoints(points)
+    cells = vtk.vtkCellArray()
+    cells.SetData(ns.numpy_to_vtkIdTypeArray(mesh.offsets.astype(np.int64), deep=1), ns.numpy_to_vtkIdTypeArray(mesh.connectivity.astype(np.int64), deep=1))
+    grid.SetCells(ns.numpy_to_vtk(mesh.types, deep=1), cells)
+    for name, values in mesh.point_data.items():
+        array = ns.numpy_to_vtk(values, deep=1)
+        array.SetName(name)
+        grid.GetPointData().AddArray(array)
+    array = ns.numpy_to_vtk(mesh.cell_data['region'], deep=1)
+    array.SetName('region')
+    grid.GetCellData().AddArray(array)
+
+    writer = vtk.vtkXMLUnstructuredGridWriter()
+    writer.SetInputData(grid)
+    writer.SetFileName(str(tmp_path / 'mesh.vtu'))
+    writer.SetDataMode({ 'ascii': 0, 'binary': 1, 'raw': 2, 'base64': 2 }[fmt])
+    writer.SetEncodeAppendedData(fmt == 'base64')
+    writer.SetHeaderType(writer.UInt32 if header_type == 'UInt32' else writer.UInt64)
+    writer.SetCompressorType({ 'none': 0, 'zlib': 1, 'lz4': 2, 'lzma': 3 }[compressor])
+    writer.SetBlockSize(256)
+    writer.Write()
+
+    check_mesh(read_vtk_xml(tmp_path / 'mesh.vtu'), mesh)